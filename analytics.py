@@ -0,0 +1,168 @@
+"""Chart series for the analytics tab, computed with NumPy.
+
+LogColumns turns one log's entries into parallel arrays: the day as a date
+ordinal, the amount, and string fields such as room or category as integer
+codes into a per-field vocabulary. Each chart is then a date-range mask plus
+a bincount, so a year of transactions costs a few array passes instead of a
+filter per day per chart in the browser.
+
+NumPy is optional; without it ``available`` is False and callers fall back
+to computing the charts on the client from /reports.
+"""
+from datetime import date
+
+from reconcile import DEFAULT_EXPENSE_TYPE, net_revenue
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+available = np is not None
+
+# log type -> (amount field, {string field: label for missing values})
+LOG_SPECS = {
+    "cash": ("amount", {"room": "Unknown"}),
+    "online": ("amount", {"room": "Unknown"}),
+    "add_ons": ("price", {"item": "Other"}),
+    "expenses": ("amount", {"category": "Other", "expense_type": DEFAULT_EXPENSE_TYPE}),
+    "renewals": ("amount", {}),
+    "refunds": ("amount", {}),
+}
+
+
+def _ordinal(value):
+    try:
+        return date.fromisoformat(value).toordinal()
+    except (TypeError, ValueError):
+        return -1
+
+
+def _number(value):
+    try:
+        return float(value or 0)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def _plain(value):
+    """JSON-friendly number: ints stay ints"""
+    value = float(value)
+    return int(value) if value.is_integer() else round(value, 2)
+
+
+class LogColumns:
+    def __init__(self, entries, amount_field="amount", code_fields=None):
+        count = len(entries)
+        self.day = np.fromiter((_ordinal(entry.get("date")) for entry in entries), dtype=np.int32, count=count)
+        self.amount = np.fromiter((_number(entry.get(amount_field)) for entry in entries),
+                                  dtype=np.float64, count=count)
+        self.codes = {}
+        self.labels = {}
+        for field, missing in (code_fields or {}).items():
+            vocabulary = {}
+            self.codes[field] = np.fromiter(
+                (vocabulary.setdefault(str(entry.get(field) or missing), len(vocabulary)) for entry in entries),
+                dtype=np.int32, count=count)
+            self.labels[field] = list(vocabulary)
+
+    def __len__(self):
+        return len(self.day)
+
+    def mask(self, start, end):
+        """Entries with start <= day < end (date ordinals)"""
+        return (self.day >= start) & (self.day < end)
+
+    def total(self, mask):
+        return float(self.amount[mask].sum())
+
+    def daily(self, mask, start, days):
+        """(sum, count) per day for the days in [start, start + days)"""
+        offsets = self.day[mask] - start
+        return (np.bincount(offsets, weights=self.amount[mask], minlength=days),
+                np.bincount(offsets, minlength=days))
+
+    def by(self, field, mask):
+        """{label: sum} over the entries in mask that have that label"""
+        codes = self.codes[field][mask]
+        labels = self.labels[field]
+        sums = np.bincount(codes, weights=self.amount[mask], minlength=len(labels))
+        present = np.bincount(codes, minlength=len(labels)) > 0
+        return {labels[code]: float(sums[code]) for code in np.flatnonzero(present)}
+
+
+def build_columns(logs):
+    """{log type: LogColumns} from {log type: [entry, ...]}"""
+    return {log_type: LogColumns(logs.get(log_type, []), amount_field, code_fields)
+            for log_type, (amount_field, code_fields) in LOG_SPECS.items()}
+
+
+def _top(sums, limit):
+    ranked = sorted(sums.items(), key=lambda item: item[1], reverse=True)[:limit]
+    return [label for label, _ in ranked], [_plain(value) for _, value in ranked]
+
+
+def chart_series(columns, start, end, checkins=0):
+    """Every chart and summary card on the analytics tab for start..end inclusive"""
+    lo, hi = start.toordinal(), end.toordinal() + 1
+    days = hi - lo
+    masks = {log_type: column.mask(lo, hi) for log_type, column in columns.items()}
+    cash, online, add_ons, expenses = (columns[t] for t in ("cash", "online", "add_ons", "expenses"))
+
+    cash_daily, cash_count = cash.daily(masks["cash"], lo, days)
+    online_daily, online_count = online.daily(masks["online"], lo, days)
+    expense_daily, expense_count = expenses.daily(masks["expenses"], lo, days)
+
+    # Only days that have entries get a point, as the client-side charts did
+    revenue_days = np.flatnonzero((cash_count + online_count) > 0)
+    revenue_expense_days = np.flatnonzero((cash_count + online_count + expense_count) > 0)
+
+    def day_labels(offsets):
+        return [date.fromordinal(lo + int(offset)).strftime("%d/%m") for offset in offsets]
+
+    room_revenue = cash.by("room", masks["cash"])
+    for room, amount in online.by("room", masks["online"]).items():
+        room_revenue[room] = room_revenue.get(room, 0.0) + amount
+    top_rooms, top_room_values = _top(room_revenue, 10)
+
+    categories, category_values = _top(expenses.by("category", masks["expenses"]), len(expenses.labels["category"]))
+    services, service_values = _top(add_ons.by("item", masks["add_ons"]), 8)
+    expense_types = expenses.by("expense_type", masks["expenses"])
+
+    cash_total = cash.total(masks["cash"])
+    online_total = online.total(masks["online"])
+    expense_total = expenses.total(masks["expenses"])
+    refund_total = columns["refunds"].total(masks["refunds"])
+    transaction_expense_total = expense_types.get("transaction", 0)
+    return {
+        "summary": {
+            "cash_total": _plain(cash_total),
+            "online_total": _plain(online_total),
+            "total_income": _plain(cash_total + online_total),
+            "expense_total": _plain(expense_total),
+            "transaction_expense_total": _plain(transaction_expense_total),
+            "report_expense_total": _plain(expense_types.get("report", 0)),
+            "refund_total": _plain(refund_total),
+            "net_revenue": _plain(net_revenue(cash_total, online_total, refund_total, transaction_expense_total)),
+            "expense_categories": len(categories),
+            "checkins": checkins,
+            "renewals": int(masks["renewals"].sum()),
+        },
+        "revenue_expense": {
+            "labels": day_labels(revenue_expense_days),
+            "revenue": [_plain(v) for v in (cash_daily + online_daily)[revenue_expense_days]],
+            "expenses": [_plain(v) for v in expense_daily[revenue_expense_days]],
+        },
+        "daily_revenue": {
+            "labels": day_labels(revenue_days),
+            "cash": [_plain(v) for v in cash_daily[revenue_days]],
+            "online": [_plain(v) for v in online_daily[revenue_days]],
+        },
+        "top_rooms": {"labels": [f"Room {room}" for room in top_rooms], "values": top_room_values},
+        "payment_methods": {"labels": ["Cash", "Online"], "values": [_plain(cash_total), _plain(online_total)]},
+        "expense_categories": {
+            "labels": [label[:1].upper() + label[1:] for label in categories],
+            "values": category_values,
+        },
+        "top_services": {"labels": services, "values": service_values},
+    }
@@ -1,113 +1,887 @@
-from flask import Flask, render_template, request, jsonify, send_from_directory
+from flask import Flask, render_template, request, jsonify, send_from_directory, redirect, Response
+from flask.json.provider import DefaultJSONProvider
 from datetime import datetime, timedelta
 import json
+import io
 import os
 import logging
+import logging.handlers
+import queue
+import random
+import atexit
+import copy
 import uuid
-import firebase_admin
-from firebase_admin import credentials, firestore, storage
+import importlib
 from werkzeug.utils import secure_filename
-import tempfile
 import pytz
 import base64
+import hashlib
+import hmac
+import gzip
 from functools import wraps
+from collections import OrderedDict
 import threading
+import contextvars
+import sys
 import gc
 from concurrent.futures import ThreadPoolExecutor, TimeoutError
 import time
+import tempfile
+from cache import MemoCache
+from mirror import SnapshotMirror
+from models import Record, Room, Booking, Settlement, log_entries
+import exports
+from guests import GuestIndex, guest_key
+from renewals import RenewalIndex
+import reconcile
+import tenants
+import coherence
+from coalescer import WriteCoalescer, last_commit_time
+import journal
 
 # Memory optimization
 os.environ['PYTHONHASHSEED'] = '0'
 os.environ['GRPC_ENABLE_FORK_SUPPORT'] = '1'
 gc.set_threshold(400, 5, 5)
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[logging.FileHandler("lodge.log"), logging.StreamHandler()]
+# Per-request stats (see RequestStats); executor tasks inherit it through copy_context
+_request_stats = contextvars.ContextVar("request_stats", default=None)
+
+# Configure logging - request threads only enqueue records; a listener thread
+# formats them as JSON and does the file/stderr I/O
+LOG_FILE = os.environ.get('LOG_FILE', 'lodge.log')
+LOG_MAX_BYTES = int(os.environ.get('LOG_MAX_MB', 5)) * 1024 * 1024
+LOG_BACKUP_COUNT = 3
+# Fraction of INFO (and DEBUG) records kept per route; WARNING and above are never dropped
+LOG_SAMPLE_RATES = {
+    "/get_rooms_only": 0.1,
+    "/get_totals_only": 0.1,
+    "/get_logs_only": 0.1,
+    "/get_data": 0.2,
+    "/get_room_numbers": 0.1,
+    "/quick_health": 0.0,
+    "/health": 0.0,
+    "/ready": 0.0,
+    "/metrics": 0.0,
+}
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line with any extra= fields included"""
+    RESERVED = set(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
+
+    def format(self, record):
+        entry = {
+            "ts": datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in self.RESERVED and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+class RouteSamplingFilter(logging.Filter):
+    """Tag records with the current route and sample INFO logs per route"""
+    def filter(self, record):
+        stats = _request_stats.get()
+        record.route = stats.route if stats is not None else None
+        if record.levelno >= logging.WARNING or record.route is None:
+            return True
+        rate = LOG_SAMPLE_RATES.get(record.route, 1.0)
+        return rate >= 1.0 or random.random() < rate
+
+class LogQueueHandler(logging.handlers.QueueHandler):
+    """Enqueue a picklable copy of the record with its message and traceback rendered"""
+    def prepare(self, record):
+        exc_text = record.exc_text
+        if record.exc_info and not exc_text:
+            exc_text = logging.Formatter().formatException(record.exc_info)
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        record.exc_info = None
+        record.exc_text = exc_text
+        return record
+
+def _start_log_listener():
+    """(Re)create the log queue and its listener thread for this process"""
+    global _log_listener
+    _queue_handler.queue = queue.SimpleQueue()
+    _log_listener = logging.handlers.QueueListener(
+        _queue_handler.queue, *_log_handlers, respect_handler_level=True
+    )
+    _log_listener.start()
+
+_file_handler = logging.handlers.RotatingFileHandler(
+    LOG_FILE, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT, encoding='utf-8', delay=True
 )
+_file_handler.setFormatter(JsonFormatter())
+_stream_handler = logging.StreamHandler()
+_stream_handler.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+_log_handlers = (_file_handler, _stream_handler)
+
+_queue_handler = LogQueueHandler(queue.SimpleQueue())
+_queue_handler.addFilter(RouteSamplingFilter())
+_log_listener = None
+logging.basicConfig(level=logging.INFO, handlers=[_queue_handler])
+_start_log_listener()
+# gunicorn forks after importing the app; the child needs its own listener thread
+os.register_at_fork(after_in_child=_start_log_listener)
+atexit.register(lambda: _log_listener.stop())
 logger = logging.getLogger(__name__)
 
-app = Flask(__name__, static_folder='static')
+# Static files are served by serve_static (fingerprinted, precompressed)
+STATIC_FOLDER = 'static'
+app = Flask(__name__, static_folder=None)
 
 # Initialize Indian Timezone
 IST = pytz.timezone('Asia/Kolkata')
 
+# Request instrumentation - Prometheus metrics and an opt-in sampling profiler
+class Histogram:
+    """Cumulative-bucket histogram rendered in Prometheus text format"""
+    def __init__(self, name, description, labelnames, buckets):
+        self.name = name
+        self.description = description
+        self.labelnames = labelnames
+        self.buckets = buckets
+        self._series = {}  # label values -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = sorted(self._series.items())
+        for labels, series in items:
+            label_str = ",".join(f'{k}="{v}"' for k, v in zip(self.labelnames, labels))
+            prefix = f"{label_str}," if label_str else ""
+            for bound, count in zip(self.buckets, series):
+                lines.append(f'{self.name}_bucket{{{prefix}le="{bound}"}} {count}')
+            lines.append(f'{self.name}_bucket{{{prefix}le="+Inf"}} {series[-1]}')
+            lines.append(f"{self.name}_sum{{{label_str}}} {series[-2]:.6f}")
+            lines.append(f"{self.name}_count{{{label_str}}} {series[-1]}")
+        return lines
+
+class Counter:
+    """Monotonic counter rendered in Prometheus text format"""
+    def __init__(self, name, description, labelnames):
+        self.name = name
+        self.description = description
+        self.labelnames = labelnames
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for labels, value in items:
+            label_str = ",".join(f'{k}="{v}"' for k, v in zip(self.labelnames, labels))
+            lines.append(f"{self.name}{{{label_str}}} {value}")
+        return lines
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50)
+
+METRICS = {
+    "request": Histogram("lodge_request_duration_seconds", "Wall time per request",
+                         ("route", "method", "status"), LATENCY_BUCKETS),
+    "request_rpcs": Histogram("lodge_request_firestore_rpcs", "Firestore RPCs issued per request",
+                              ("route",), COUNT_BUCKETS),
+    "request_rpc_time": Histogram("lodge_request_firestore_seconds", "Time spent in Firestore RPCs per request",
+                                  ("route",), LATENCY_BUCKETS),
+    "rpc": Histogram("lodge_firestore_rpc_duration_seconds", "Firestore RPC latency",
+                     ("rpc",), LATENCY_BUCKETS),
+    "json_encode": Histogram("lodge_json_encode_seconds", "JSON response encode time",
+                             ("route",), (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5)),
+    "cache": Counter("lodge_cache_requests_total", "Read cache lookups", ("function", "result")),
+    "profiles": Counter("lodge_profiles_written_total", "Slow-request profiles dumped", ("route",)),
+    "breaker": Counter("lodge_circuit_breaker_transitions_total", "Circuit breaker state changes",
+                       ("breaker", "state")),
+    "mirror_lag": Histogram("lodge_mirror_lag_seconds", "Delay from a listener snapshot's read time to its delivery",
+                            ("mirror",), LATENCY_BUCKETS),
+}
+
+class RequestStats:
+    __slots__ = ("route", "rpc_count", "rpc_seconds", "cache_hits", "cache_misses", "json_seconds", "lock")
+
+    def __init__(self, route):
+        self.route = route
+        self.rpc_count = 0
+        self.rpc_seconds = 0.0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.json_seconds = 0.0
+        self.lock = threading.Lock()
+
+def record_rpc(rpc, elapsed):
+    METRICS["rpc"].observe(elapsed, rpc)
+    stats = _request_stats.get()
+    if stats is not None:
+        with stats.lock:
+            stats.rpc_count += 1
+            stats.rpc_seconds += elapsed
+
+def record_cache(function, result):
+    """result is hit, stale, miss or coalesced (waited on another caller's load)"""
+    METRICS["cache"].inc(function, result)
+    stats = _request_stats.get()
+    if stats is not None:
+        with stats.lock:
+            if result == "miss":
+                stats.cache_misses += 1
+            else:
+                stats.cache_hits += 1
+
+def record_json_encode(elapsed):
+    stats = _request_stats.get()
+    route = stats.route if stats is not None else "none"
+    METRICS["json_encode"].observe(elapsed, route)
+    if stats is not None:
+        stats.json_seconds += elapsed
+
+class ContextThreadPoolExecutor(ThreadPoolExecutor):
+    """ThreadPoolExecutor whose tasks run in the submitter's context"""
+    def submit(self, fn, *args, **kwargs):
+        return super().submit(contextvars.copy_context().run, fn, *args, **kwargs)
+
+# Firestore client methods that map 1:1 to RPCs
+FIRESTORE_RPCS = ("batch_get_documents", "run_query", "commit", "begin_transaction", "rollback",
+                  "list_documents", "list_collection_ids", "run_aggregation_query", "batch_write")
+
+def _timed_stream(rpc, iterator, start_time):
+    """Streaming RPCs are timed until the stream is exhausted"""
+    try:
+        yield from iterator
+    finally:
+        record_rpc(rpc, time.perf_counter() - start_time)
+
+def _instrument_rpc(rpc, method):
+    @wraps(method)
+    def wrapper(*args, **kwargs):
+        start_time = time.perf_counter()
+        try:
+            result = method(*args, **kwargs)
+        except Exception:
+            record_rpc(rpc, time.perf_counter() - start_time)
+            raise
+        if rpc in ("batch_get_documents", "run_query", "run_aggregation_query"):
+            return _timed_stream(rpc, result, start_time)
+        record_rpc(rpc, time.perf_counter() - start_time)
+        return result
+    return wrapper
+
+def instrument_firestore(client):
+    """Wrap the client's generated API so every RPC is counted and timed"""
+    api = client._firestore_api
+    for rpc in FIRESTORE_RPCS:
+        if hasattr(api, rpc):
+            setattr(api, rpc, _instrument_rpc(rpc, getattr(api, rpc)))
+    return client
+
+# Sampling profiler, enabled per request with the X-Lodge-Profile header set to
+# PROFILE_TOKEN; without a configured token nobody can turn it on
+PROFILE_HEADER = 'X-Lodge-Profile'
+PROFILE_TOKEN = os.environ.get('PROFILE_TOKEN')
+# /metrics wants "Authorization: Bearer <METRICS_TOKEN>" and is off when it is unset
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+
+def token_matches(supplied, expected):
+    """Constant-time check of a supplied secret; never matches when none is configured"""
+    return bool(supplied) and bool(expected) and hmac.compare_digest(supplied.encode(), expected.encode())
+PROFILE_INTERVAL = 0.005
+PROFILE_SLOW_SECONDS = float(os.environ.get('PROFILE_SLOW_SECONDS', 0.5))
+PROFILE_DIR = os.environ.get('PROFILE_DIR', os.path.join('profiles', 'requests'))
+
+class StackSampler:
+    """Samples one thread's stack into collapsed (flamegraph.pl) format"""
+    def __init__(self, thread_id):
+        self.thread_id = thread_id
+        self.samples = {}
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(PROFILE_INTERVAL):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                frame = frame.f_back
+            if stack:
+                key = ";".join(reversed(stack))
+                self.samples[key] = self.samples.get(key, 0) + 1
+
+    def dump(self, route):
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        safe_route = route.strip("/").replace("/", "_").replace("<", "").replace(">", "") or "index"
+        path = os.path.join(PROFILE_DIR, f"{datetime.now(IST).strftime('%Y%m%d-%H%M%S')}-{safe_route}.folded")
+        with open(path, "w") as f:
+            for stack, count in sorted(self.samples.items()):
+                f.write(f"{stack} {count}\n")
+        return path
+
+@app.before_request
+def start_request_metrics():
+    route = request.url_rule.rule if request.url_rule else "unmatched"
+    request.environ["lodge.start_time"] = time.perf_counter()
+    request.environ["lodge.stats_token"] = _request_stats.set(RequestStats(route))
+    profile = request.headers.get(PROFILE_HEADER)
+    if token_matches(profile, PROFILE_TOKEN):
+        request.environ["lodge.sampler"] = StackSampler(threading.get_ident()).start()
+
+@app.after_request
+def finish_request_metrics(response):
+    stats = _request_stats.get()
+    start_time = request.environ.get("lodge.start_time")
+    if stats is None or start_time is None:
+        return response
+    elapsed = time.perf_counter() - start_time
+    METRICS["request"].observe(elapsed, stats.route, request.method, str(response.status_code))
+    METRICS["request_rpcs"].observe(stats.rpc_count, stats.route)
+    METRICS["request_rpc_time"].observe(stats.rpc_seconds, stats.route)
+    response.headers['Server-Timing'] = (
+        f"app;dur={elapsed * 1000:.1f}, firestore;dur={stats.rpc_seconds * 1000:.1f};desc=\"{stats.rpc_count} rpcs\", "
+        f"json;dur={stats.json_seconds * 1000:.1f}, cache;desc=\"{stats.cache_hits} hit {stats.cache_misses} miss\""
+    )
+    
+    sampler = request.environ.pop("lodge.sampler", None)
+    if sampler:
+        sampler.stop()
+        if elapsed >= PROFILE_SLOW_SECONDS:
+            path = sampler.dump(stats.route)
+            METRICS["profiles"].inc(stats.route)
+            response.headers['X-Lodge-Profile-File'] = path
+            logger.info(f"Profile for slow request {stats.route} ({elapsed:.2f}s) written to {path}")
+    return response
+
+@app.teardown_request
+def reset_request_metrics(exc):
+    sampler = request.environ.pop("lodge.sampler", None)
+    if sampler:
+        sampler.stop()
+    token = request.environ.pop("lodge.stats_token", None)
+    if token is not None:
+        _request_stats.reset(token)
+
+@app.route("/metrics")
+def metrics():
+    """Prometheus text exposition of request, Firestore, cache and JSON metrics"""
+    if METRICS_TOKEN is None:
+        return jsonify(success=False, message="Metrics are disabled"), 404
+    scheme, _, supplied = request.headers.get('Authorization', '').partition(' ')
+    if scheme.lower() != 'bearer' or not token_matches(supplied, METRICS_TOKEN):
+        return jsonify(success=False, message="Unauthorized"), 401
+    lines = []
+    for metric in METRICS.values():
+        lines.extend(metric.render())
+    return app.response_class("\n".join(lines) + "\n", mimetype="text/plain; version=0.0.4")
+
 # Global cache for frequently accessed data
-_cache = {}
-_cache_lock = threading.Lock()
 CACHE_TTL = 3
 CACHE_MAX_SIZE = 50
 
-# Thread pool for parallel Firebase queries
-executor = ThreadPoolExecutor(max_workers=3)
+# Thread pool for parallel Firebase queries, one per property
+TENANT_EXECUTOR_WORKERS = int(os.environ.get('TENANT_EXECUTOR_WORKERS', 3))
+executor = tenants.PerTenant(lambda tenant: ContextThreadPoolExecutor(max_workers=TENANT_EXECUTOR_WORKERS), "executor")
+
+# Lazy SDK objects - nothing heavy is imported or connected until first use
+class LazyProxy:
+    """Create the wrapped object on first attribute access"""
+    def __init__(self, factory, name):
+        self._factory = factory
+        self._name = name
+        self._target = None
+        self._lock = threading.Lock()
+
+    def _resolve(self):
+        if self._target is None:
+            with self._lock:
+                if self._target is None:
+                    start_time = time.time()
+                    self._target = self._factory()
+                    logger.info(f"Initialized {self._name} in {time.time() - start_time:.2f}s")
+        return self._target
+
+    @property
+    def ready(self):
+        return self._target is not None
+
+    def __getattr__(self, name):
+        return getattr(self._resolve(), name)
+
+_firebase_app = None
+_firebase_lock = threading.Lock()
+_firebase_error = None
+
+def get_firebase_app():
+    """Initialize Firebase Admin SDK on first use"""
+    global _firebase_app, _firebase_error
+    if _firebase_app is not None:
+        return _firebase_app
+    with _firebase_lock:
+        if _firebase_app is not None:
+            return _firebase_app
+        try:
+            import firebase_admin
+            from firebase_admin import credentials
+            if 'FIREBASE_CREDENTIALS' in os.environ:
+                cred_json = base64.b64decode(os.environ.get('FIREBASE_CREDENTIALS')).decode('utf-8')
+                cred_dict = json.loads(cred_json)
+                cred = credentials.Certificate(cred_dict)
+                storage_bucket = os.environ.get('FIREBASE_STORAGE_BUCKET', 'your-project-id.appspot.com')
+                _firebase_app = firebase_admin.initialize_app(cred, {'storageBucket': storage_bucket})
+            else:
+                cred = credentials.Certificate('service-account.json')
+                _firebase_app = firebase_admin.initialize_app(cred, {'storageBucket': 'your-project-id.appspot.com'})
+            _firebase_error = None
+            logger.info("Firebase initialized successfully")
+        except Exception as e:
+            _firebase_error = str(e)
+            logger.error(f"Error initializing Firebase: {str(e)}")
+            raise
+    return _firebase_app
+
+def _create_firestore_client():
+    get_firebase_app()
+    return instrument_firestore(firestore.client())
+
+def _create_storage_bucket():
+    get_firebase_app()
+    return importlib.import_module('firebase_admin.storage').bucket()
+
+firestore = LazyProxy(lambda: importlib.import_module('firebase_admin.firestore'), "firestore SDK")
+db = LazyProxy(_create_firestore_client, "Firestore client")
+bucket = LazyProxy(_create_storage_bucket, "Storage bucket")
+# NumPy is only imported the first time someone opens the analytics tab
+analytics = LazyProxy(lambda: importlib.import_module('analytics'), "analytics module")
+
+# Properties: every collection below is partitioned per property (see tenants.py).
+# The default property keeps the top-level collections, so a single-lodge
+# deployment reads and writes exactly what it did before; any other property
+# lives under properties/<id>. PROPERTIES lists the ids this deployment serves.
+PROPERTIES = {tenants.DEFAULT_TENANT} | {
+    tenant.strip() for tenant in os.environ.get('PROPERTIES', '').split(',') if tenants.valid_tenant(tenant.strip())
+}
+PROPERTY_HEADER = 'X-Property'
+PROPERTY_COOKIE = 'property'
+PROPERTY_COOKIE_MAX_AGE = 365 * 24 * 3600
+
+def tenant_collection(tenant, name):
+    if tenant == tenants.DEFAULT_TENANT:
+        return db.collection(name)
+    return db.collection('properties').document(tenant).collection(name)
+
+def collection_ref(name):
+    return tenants.PerTenant(lambda tenant: tenant_collection(tenant, name), f"{name} collection")
+
+def requested_property():
+    """Property for this request: X-Property header, ?property=, the property cookie, else the default"""
+    return (request.headers.get(PROPERTY_HEADER) or request.args.get("property")
+            or request.cookies.get(PROPERTY_COOKIE) or tenants.DEFAULT_TENANT)
+
+@app.before_request
+def select_property():
+    tenant = requested_property()
+    if tenant not in PROPERTIES:
+        if request.headers.get(PROPERTY_HEADER) or request.args.get("property"):
+            return jsonify(success=False, message=f"Unknown property: {tenant}"), 404
+        # Only the cookie names it, e.g. a property since removed from PROPERTIES
+        logger.warning(f"Property cookie names unknown property {tenant}; using {tenants.DEFAULT_TENANT}")
+        request.environ["lodge.clear_property_cookie"] = True
+        tenant = tenants.DEFAULT_TENANT
+    request.environ["lodge.tenant_token"] = tenants.activate(tenant)
+
+@app.after_request
+def remember_property(response):
+    """Opening /?property=<id> keeps the browser on that property for its API calls"""
+    tenant = request.args.get("property")
+    if tenant in PROPERTIES and request.cookies.get(PROPERTY_COOKIE) != tenant:
+        response.set_cookie(PROPERTY_COOKIE, tenant, max_age=PROPERTY_COOKIE_MAX_AGE, samesite="Lax")
+    elif request.environ.get("lodge.clear_property_cookie"):
+        response.delete_cookie(PROPERTY_COOKIE, samesite="Lax")
+    return response
+
+@app.teardown_request
+def reset_property(exc):
+    token = request.environ.pop("lodge.tenant_token", None)
+    if token is not None:
+        tenants.deactivate(token)
+
+# Define Firestore collection references
+rooms_ref = collection_ref('rooms')
+logs_ref = collection_ref('logs')
+totals_ref = collection_ref('totals')
+bookings_ref = collection_ref('bookings')
+settings_ref = collection_ref('settings')
+settlements_ref = collection_ref('settlements')
+counters_ref = collection_ref('daily_counters')
+metadata_ref = collection_ref('transaction_metadata')
+expenses_ref = collection_ref('expenses')
+expense_summaries_ref = collection_ref('expense_summaries')
+guests_ref = collection_ref('guests')
+totals_checkpoints_ref = collection_ref('totals_checkpoints')
 
-# Initialize Firebase Admin SDK with optimizations
 try:
-    if 'FIREBASE_CREDENTIALS' in os.environ:
-        cred_json = base64.b64decode(os.environ.get('FIREBASE_CREDENTIALS')).decode('utf-8')
-        cred_dict = json.loads(cred_json)
-        cred = credentials.Certificate(cred_dict)
-        storage_bucket = os.environ.get('FIREBASE_STORAGE_BUCKET', 'your-project-id.appspot.com')
-        firebase_admin.initialize_app(cred, {'storageBucket': storage_bucket})
-    else:
-        cred = credentials.Certificate('service-account.json')
-        firebase_admin.initialize_app(cred, {'storageBucket': 'your-project-id.appspot.com'})
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+class TimedJSONProvider(DefaultJSONProvider):
+    """Default Flask JSON provider that records response encode time"""
+    @staticmethod
+    def default(o):
+        if isinstance(o, Record):
+            return o.to_dict()
+        return DefaultJSONProvider.default(o)
+
+    def response(self, *args, **kwargs):
+        start_time = time.perf_counter()
+        response = self._encode_response(args, kwargs)
+        record_json_encode(time.perf_counter() - start_time)
+        return response
+
+    def _encode_response(self, args, kwargs):
+        return super().response(*args, **kwargs)
+
+class OrjsonProvider(TimedJSONProvider):
+    """Flask JSON provider backed by orjson (UTF-8 bytes, no key sorting)"""
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, default=self.default, option=orjson.OPT_NON_STR_KEYS).decode('utf-8')
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def _encode_response(self, args, kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        data = orjson.dumps(obj, default=self.default, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_APPEND_NEWLINE)
+        return self._app.response_class(data, mimetype=self.mimetype)
+
+app.json = OrjsonProvider(app) if orjson else TimedJSONProvider(app)
+
+# Compress JSON responses larger than this many bytes
+COMPRESS_MIN_BYTES = 1024
+COMPRESS_MIMETYPES = ('application/json',)
+
+@app.after_request
+def compress_response(response):
+    """Negotiated brotli/gzip compression for large JSON responses"""
+    if (response.status_code < 200 or response.status_code >= 300
+            or response.direct_passthrough
+            or response.is_streamed
+            or response.mimetype not in COMPRESS_MIMETYPES
+            or 'Content-Encoding' in response.headers):
+        return response
+    
+    data = response.get_data()
+    if len(data) < COMPRESS_MIN_BYTES:
+        return response
     
-    db = firestore.client()
-    bucket = storage.bucket()
-    logger.info("Firebase initialized successfully")
-except Exception as e:
-    logger.error(f"Error initializing Firebase: {str(e)}")
-    raise
+    accepted = request.accept_encodings
+    if brotli and 'br' in accepted:
+        response.set_data(brotli.compress(data, quality=4))
+        response.headers['Content-Encoding'] = 'br'
+    elif 'gzip' in accepted:
+        response.set_data(gzip.compress(data, compresslevel=6))
+        response.headers['Content-Encoding'] = 'gzip'
+    else:
+        return response
+    response.vary.add('Accept-Encoding')
+    return response
 
-# Define Firestore collection references
-rooms_ref = db.collection('rooms')
-logs_ref = db.collection('logs')
-totals_ref = db.collection('totals')
-bookings_ref = db.collection('bookings')
-settings_ref = db.collection('settings')
-settlements_ref = db.collection('settlements')
-counters_ref = db.collection('daily_counters')
-metadata_ref = db.collection('transaction_metadata')
+def to_columnar(entries):
+    """Convert a list of log dicts to {"columns": [...], "rows": [[...]]}
+
+    Keys missing from an entry come back as null in its row.
+    """
+    columns = []
+    seen = set()
+    for entry in entries:
+        for key in entry:
+            if key not in seen:
+                seen.add(key)
+                columns.append(key)
+    return {"columns": columns, "rows": [[entry.get(column) for column in columns] for entry in entries]}
+
+def shape_logs(logs_dict):
+    """Apply the ?shape=columnar request option to a dict of log lists"""
+    if request.args.get("shape") != "columnar":
+        return logs_dict
+    return {log_type: to_columnar(entries) for log_type, entries in logs_dict.items()}
+
+# Static asset pipeline
+ASSET_EXTENSIONS = ('.js', '.css')
+ASSET_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+ASSET_MIMETYPES = {'.js': 'application/javascript', '.css': 'text/css'}
+
+class AssetManifest:
+    """Content-hashed file names and precompressed variants for static JS/CSS"""
+    def __init__(self, folder):
+        self.folder = folder
+        self._assets = None  # name -> {"hashed": ..., "etag": ...}
+        self._by_hashed = {}
+        self._variants = {}  # (name, encoding) -> compressed bytes
+        self._precompressed = False
+        self._lock = threading.Lock()
+        self.encodings = ('br', 'gzip') if brotli else ('gzip',)
+
+    @property
+    def assets(self):
+        if self._assets is None:
+            with self._lock:
+                if self._assets is None:
+                    self._build()
+        return self._assets
+
+    def _build(self):
+        assets, by_hashed = {}, {}
+        for name in sorted(os.listdir(self.folder)):
+            stem, ext = os.path.splitext(name)
+            if ext not in ASSET_EXTENSIONS:
+                continue
+            with open(os.path.join(self.folder, name), 'rb') as f:
+                digest = hashlib.md5(f.read()).hexdigest()[:10]
+            hashed = f"{stem}.{digest}{ext}"
+            assets[name] = {"hashed": hashed, "etag": digest}
+            by_hashed[hashed] = name
+        self._by_hashed = by_hashed
+        self._assets = assets
+        logger.info(f"Asset manifest built for {len(assets)} files")
+
+    def url(self, name):
+        """Fingerprinted URL for a static file (falls back to the plain path)"""
+        asset = self.assets.get(name)
+        return f"/static/{asset['hashed'] if asset else name}"
+
+    def resolve(self, hashed_name):
+        """Original file name for a fingerprinted name, or None"""
+        if not self.assets:
+            return None
+        return self._by_hashed.get(hashed_name)
+
+    def variant(self, name, encoding):
+        """Compressed bytes of a static file, built once per encoding"""
+        key = (name, encoding)
+        data = self._variants.get(key)
+        if data is None:
+            with open(os.path.join(self.folder, name), 'rb') as f:
+                raw = f.read()
+            if encoding == 'br':
+                data = brotli.compress(raw, quality=11)
+            else:
+                data = gzip.compress(raw, compresslevel=9, mtime=0)
+            self._variants[key] = data
+        return data
+
+    def precompress(self):
+        """Build every compressed variant up front (run in the background)"""
+        if self._precompressed:
+            return
+        self._precompressed = True
+        try:
+            start_time = time.time()
+            for name in self.assets:
+                for encoding in self.encodings:
+                    self.variant(name, encoding)
+            raw_size = sum(os.path.getsize(os.path.join(self.folder, n)) for n in self.assets)
+            compressed_size = sum(len(v) for (_, e), v in self._variants.items() if e == self.encodings[0])
+            logger.info(f"Precompressed static assets {raw_size // 1024} KB -> {compressed_size // 1024} KB "
+                        f"({self.encodings[0]}) in {time.time() - start_time:.2f}s")
+        except Exception as e:
+            self._precompressed = False
+            logger.error(f"Error precompressing static assets: {str(e)}")
+
+asset_manifest = AssetManifest(STATIC_FOLDER)
+app.jinja_env.globals['asset_url'] = asset_manifest.url
 
 # Upload folder
 UPLOAD_FOLDER = 'uploads'
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
+app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024
 
-# Cache decorator
-def cached(ttl=CACHE_TTL):
+# Guest photo processing
+PHOTO_MAX_DIMENSION = 1280
+PHOTO_THUMB_DIMENSION = 320
+PHOTO_TARGET_BYTES = 200 * 1024
+PHOTO_FORMAT = os.environ.get('PHOTO_FORMAT', 'JPEG').upper()
+PHOTO_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+# Resized guest photo derivatives cached on local disk
+PHOTO_WIDTHS = (64, 128, 320, 640, 1280)
+PHOTO_CACHE_DIR = os.path.join(UPLOAD_FOLDER, 'derivatives')
+PHOTO_CACHE_MAX_BYTES = int(os.environ.get('PHOTO_CACHE_MAX_MB', 64)) * 1024 * 1024
+
+# Background uploads to Storage - keeps the request thread off the network.
+# A photo stays on local disk until Storage has it; failed uploads are retried
+# with backoff, and files left by an earlier process are queued again at startup.
+upload_executor = tenants.PerTenant(lambda tenant: ContextThreadPoolExecutor(max_workers=2), "upload executor")
+PHOTO_PENDING_DIR = os.path.join(UPLOAD_FOLDER, 'pending')
+PHOTO_UPLOAD_MAX_BACKOFF = 300
+_pending_uploads = tenants.PerTenant(lambda tenant: {}, "pending uploads")
+_pending_uploads_lock = threading.Lock()
+
+def property_upload_dir(directory, tenant=None):
+    """Local photo directory for a property, laid out like its Firestore collections"""
+    tenant = tenant or tenants.current_tenant()
+    if tenant == tenants.DEFAULT_TENANT:
+        return directory
+    return os.path.join(UPLOAD_FOLDER, 'properties', tenant, os.path.relpath(directory, UPLOAD_FOLDER))
+
+def photo_blob_name(filename):
+    """Storage object for a guest photo of the current property"""
+    tenant = tenants.current_tenant()
+    if tenant == tenants.DEFAULT_TENANT:
+        return f"guest_photos/{filename}"
+    return f"properties/{tenant}/guest_photos/{filename}"
+
+# Read cache - monotonic TTLs, LRU bound, single-flight loads (see cache.py).
+# One per property, each with its own entry quota, so a busy property's reports
+# can't evict another property's room state.
+TENANT_CACHE_ENTRIES = int(os.environ.get('TENANT_CACHE_ENTRIES', CACHE_MAX_SIZE))
+read_cache = tenants.PerTenant(lambda tenant: MemoCache(max_entries=TENANT_CACHE_ENTRIES, on_lookup=record_cache),
+                               "read cache")
+
+def cached(ttl=CACHE_TTL, stale_ttl=0, copy=None):
+    """Memoize in the current property's read cache"""
     def decorator(func):
+        memoized = tenants.PerTenant(
+            lambda tenant: read_cache.get(tenant).memoize(ttl=ttl, stale_ttl=stale_ttl, copy=copy)(func),
+            func.__name__)
+        
         @wraps(func)
         def wrapper(*args, **kwargs):
-            cache_key = f"{func.__name__}_{str(args)}_{str(kwargs)}"
-            with _cache_lock:
-                if cache_key in _cache:
-                    cached_data, timestamp = _cache[cache_key]
-                    if (datetime.now() - timestamp).total_seconds() < ttl:
-                        return cached_data
-            
-            result = func(*args, **kwargs)
-            
-            with _cache_lock:
-                _cache[cache_key] = (result, datetime.now())
-            
-            return result
+            return memoized.get()(*args, **kwargs)
+        
+        wrapper.invalidate = lambda *args, **kwargs: memoized.invalidate(*args, **kwargs)
+        wrapper.invalidate_all = lambda: memoized.invalidate_all()
+        wrapper.freshness = lambda *args, **kwargs: memoized.freshness(*args, **kwargs)
         return wrapper
     return decorator
 
+# Dashboard reads keep serving their last snapshot this long while refreshing
+READ_STALE_SECONDS = int(os.environ.get('READ_STALE_SECONDS', '600'))
+READ_TIMEOUT = 15
+
+class CircuitOpenError(Exception):
+    pass
+
+class CircuitBreaker:
+    """Stops issuing Firestore reads after repeated failures or slow calls, probing again after a cooldown"""
+    def __init__(self, name, failure_threshold=3, reset_timeout=30, slow_call_seconds=5):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.slow_call_seconds = slow_call_seconds
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def _set_state(self, state):
+        if state != self.state:
+            self.state = state
+            METRICS["breaker"].inc(self.name, state)
+            logger.warning(f"Circuit breaker {self.name} is now {state}")
+
+    def call(self, func, *args, **kwargs):
+        with self._lock:
+            if self.state == "open":
+                if time.monotonic() - self.opened_at < self.reset_timeout:
+                    raise CircuitOpenError(f"{self.name} circuit is open")
+                self._set_state("half_open")
+            elif self.state == "half_open":
+                # One probe at a time while half open
+                raise CircuitOpenError(f"{self.name} circuit is half open")
+        start_time = time.monotonic()
+        try:
+            result = func(*args, **kwargs)
+        except Exception:
+            self._record(False)
+            raise
+        self._record(time.monotonic() - start_time < self.slow_call_seconds)
+        return result
+
+    def _record(self, ok):
+        with self._lock:
+            if ok:
+                self.failures = 0
+                self._set_state("closed")
+                return
+            self.failures += 1
+            if self.state == "half_open" or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+                self._set_state("open")
+
+    def status(self):
+        with self._lock:
+            return {"state": self.state, "failures": self.failures}
+
+firestore_breaker = CircuitBreaker("firestore_reads")
+
+def freshness(*infos):
+    """as_of/stale response fields from (loaded_at, fresh) pairs of memoized reads or mirrors
+
+    stale means a fallback: a read whose reload failed, a mirror whose listener
+    dropped, or anything served while the breaker is open. A value inside its
+    stale-while-revalidate window is not stale.
+    """
+    infos = [info for info in infos if info is not None]
+    if not infos:
+        return {}
+    loaded_at = min(info[0] for info in infos)
+    return {
+        "as_of": datetime.fromtimestamp(loaded_at, IST).strftime("%Y-%m-%d %H:%M:%S"),
+        "stale": firestore_breaker.state == "open" or not all(info[1] for info in infos),
+    }
+
 # Optimized data retrieval with parallel fetching and timeouts
-@cached(ttl=5)
+@cached(ttl=5, stale_ttl=READ_STALE_SECONDS)
 def get_all_rooms():
-    """Get all rooms with optimized query"""
+    """Get all rooms; raises instead of returning {} so the last snapshot is kept"""
+    return firestore_breaker.call(_load_rooms)
+
+def _load_rooms():
     rooms_dict = {}
     try:
         start_time = time.time()
         
         # Stream documents efficiently
-        rooms_stream = rooms_ref.stream()
+        rooms_stream = rooms_ref.stream(timeout=READ_TIMEOUT)
         
         count = 0
         for room_doc in rooms_stream:
@@ -124,54 +898,36 @@ def get_all_rooms():
         return rooms_dict
     except Exception as e:
         logger.error(f"Error in get_all_rooms: {str(e)}")
-        return {}
+        raise
 
-@cached(ttl=10)
+@cached(ttl=10, stale_ttl=READ_STALE_SECONDS)
 def get_all_logs_limited():
-    """Get logs with aggressive limits and parallel fetching"""
-    logs_dict = {}
-    
-    def fetch_log_type(log_type):
-        try:
-            log_doc = logs_ref.document(log_type).get(timeout=15)
+    """Get the last 50 entries of each log; raises instead of returning {} so the last snapshot is kept"""
+    return firestore_breaker.call(_load_logs_limited)
+
+def _load_logs_limited():
+    log_types = ["cash", "online", "balance", "add_ons", "refunds", 
+                 "renewals", "booking_payments", "discounts", "expenses", "room_shifts"]
+    logs_dict = {log_type: [] for log_type in log_types}
+    try:
+        # One batched read instead of a task per log type on the shared executor,
+        # which starved when get_data was already holding its workers
+        log_docs = db.get_all([logs_ref.document(log_type) for log_type in log_types], timeout=READ_TIMEOUT)
+        for log_doc in log_docs:
             if log_doc.exists:
                 entries = log_doc.to_dict().get('entries', [])
-                # Only return last 50 entries for speed
-                return log_type, entries[-50:] if len(entries) > 50 else entries
-            return log_type, []
-        except Exception as e:
-            logger.error(f"Error fetching {log_type} logs: {str(e)}")
-            return log_type, []
-    
-    try:
-        log_types = ["cash", "online", "balance", "add_ons", "refunds", 
-                     "renewals", "booking_payments", "discounts", "expenses", "room_shifts"]
-        
-        # Fetch logs in parallel with timeout
-        futures = {executor.submit(fetch_log_type, log_type): log_type for log_type in log_types}
-        
-        for future in futures:
-            try:
-                log_type, entries = future.result(timeout=20)
-                logs_dict[log_type] = entries
-            except TimeoutError:
-                log_type = futures[future]
-                logger.warning(f"Timeout fetching {log_type} logs")
-                logs_dict[log_type] = []
-            except Exception as e:
-                log_type = futures[future]
-                logger.error(f"Error fetching {log_type}: {str(e)}")
-                logs_dict[log_type] = []
+                # Only return last 50 entries for speed, compacted since they stay cached
+                logs_dict[log_doc.id] = log_entries(entries[-50:])
         
         # Force garbage collection
         gc.collect()
-        
     except Exception as e:
         logger.error(f"Error fetching logs: {str(e)}")
+        raise
     
     return logs_dict
 
-@cached(ttl=5)
+@cached(ttl=5, copy=dict)
 def get_totals():
     """Get totals with caching and timeout"""
     try:
@@ -188,25 +944,333 @@ def get_totals():
         logger.error(f"Error in get_totals: {str(e)}")
         return {"cash": 0, "online": 0, "balance": 0, "refunds": 0, "advance_bookings": 0, "expenses": 0}
 
+# Write routes commit through one group-commit coalescer (see coalescer.py) and
+# change totals by increment, so concurrent writes share a commit and can no
+# longer overwrite each other's totals
+TOTAL_TYPES = ("cash", "online", "balance", "refunds", "advance_bookings", "expenses")
+WRITE_COALESCE_MS = float(os.environ.get('WRITE_COALESCE_MS', 15))
+
+# Write-ahead journal (see journal.py): a route's writes are on local disk before
+# it answers and reach Firestore in order even through an outage. An empty
+# JOURNAL_DIR turns it off, and routes wait for Firestore again.
+JOURNAL_DIR = os.environ.get('JOURNAL_DIR', 'journal')
+JOURNAL_COMMIT_TIMEOUT = float(os.environ.get('JOURNAL_COMMIT_TIMEOUT', 5))
+# Reads a write route depends on give up after this and use the last snapshot
+WRITE_READ_TIMEOUT = float(os.environ.get('WRITE_READ_TIMEOUT', 5))
+write_journal = journal.Journal(
+    JOURNAL_DIR, journal.Codec(firestore),
+    document=lambda path: db.document(path),
+    transaction=lambda: db.transaction(),
+    transactional=lambda func: firestore.transactional(func),
+    call=firestore_breaker.call,
+    available=lambda: firestore_breaker.state == "closed",
+    on_replay=lambda paths: journal_replayed(paths)) if JOURNAL_DIR else None
+write_coalescer = WriteCoalescer(lambda: db.batch(), lambda amount: firestore.Increment(amount),
+                                 window=WRITE_COALESCE_MS / 1000, journal=write_journal,
+                                 commit_timeout=JOURNAL_COMMIT_TIMEOUT if write_journal else None)
+
+def write_batch():
+    """Batch for a write route; commit() returns once the group it joined is committed"""
+    return write_coalescer.batch()
+
+def add_total(batch, total_type, amount):
+    """Add amount to one of the current_totals counters in batch"""
+    if total_type not in TOTAL_TYPES:
+        raise KeyError(total_type)
+    batch.increment(totals_ref.document('current_totals'), total_type, amount)
+
+def collection_path(reference):
+    """'rooms', or 'properties/<id>/rooms' for another property, for a collection reference"""
+    return reference.document('_').path.rpartition('/')[0]
+
+def overlay_journal(reference, documents, decode=None):
+    """documents of the collection at reference with journaled writes not yet in Firestore applied"""
+    if write_journal is None:
+        return documents
+    return write_journal.overlay(collection_path(reference), documents, decode)
+
+# Room fields a write's amounts are worked out from: a journaled write is only
+# replayed while the room still has the values it read (see journal.py)
+ROOM_GUARD_FIELDS = ("status", "checkin_time", "balance")
+
+def room_guard(room_data):
+    return {field: room_data.get(field) for field in ROOM_GUARD_FIELDS}
+
+def read_room_for_write(room):
+    """A room's document for a write route to act on, or None if there is no such room
+
+    Always read from Firestore, never the read cache or the mirror, so a write is
+    worked out from the room as it is now; if the read fails, so does the request.
+    Journaled writes not yet in Firestore are applied on top.
+    """
+    snapshot = firestore_breaker.call(rooms_ref.document(room).get, timeout=WRITE_READ_TIMEOUT)
+    room_data = snapshot.to_dict() if snapshot.exists else None
+    room_data = overlay_journal(rooms_ref, {room: room_data} if room_data is not None else {}).get(room)
+    if room_data is not None and not isinstance(room_data, dict):
+        room_data = room_data.to_dict()
+    return room_data
+
+# Listener-backed mirrors for dashboard reads. Write paths read the room documents
+# themselves (read_room_for_write) so read-modify-write never works from a lagging copy.
+MIRROR_ENABLED = os.environ.get('MIRROR_ENABLED', '1') == '1'
+OPEN_SETTLEMENT_STATUSES = ["pending", "partial"]
+
+def record_mirror_lag(name, lag):
+    METRICS["mirror_lag"].observe(lag, name)
+
+# Renewal deadlines: the rooms mirror keeps the per-property heap current
+renewal_index = tenants.PerTenant(lambda tenant: RenewalIndex(), "renewal index")
+rooms_mirror = tenants.PerTenant(
+    lambda tenant: SnapshotMirror("rooms", lambda: rooms_ref.get(tenant), decode=Room.from_dict,
+                                  on_snapshot=record_mirror_lag,
+                                  on_change=renewal_index.get(tenant).apply_changes), "rooms mirror")
+totals_mirror = tenants.PerTenant(
+    lambda tenant: SnapshotMirror("totals", lambda: totals_ref.get(tenant).document('current_totals'),
+                                  on_snapshot=record_mirror_lag), "totals mirror")
+settlements_mirror = tenants.PerTenant(
+    lambda tenant: SnapshotMirror("open_settlements",
+                                  lambda: settlements_ref.get(tenant).where("status", "in", OPEN_SETTLEMENT_STATUSES),
+                                  decode=Settlement.from_dict, on_snapshot=record_mirror_lag), "settlements mirror")
+# Guest directory: the mirror keeps the in-memory prefix index current
+guest_index = tenants.PerTenant(lambda tenant: GuestIndex(), "guest index")
+guests_mirror = tenants.PerTenant(
+    lambda tenant: SnapshotMirror("guests", lambda: guests_ref.get(tenant), on_snapshot=record_mirror_lag,
+                                  on_change=guest_index.get(tenant).apply_changes), "guests mirror")
+# Daily serial counters: seeds check-in numbering when the counter transaction fails
+counters_mirror = tenants.PerTenant(
+    lambda tenant: SnapshotMirror("counters", lambda: counters_ref.get(tenant), on_snapshot=record_mirror_lag),
+    "counters mirror")
+MIRRORS = (rooms_mirror, totals_mirror, settlements_mirror, guests_mirror, counters_mirror)
+
+# Full logs behind the analytics tab, as analytics.LogColumns arrays
+@cached(ttl=60, stale_ttl=READ_STALE_SECONDS)
+def get_log_columns():
+    """Columnar copy of the full cash/online/add-on/expense/renewal/refund logs"""
+    return firestore_breaker.call(_load_log_columns)
+
+def _load_log_columns():
+    log_types = list(analytics.LOG_SPECS)
+    logs = {}
+    try:
+        log_docs = db.get_all([logs_ref.document(log_type) for log_type in log_types], timeout=READ_TIMEOUT)
+        for log_doc in log_docs:
+            if log_doc.exists:
+                logs[log_doc.id] = log_doc.to_dict().get('entries', [])
+    except Exception as e:
+        logger.error(f"Error loading logs for analytics: {str(e)}")
+        raise
+    return analytics.build_columns(logs)
+
+def read_rooms():
+    """Rooms and their freshness: from the mirror when it is in sync, else get_all_rooms
+
+    Journaled writes that have not reached Firestore yet are applied on top.
+    """
+    if rooms_mirror.ready:
+        return overlay_journal(rooms_ref, rooms_mirror.documents(), Room.from_dict), rooms_mirror.freshness()
+    try:
+        return overlay_journal(rooms_ref, get_all_rooms()), get_all_rooms.freshness()
+    except Exception:
+        if not rooms_mirror.documents():
+            raise
+        # Firestore is unreachable: the mirror's last snapshot, marked stale, beats no rooms
+        read_time, _ = rooms_mirror.freshness()
+        return overlay_journal(rooms_ref, rooms_mirror.documents(), Room.from_dict), (read_time, False)
+
+def read_totals():
+    """Totals and their freshness: from the mirror when it is in sync, else get_totals"""
+    if totals_mirror.ready:
+        totals = dict(totals_mirror.documents().get('current_totals') or {})
+        for total_type in ["cash", "online", "balance", "refunds", "advance_bookings", "expenses"]:
+            totals.setdefault(total_type, 0)
+        return totals, totals_mirror.freshness()
+    return get_totals(), get_totals.freshness()
+
+def read_open_settlements():
+    """Pending and partial settlements, from the mirror when it is in sync"""
+    if settlements_mirror.ready:
+        docs = settlements_mirror.documents()
+    else:
+        query = settlements_ref.where("status", "in", OPEN_SETTLEMENT_STATUSES)
+        docs = {doc.id: doc.to_dict() for doc in query.stream(timeout=READ_TIMEOUT)}
+    return [dict(data, id=doc_id) for doc_id, data in docs.items()]
+
+def start_mirrors():
+    if MIRROR_ENABLED:
+        for mirror in MIRRORS:
+            mirror.start()
+
 def invalidate_cache(cache_keys=None):
     """Invalidate specific cache keys or all cache"""
-    with _cache_lock:
-        if cache_keys:
-            for key in cache_keys:
-                _cache.pop(key, None)
+    if cache_keys:
+        for key in cache_keys:
+            read_cache.invalidate(key)
+    else:
+        read_cache.clear()
+
+# Dataset versions - bumped by write routes, used as ETags by read routes
+DATASETS = ("rooms", "totals", "logs", "bookings", "settlements", "expenses", "guests")
+_data_versions = tenants.PerTenant(lambda tenant: {dataset: 0 for dataset in DATASETS}, "dataset versions")
+_versions_lock = threading.Lock()
+# Distinguishes versions from a previous process that started counting at 0 too
+_version_epoch = uuid.uuid4().hex[:8]
+# Longest an ETag for data without a live mirror stays valid
+ETAG_MAX_AGE = int(os.environ.get('ETAG_MAX_AGE', 60))
+
+# Memoized reads and mirrors that each dataset feeds
+DATASET_CACHES = {
+    "rooms": ("get_all_rooms",),
+    "totals": ("get_totals",),
+    "logs": ("get_all_logs_limited", "get_log_columns"),
+    "guests": ("get_guest_directory",),
+}
+DATASET_MIRRORS = {
+    "rooms": rooms_mirror,
+    "totals": totals_mirror,
+    "settlements": settlements_mirror,
+}
+
+def invalidate_datasets(tenant, datasets, commit_time=None):
+    """Drop this process's cached reads of datasets for tenant and move its clients to a new ETag
+
+    commit_time, when the write's is known, is what the dataset's mirror waits for.
+    """
+    cache = read_cache.get(tenant)
+    for dataset in datasets:
+        for name in DATASET_CACHES.get(dataset, ()):
+            cache.invalidate_function(name)
+        if dataset in DATASET_MIRRORS:
+            DATASET_MIRRORS[dataset].get(tenant).mark_dirty(commit_time)
+    versions = _data_versions.get(tenant)
+    with _versions_lock:
+        for dataset in datasets:
+            versions[dataset] += 1
+
+# Caches a local write drops more narrowly itself (the booking calendar, by month).
+# A peer's change or a journal replay doesn't say which entries it touched, so
+# those drop them whole.
+COARSE_DATASET_CACHES = {
+    "bookings": ("get_booking_calendar",),
+}
+
+def invalidate_unseen_changes(tenant, datasets):
+    """invalidate_datasets for a change this process didn't make: a peer's write or a replay"""
+    cache = read_cache.get(tenant)
+    for dataset in datasets:
+        for name in COARSE_DATASET_CACHES.get(dataset, ()):
+            cache.invalidate_function(name)
+    invalidate_datasets(tenant, datasets)
+
+# Other workers and instances learn about writes through the coherence bus (see
+# coherence.py): a shared version table on this host, and COHERENCE_BUS_URL
+# (udp://... or redis://...) to reach other instances
+COHERENCE_DIR = os.environ.get('COHERENCE_DIR', os.path.join(
+    '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir(), 'lodge-coherence'))
+COHERENCE_BUS_URL = os.environ.get('COHERENCE_BUS_URL')
+coherence_bus = coherence.Coherence(
+    DATASETS, invalidate_unseen_changes,
+    table=coherence.VersionTable(COHERENCE_DIR, DATASETS) if COHERENCE_DIR else None,
+    transport_url=COHERENCE_BUS_URL, known_tenants=PROPERTIES)
+
+def bump_versions(*datasets):
+    """Mark datasets as changed: drop their cached reads, move clients to a new ETag and tell peers"""
+    tenant = tenants.current_tenant()
+    # The commit this follows; reset so a later write without one can't reuse it
+    commit_time = last_commit_time.get()
+    last_commit_time.set(None)
+    invalidate_datasets(tenant, datasets, commit_time)
+    try:
+        coherence_bus.publish(tenant, datasets)
+    except Exception as e:
+        logger.error(f"Error publishing invalidation for {', '.join(datasets)}: {str(e)}")
+
+def journal_replayed(paths):
+    """A replayed journal entry reached Firestore: drop what was read before it, as bump_versions does"""
+    changed = {}
+    for path in paths:
+        parts = path.split("/")
+        tenant = parts[1] if parts[0] == "properties" and len(parts) > 3 else tenants.DEFAULT_TENANT
+        if parts[-2] in DATASETS:
+            changed.setdefault(tenant, set()).add(parts[-2])
+    for tenant, datasets in changed.items():
+        invalidate_unseen_changes(tenant, datasets)
+        coherence_bus.publish(tenant, datasets)
+
+@app.before_request
+def start_journal():
+    """Open this worker's journal, replaying whatever an earlier worker left unreplayed"""
+    if write_journal is not None:
+        try:
+            write_journal.start()
+        except Exception as e:
+            logger.error(f"Error starting write journal: {str(e)}")
+
+@app.before_request
+def sync_peer_writes():
+    """Drop whatever another worker wrote since this process last looked, before the route reads it"""
+    try:
+        coherence_bus.start()
+        coherence_bus.sync(tenants.current_tenant())
+    except Exception as e:
+        logger.error(f"Error syncing with peer workers: {str(e)}")
+
+def dataset_etag(datasets):
+    tenant = tenants.current_tenant()
+    shared = coherence_bus.versions(tenant, datasets)
+    if shared is not None:
+        # Counters every worker on this host agrees on, so a 304 holds whichever worker answers
+        epoch, counters = shared
+        epoch = f"{epoch:x}"
+    else:
+        epoch = _version_epoch
+        with _versions_lock:
+            counters = [_data_versions[dataset] for dataset in datasets]
+    versions = "-".join(str(counter) for counter in counters)
+    # Changes no write here heard about (another instance, the console): a live
+    # mirror's snapshot time moves with its data, anything else expires
+    # after ETAG_MAX_AGE seconds
+    marks = []
+    for dataset in datasets:
+        info = DATASET_MIRRORS[dataset].get(tenant).freshness() if dataset in DATASET_MIRRORS else None
+        if info is not None and info[1]:
+            marks.append(f"{dataset}@{info[0]:.6f}")
         else:
-            _cache.clear()
-        
-        # Limit cache size
-        if len(_cache) > CACHE_MAX_SIZE:
-            sorted_items = sorted(_cache.items(), key=lambda x: x[1][1])
-            for key, _ in sorted_items[:len(_cache) - CACHE_MAX_SIZE]:
-                _cache.pop(key, None)
+            marks.append(f"{dataset}~{int(time.time() // ETAG_MAX_AGE)}")
+    source_tag = hashlib.sha1("|".join(marks).encode()).hexdigest()[:8]
+    # Different query strings (shape, date ranges) are different representations
+    query = request.query_string
+    query_tag = f"-{hashlib.sha1(query).hexdigest()[:8]}" if query else ""
+    return f"{epoch}-{tenant}-{versions}-{source_tag}{query_tag}"
+
+def conditional(*datasets):
+    """Answer If-None-Match with 304 before the view touches the cache or Firestore"""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            # Read the version before the data so a concurrent write can only
+            # make the body newer than its ETag, never older
+            etag = dataset_etag(datasets)
+            if request.if_none_match.contains_weak(etag):
+                response = app.response_class(status=304)
+            else:
+                response = app.make_response(func(*args, **kwargs))
+                # Failures and stale snapshots are not worth revalidating against
+                if not response.is_json:
+                    return response
+                body = response.get_json()
+                if not body.get("success", True) or body.get("stale"):
+                    return response
+            response.set_etag(etag, weak=True)
+            response.headers['Cache-Control'] = 'no-cache'
+            return response
+        return wrapper
+    return decorator
 
 def cleanup_memory():
     """Periodic memory cleanup"""
     try:
-        invalidate_cache()
+        for _, cache in read_cache.items():
+            cache.prune()
         gc.collect()
         logger.info("Memory cleanup completed")
     except Exception as e:
@@ -232,6 +1296,19 @@ def update_last_rent_check():
         logger.error(f"Error updating last rent check: {str(e)}")
 
 # Lazy initialization
+_init_state = tenants.PerTenant(lambda tenant: {"started": False, "running": False, "ready": False, "error": None},
+                               "init state")
+_init_lock = threading.Lock()
+
+def start_initialization():
+    """Start initialize_data in the background once per worker process"""
+    with _init_lock:
+        if _init_state["ready"] or _init_state["running"]:
+            return
+        _init_state["started"] = True
+        _init_state["running"] = True
+    tenants.spawn(initialize_data)
+
 def initialize_data():
     """Lazy initialization - runs in background"""
     logger.info("Checking Firebase data structure...")
@@ -246,13 +1323,24 @@ def initialize_data():
         rooms_count = len(list(rooms_ref.limit(1).stream()))
         if rooms_count == 0:
             logger.info("Creating default room structure in background...")
-            threading.Thread(target=create_default_structure, daemon=True).start()
-        
+            tenants.spawn(create_default_structure)
+        
+        start_mirrors()
+        resume_photo_uploads()
+        tenants.spawn(backfill_expense_ledger, name="expense-backfill")
+        tenants.spawn(backfill_guest_directory, name="guest-backfill")
+        if RECONCILE_INTERVAL > 0:
+            tenants.spawn(reconcile_loop, name="totals-reconcile")
         logger.info("Firebase initialization complete")
+        _init_state["ready"] = True
+        _init_state["error"] = None
         return True
     except Exception as e:
         logger.error(f"Error initializing Firebase data: {str(e)}")
+        _init_state["error"] = str(e)
         return False
+    finally:
+        _init_state["running"] = False
 
 def create_default_structure():
     """Create default room structure in background"""
@@ -299,27 +1387,78 @@ def create_default_structure():
             "advance_bookings": 0, "expenses": 0
         })
         
+        bump_versions("rooms", "totals", "logs")
         logger.info("Default data structure created successfully")
     except Exception as e:
         logger.error(f"Error creating default structure: {str(e)}")
 
 # Serial number management
-def get_next_serial_number(date_str):
-    """Get next serial number with transaction"""
+# Last serial handed out today, so check-ins keep numbering while Firestore is unreachable
+_serial_counts = tenants.PerTenant(lambda tenant: {}, "serial counts")
+
+def last_known_serial(date_str):
+    """Last serial for date_str from the counters snapshot with journaled increments applied, else None"""
+    mirror = counters_mirror.get()
+    counts = _serial_counts.get()
+    if mirror.freshness() is None and date_str not in counts:
+        return None
+    # A live snapshot without the date means nothing has been numbered on it yet
+    docs = overlay_journal(counters_ref, dict(mirror.documents()))
+    counter = docs.get(date_str) or {}
+    return max(counter.get('count') or 0, counts.get(date_str, 0))
+
+def get_next_serial_number(date_str, batch=None):
+    """Get next serial number with transaction
+
+    The transaction is abandoned after WRITE_READ_TIMEOUT: one that has not reached
+    its write yet will not commit. One already committing is waited for (up to
+    WRITE_READ_TIMEOUT more) and its number used, so a late commit never leaves a
+    number taken twice or skipped; if it still hasn't settled the check-in fails.
+    Once the transaction has failed, with the journal on and a batch to add to,
+    the number is the one after the last in the counters snapshot (plus journaled
+    increments), counted by an increment in batch. Another instance numbering at
+    the same time can then repeat a number.
+    """
     counter_ref = counters_ref.document(date_str)
     transaction = db.transaction()
+    abandoned = threading.Event()
     
     @firestore.transactional
     def update_in_transaction(transaction, counter_ref):
-        snapshot = counter_ref.get(transaction=transaction)
+        snapshot = counter_ref.get(transaction=transaction, timeout=WRITE_READ_TIMEOUT)
         if snapshot.exists:
             new_count = snapshot.get('count') + 1
         else:
             new_count = 1
+        if abandoned.is_set():
+            raise TimeoutError(f"Serial number transaction for {date_str} abandoned")
         transaction.set(counter_ref, {'count': new_count})
         return new_count
     
-    return update_in_transaction(transaction, counter_ref)
+    counts = _serial_counts.get()
+    future = executor.submit(firestore_breaker.call, update_in_transaction, transaction, counter_ref)
+    try:
+        # exception() waits for the outcome without raising the transaction's own error
+        future.exception(timeout=WRITE_READ_TIMEOUT)
+    except TimeoutError:
+        abandoned.set()
+        try:
+            future.exception(timeout=WRITE_READ_TIMEOUT)
+        except TimeoutError:
+            raise RuntimeError(f"Serial number for {date_str} is still being committed; try again")
+    try:
+        serial_number = future.result()
+    except Exception as e:
+        last_serial = None if batch is None or write_journal is None else last_known_serial(date_str)
+        if last_serial is None:
+            raise
+        logger.warning(f"Numbering check-in from the last known serial for {date_str}: {str(e) or type(e).__name__}")
+        serial_number = last_serial + 1
+        batch.increment(counter_ref, 'count', 1)
+    if date_str not in counts:
+        counts.clear()
+    counts[date_str] = serial_number
+    return serial_number
 
 def store_transaction_metadata(room, date, serial_number, transaction_type="checkin"):
     """Store metadata asynchronously"""
@@ -334,7 +1473,7 @@ def store_transaction_metadata(room, date, serial_number, transaction_type="chec
         except Exception as e:
             logger.error(f"Error storing metadata: {str(e)}")
     
-    threading.Thread(target=_store, daemon=True).start()
+    tenants.spawn(_store)
 
 def cleanup_old_counters():
     """Cleanup old counters in background"""
@@ -393,8 +1532,13 @@ def is_log_from_current_stay(log, checkin_time):
         logger.error(f"Error parsing log datetime: {str(e)}")
         return True
 
-# Start initialization in background
-threading.Thread(target=initialize_data, daemon=True).start()
+# Start initialization in the worker on its first request (not at import,
+# so gunicorn's preloaded master never opens gRPC channels before forking)
+@app.before_request
+def warm_up():
+    if not _init_state["started"]:
+        start_initialization()
+        threading.Thread(target=asset_manifest.precompress, daemon=True).start()
 
 # Routes
 @app.route("/")
@@ -403,11 +1547,37 @@ def index():
 
 @app.route("/static/<path:path>")
 def serve_static(path):
-    return send_from_directory("static", path)
+    name = asset_manifest.resolve(path)
+    if name is None:
+        # Unversioned URL - let the browser revalidate with the ETag
+        return send_from_directory(STATIC_FOLDER, path, max_age=0)
+    
+    etag = asset_manifest.assets[name]["etag"]
+    encoding = next((e for e in asset_manifest.encodings if e in request.accept_encodings), None)
+    if encoding:
+        ext = os.path.splitext(name)[1]
+        response = app.response_class(asset_manifest.variant(name, encoding), mimetype=ASSET_MIMETYPES[ext])
+        response.headers['Content-Encoding'] = encoding
+        response.set_etag(f"{etag}-{encoding}")
+    else:
+        response = send_from_directory(STATIC_FOLDER, name, etag=False)
+        response.set_etag(etag)
+    response.headers['Cache-Control'] = ASSET_CACHE_CONTROL
+    response.vary.add('Accept-Encoding')
+    return response.make_conditional(request)
 
 @app.route("/uploads/<path:filename>")
 def uploaded_file(filename):
-    return send_from_directory(app.config['UPLOAD_FOLDER'], filename)
+    """Serve a photo that is still uploading from memory, otherwise from disk"""
+    with _pending_uploads_lock:
+        pending = _pending_uploads.get().get(filename)
+    if pending and pending["status"] != "done":
+        return send_from_directory(property_upload_dir(PHOTO_PENDING_DIR), filename, mimetype=pending["content_type"], max_age=0)
+    if pending or secure_filename(filename) == filename and not os.path.exists(
+            os.path.join(app.config['UPLOAD_FOLDER'], filename)):
+        # Uploaded: the stored /uploads/ URL keeps working by pointing at Storage
+        return redirect(photo_storage_url(filename))
+    return send_from_directory(app.config['UPLOAD_FOLDER'], filename, max_age=86400)
 
 @app.route("/quick_health")
 def quick_health():
@@ -415,35 +1585,189 @@ def quick_health():
     return jsonify({
         "status": "ok", 
         "timestamp": datetime.now(IST).isoformat(),
-        "cache_size": len(_cache)
+        "cache_size": len(read_cache)
     })
 
+@app.route("/ready")
+def readiness_check():
+    """Readiness probe - 200 once Firestore is reachable and data is initialized"""
+    if not _init_state["ready"] and not _init_state["running"]:
+        start_initialization()
+    ready = _init_state["ready"]
+    return jsonify({
+        "status": "ready" if ready else "starting",
+        "firebase_initialized": _firebase_app is not None,
+        "firestore_client": db.ready,
+        "storage_bucket": bucket.ready,
+        "error": _firebase_error or _init_state["error"]
+    }), 200 if ready else 503
+
+_process = None
+
+def get_process():
+    """psutil handle for this worker, created on first /health call"""
+    global _process
+    if _process is None:
+        import psutil
+        _process = psutil.Process(os.getpid())
+    return _process
+
 @app.route("/health")
 def health_check():
     """Health check endpoint with memory info"""
     try:
-        import psutil
-        process = psutil.Process(os.getpid())
-        memory_info = process.memory_info()
-        memory_mb = memory_info.rss / 1024 / 1024
-        
-        return jsonify({
-            "status": "healthy",
-            "memory_mb": round(memory_mb, 2),
-            "memory_percent": round(process.memory_percent(), 2),
-            "cache_size": len(_cache)
-        })
-    except ImportError:
-        return jsonify({
+        status = {
             "status": "healthy",
-            "cache_size": len(_cache)
-        })
+            "property": tenants.current_tenant(),
+            "cache_size": len(read_cache),
+            "cache_sizes": {tenant: len(cache) for tenant, cache in read_cache.items()},
+            "firestore_reads": firestore_breaker.status(),
+            "coherence": coherence_bus.status(),
+            "write_groups": write_coalescer.stats,
+            "journal": write_journal.status() if write_journal is not None else None,
+            "mirrors": {mirror.name: mirror.status() for mirror in MIRRORS},
+            "totals_drift": reconcile_health()
+        }
+        try:
+            process = get_process()
+            status["memory_mb"] = round(process.memory_info().rss / 1024 / 1024, 2)
+            status["memory_percent"] = round(process.memory_percent(), 2)
+        except ImportError:
+            # psutil not installed: everything but the memory figures
+            pass
+        return jsonify(status)
     except Exception as e:
         return jsonify({
             "status": "error",
             "message": str(e)
         })
 
+def encode_image(image, max_dimension, target_bytes):
+    """Downscale and re-encode an image, lowering quality until it fits target_bytes"""
+    from PIL import Image
+    
+    image = image.copy()
+    image.thumbnail((max_dimension, max_dimension), Image.LANCZOS)
+    
+    data = b""
+    for quality in (85, 75, 65, 55, 45):
+        buffer = io.BytesIO()
+        if PHOTO_FORMAT == 'WEBP':
+            image.save(buffer, format='WEBP', quality=quality, method=4)
+        else:
+            image.save(buffer, format='JPEG', quality=quality, optimize=True, progressive=True)
+        data = buffer.getvalue()
+        if len(data) <= target_bytes:
+            break
+    return data
+
+def process_photo(stream):
+    """Decode an uploaded photo in memory and return (full, thumbnail, content_type)"""
+    from PIL import Image, ImageOps
+    
+    with Image.open(stream) as image:
+        # Let the JPEG decoder scale down while decoding instead of after
+        image.draft('RGB', (PHOTO_MAX_DIMENSION, PHOTO_MAX_DIMENSION))
+        image = ImageOps.exif_transpose(image)
+        if image.mode != 'RGB':
+            image = image.convert('RGB')
+        full = encode_image(image, PHOTO_MAX_DIMENSION, PHOTO_TARGET_BYTES)
+        thumb = encode_image(image, PHOTO_THUMB_DIMENSION, PHOTO_TARGET_BYTES // 8)
+    
+    content_type = 'image/webp' if PHOTO_FORMAT == 'WEBP' else 'image/jpeg'
+    return full, thumb, content_type
+
+def encode_image_bytes(stream, max_dimension):
+    """Decode an image stream and re-encode it at max_dimension"""
+    from PIL import Image, ImageOps
+    
+    with Image.open(stream) as image:
+        image.draft('RGB', (max_dimension, max_dimension))
+        image = ImageOps.exif_transpose(image)
+        if image.mode != 'RGB':
+            image = image.convert('RGB')
+        return encode_image(image, max_dimension, PHOTO_TARGET_BYTES)
+
+def photo_storage_url(filename):
+    return f"https://storage.googleapis.com/{bucket.name}/{photo_blob_name(filename)}"
+
+def upload_photo_blob(filename):
+    """Upload one photo derivative from local disk to Storage (runs on upload_executor)"""
+    with _pending_uploads_lock:
+        pending = _pending_uploads.get().get(filename)
+    if not pending or pending["status"] == "done":
+        return
+    try:
+        with open(pending["path"], 'rb') as f:
+            data = f.read()
+        blob = bucket.blob(photo_blob_name(filename))
+        blob.cache_control = PHOTO_CACHE_CONTROL
+        # predefined_acl makes the object public in the same RPC as the upload
+        blob.upload_from_string(data, content_type=pending["content_type"], predefined_acl='publicRead')
+        with _pending_uploads_lock:
+            pending.update(status="done", error=None, finished=time.time())
+        os.remove(pending["path"])
+        logger.info(f"Photo {filename} uploaded ({len(data) // 1024} KB)")
+    except Exception as e:
+        with _pending_uploads_lock:
+            pending["attempts"] += 1
+            pending.update(status="retrying", error=str(e))
+            delay = min(2 ** pending["attempts"], PHOTO_UPLOAD_MAX_BACKOFF)
+        logger.error(f"Error uploading photo {filename}, retrying in {delay}s: {str(e)}")
+        tenants.spawn(retry_photo_upload, filename, delay)
+
+def retry_photo_upload(filename, delay):
+    time.sleep(delay)
+    upload_executor.submit(upload_photo_blob, filename)
+
+def queue_photo_upload(filename, data, content_type):
+    """Save a photo locally and upload it in the background; returns its Storage URL"""
+    pending_dir = property_upload_dir(PHOTO_PENDING_DIR)
+    if data is not None:
+        os.makedirs(pending_dir, exist_ok=True)
+        path = os.path.join(pending_dir, filename)
+        temp_path = f"{path}.tmp"
+        with open(temp_path, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, path)
+    with _pending_uploads_lock:
+        pending_uploads = _pending_uploads.get()
+        # Forget finished uploads after 10 minutes
+        cutoff = time.time() - 600
+        for key in [k for k, v in pending_uploads.items() if v["finished"] and v["finished"] < cutoff]:
+            del pending_uploads[key]
+        pending_uploads[filename] = {
+            "status": "pending",
+            "url": photo_storage_url(filename),
+            "path": os.path.join(pending_dir, filename),
+            "content_type": content_type,
+            "error": None,
+            "attempts": 0,
+            "finished": None
+        }
+    upload_executor.submit(upload_photo_blob, filename)
+    return photo_storage_url(filename)
+
+def resume_photo_uploads():
+    """Queue photos an earlier process saved but never got into Storage"""
+    pending_dir = property_upload_dir(PHOTO_PENDING_DIR)
+    try:
+        names = os.listdir(pending_dir)
+    except FileNotFoundError:
+        return
+    for name in names:
+        if name.endswith('.tmp'):
+            os.remove(os.path.join(pending_dir, name))
+            continue
+        with _pending_uploads_lock:
+            if name in _pending_uploads.get():
+                continue
+        content_type = 'image/webp' if name.endswith('.webp') else 'image/jpeg'
+        logger.info(f"Resuming upload of photo {name}")
+        queue_photo_upload(name, None, content_type)
+
 @app.route("/upload_photo", methods=["POST"])
 def upload_photo():
     if 'photo' not in request.files:
@@ -455,24 +1779,297 @@ def upload_photo():
     
     if file:
         try:
-            filename = secure_filename(f"{datetime.now(IST).strftime('%Y%m%d%H%M%S')}-{file.filename}")
-            temp_file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-            file.save(temp_file_path)
+            try:
+                full, thumb, content_type = process_photo(file.stream)
+            except Exception as e:
+                logger.error(f"Error processing photo: {str(e)}")
+                return jsonify(success=False, message="Upload failed: file is not a valid image")
             
-            blob = bucket.blob(f"guest_photos/{filename}")
-            blob.upload_from_filename(temp_file_path)
-            blob.make_public()
+            extension = 'webp' if content_type == 'image/webp' else 'jpg'
+            base_name = os.path.splitext(secure_filename(file.filename))[0] or "photo"
+            stem = f"{datetime.now(IST).strftime('%Y%m%d%H%M%S')}-{uuid.uuid4().hex[:8]}-{base_name}"
+            filename = f"{stem}.{extension}"
+            thumb_filename = f"{stem}_thumb.{extension}"
             
-            photo_url = blob.public_url
-            os.remove(temp_file_path)
+            photo_url = queue_photo_upload(filename, full, content_type)
+            thumb_url = queue_photo_upload(thumb_filename, thumb, content_type)
             
-            return jsonify(success=True, filename=filename, path=photo_url)
+            return jsonify(
+                success=True,
+                filename=filename,
+                path=photo_url,
+                thumbnail=thumb_url,
+                pending=True,
+                pending_url=f"/uploads/{filename}",
+                size=len(full)
+            )
         except Exception as e:
             logger.error(f"Error uploading photo: {str(e)}")
             return jsonify(success=False, message=f"Upload failed: {str(e)}")
     
     return jsonify(success=False, message="Upload failed")
 
+@app.route("/upload_status/<path:filename>")
+def upload_status(filename):
+    """Report whether a background photo upload has reached Storage"""
+    with _pending_uploads_lock:
+        pending = _pending_uploads.get().get(filename)
+        if not pending:
+            return jsonify(success=False, message="Unknown upload")
+        return jsonify(success=True, status=pending["status"], path=pending["url"], error=pending["error"])
+
+class PhotoDerivativeCache:
+    """Disk cache of resized photos with LRU eviction by total size"""
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._index = None  # key -> [size, etag], oldest first
+        self._total = 0
+        self._lock = threading.Lock()
+
+    def _load_index(self):
+        os.makedirs(self.directory, exist_ok=True)
+        entries = []
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if name.endswith('.tmp'):
+                os.remove(path)
+                continue
+            stat = os.stat(path)
+            entries.append((stat.st_mtime, name, stat.st_size))
+        entries.sort()
+        self._index = OrderedDict((name, [size, None]) for _, name, size in entries)
+        self._total = sum(size for _, _, size in entries)
+
+    def get(self, key):
+        """Return (data, etag) for a cached derivative, or None"""
+        with self._lock:
+            if self._index is None:
+                self._load_index()
+            entry = self._index.get(key)
+            if entry is None:
+                return None
+            self._index.move_to_end(key)
+        path = os.path.join(self.directory, key)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            os.utime(path)
+        except FileNotFoundError:
+            with self._lock:
+                if self._index.pop(key, None):
+                    self._total -= entry[0]
+            return None
+        if entry[1] is None:
+            entry[1] = hashlib.sha1(data).hexdigest()
+        return data, entry[1]
+
+    def put(self, key, data):
+        """Store a derivative, evicting least recently used ones over the size limit"""
+        etag = hashlib.sha1(data).hexdigest()
+        path = os.path.join(self.directory, key)
+        with self._lock:
+            if self._index is None:
+                self._load_index()
+        temp_path = f"{path}.{uuid.uuid4().hex[:8]}.tmp"
+        with open(temp_path, 'wb') as f:
+            f.write(data)
+        os.replace(temp_path, path)
+        with self._lock:
+            previous = self._index.pop(key, None)
+            if previous:
+                self._total -= previous[0]
+            self._index[key] = [len(data), etag]
+            self._total += len(data)
+            while self._total > self.max_bytes and len(self._index) > 1:
+                old_key, (old_size, _) = self._index.popitem(last=False)
+                self._total -= old_size
+                try:
+                    os.remove(os.path.join(self.directory, old_key))
+                except OSError:
+                    pass
+        return etag
+
+photo_cache = tenants.PerTenant(
+    lambda tenant: PhotoDerivativeCache(property_upload_dir(PHOTO_CACHE_DIR, tenant), PHOTO_CACHE_MAX_BYTES),
+    "photo cache")
+
+def load_photo_original(photo_id):
+    """Original photo bytes from the local copy while uploading, else Storage"""
+    with _pending_uploads_lock:
+        pending = _pending_uploads.get().get(photo_id)
+    if pending and pending["status"] != "done":
+        with open(pending["path"], 'rb') as f:
+            return f.read()
+    blob = bucket.blob(photo_blob_name(photo_id))
+    return blob.download_as_bytes(timeout=30)
+
+@app.route("/photo/<photo_id>")
+def photo(photo_id):
+    """Resized guest photo, e.g. /photo/<filename>?w=128"""
+    if secure_filename(photo_id) != photo_id:
+        return jsonify(success=False, message="Invalid photo id"), 400
+    
+    requested = request.args.get("w", type=int) or PHOTO_WIDTHS[-1]
+    # Snap to a fixed set of widths so each photo has a bounded number of derivatives
+    width = next((w for w in PHOTO_WIDTHS if w >= requested), PHOTO_WIDTHS[-1])
+    extension = 'webp' if PHOTO_FORMAT == 'WEBP' else 'jpg'
+    key = f"{os.path.splitext(photo_id)[0]}_w{width}.{extension}"
+    
+    cached_photo = photo_cache.get().get(key)
+    if cached_photo:
+        data, etag = cached_photo
+    else:
+        try:
+            original = load_photo_original(photo_id)
+            data = encode_image_bytes(io.BytesIO(original), width)
+        except Exception as e:
+            logger.error(f"Error generating photo {key}: {str(e)}")
+            return jsonify(success=False, message="Photo not found"), 404
+        etag = photo_cache.put(key, data)
+    
+    response = app.response_class(data, mimetype='image/webp' if extension == 'webp' else 'image/jpeg')
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = PHOTO_CACHE_CONTROL
+    return response.make_conditional(request)
+
+# Guest directory: one guests/{mobile} document per person, written in the same
+# batch as every check-in, booking and settlement that names them
+GUEST_SEARCH_LIMIT = 8
+
+def record_guest(batch, mobile, name=None, photo=None, visit=False, pending=None):
+    """Add a guest directory write to batch and apply it to the local index right away
+
+    pending maps settlement ids to the amount still owed, or None once the
+    settlement is paid or cancelled.
+    """
+    key = guest_key(mobile)
+    if key is None:
+        return
+    now = datetime.now(IST).strftime("%Y-%m-%d %H:%M")
+    update = {"mobile": str(mobile), "last_seen": now}
+    local = guest_index.get(key) or {}
+    local.update(update)
+    if name:
+        update["name"] = local["name"] = name
+    if photo:
+        update["photo"] = local["photo"] = photo
+    if visit:
+        update["visits"] = firestore.Increment(1)
+        local["visits"] = local.get("visits", 0) + 1
+    if pending:
+        update["pending_settlements"] = {settlement_id: firestore.DELETE_FIELD if amount is None else amount
+                                         for settlement_id, amount in pending.items()}
+        local_pending = dict(local.get("pending_settlements") or {})
+        for settlement_id, amount in pending.items():
+            if amount is None:
+                local_pending.pop(settlement_id, None)
+            else:
+                local_pending[settlement_id] = amount
+        local["pending_settlements"] = local_pending
+    batch.set(guests_ref.document(key), update, merge=True)
+    # The listener will deliver the stored document shortly; until then the
+    # check-in form already sees this write (including a new pending flag)
+    guest_index.upsert(key, local)
+
+@cached(ttl=60, stale_ttl=READ_STALE_SECONDS)
+def get_guest_directory():
+    """All guest documents, for when the guests mirror is not running"""
+    return firestore_breaker.call(_load_guest_directory)
+
+def _load_guest_directory():
+    return {guest_doc.id: guest_doc.to_dict() for guest_doc in guests_ref.stream(timeout=READ_TIMEOUT)}
+
+def backfill_guest_directory():
+    """Build the directory once from the guests already in rooms, bookings and settlements"""
+    try:
+        marker_ref = settings_ref.document('guest_directory')
+        marker = marker_ref.get(timeout=READ_TIMEOUT)
+        if marker.exists and marker.to_dict().get("backfilled"):
+            return
+        
+        found = {}
+        def note(mobile, name, photo=None, seen=None):
+            key = guest_key(mobile)
+            if key is None:
+                return None
+            guest = found.setdefault(key, {"mobile": str(mobile), "pending_settlements": {}})
+            if seen and seen >= guest.get("last_seen", ""):
+                guest["last_seen"] = seen
+                guest["name"] = name or guest.get("name")
+            elif not guest.get("name"):
+                guest["name"] = name
+            if photo:
+                guest["photo"] = photo
+            return guest
+        
+        for room_doc in rooms_ref.stream(timeout=READ_TIMEOUT):
+            room = room_doc.to_dict()
+            if room.get("guest"):
+                note(room["guest"].get("mobile"), room["guest"].get("name"), room["guest"].get("photo"),
+                     room.get("checkin_time"))
+        for booking_doc in bookings_ref.stream(timeout=READ_TIMEOUT):
+            booking = booking_doc.to_dict()
+            note(booking.get("guest_mobile"), booking.get("guest_name"), booking.get("photo_path"),
+                 booking.get("booking_date"))
+        for settlement_doc in settlements_ref.stream(timeout=READ_TIMEOUT):
+            settlement = settlement_doc.to_dict()
+            guest = note(settlement.get("guest_mobile"), settlement.get("guest_name"), settlement.get("photo"),
+                         f"{settlement.get('checkout_date', '')} {settlement.get('checkout_time', '')}".strip())
+            if guest is not None and settlement.get("status") in OPEN_SETTLEMENT_STATUSES:
+                guest["pending_settlements"][settlement_doc.id] = settlement.get("amount", 0)
+        
+        # Absolute values with merge, so a rerun after a crash writes the same thing
+        batch = db.batch()
+        pending = 0
+        for key, guest in found.items():
+            batch.set(guests_ref.document(key), {field: value for field, value in guest.items()
+                                                 if field != "pending_settlements"}, merge=True)
+            pending += 1
+            if pending >= 400:
+                batch.commit()
+                batch = db.batch()
+                pending = 0
+        batch.commit()
+        
+        # Open settlements are read again inside a transaction per guest, so one
+        # collected or cancelled since the scan above is not written back
+        @firestore.transactional
+        def add_pending_in_transaction(transaction, key, settlement_ids):
+            still_open = {}
+            for settlement_id in settlement_ids:
+                snapshot = settlements_ref.document(settlement_id).get(transaction=transaction)
+                settlement = snapshot.to_dict() if snapshot.exists else {}
+                if settlement.get("status") in OPEN_SETTLEMENT_STATUSES:
+                    still_open[settlement_id] = settlement.get("amount", 0)
+            if still_open:
+                transaction.set(guests_ref.document(key), {"pending_settlements": still_open}, merge=True)
+        
+        for key, guest in found.items():
+            if guest["pending_settlements"]:
+                add_pending_in_transaction(db.transaction(), key, list(guest["pending_settlements"]))
+        marker_ref.set({"backfilled": True, "guests": len(found),
+                        "completed_at": datetime.now(IST).strftime("%Y-%m-%d %H:%M:%S")})
+        logger.info(f"Guest directory backfilled with {len(found)} guests")
+    except Exception as e:
+        logger.error(f"Error backfilling guest directory: {str(e)}")
+
+@app.route("/guests/search")
+def search_guests():
+    """Autocomplete for the check-in form: guests whose mobile or name starts with ?q="""
+    try:
+        query = request.args.get("q", "")
+        if len(query.strip()) < 2:
+            return jsonify(success=True, guests=[])
+        if not guests_mirror.ready:
+            directory = get_guest_directory()
+            if guest_index.source is not directory:
+                guest_index.replace(directory)
+        return jsonify(success=True, guests=guest_index.search(query, GUEST_SEARCH_LIMIT))
+    except Exception as e:
+        logger.error(f"Error searching guests: {str(e)}")
+        return jsonify(success=False, message=f"Error searching guests: {str(e)}")
+
 @app.route("/checkin", methods=["POST"])
 def checkin():
     try:
@@ -500,12 +2097,19 @@ def checkin():
         current_time = datetime.now(IST).strftime("%Y-%m-%d %H:%M")
         current_date = datetime.now(IST).strftime("%Y-%m-%d")
         
-        serial_number = get_next_serial_number(current_date)
-        store_transaction_metadata(room, current_date, serial_number, "fresh_checkin")
+        # Before numbering, so a check-in that is turned away doesn't use up a serial
+        room_data = read_room_for_write(room)
+        if room_data is None:
+            return jsonify(success=False, message="Room not found")
+        if room_data.get("status") != "vacant":
+            return jsonify(success=False, message=f"Room {room} is not vacant.")
         
-        batch = db.batch()
+        batch = write_batch()
+        serial_number = get_next_serial_number(current_date, batch)
+        store_transaction_metadata(room, current_date, serial_number, "fresh_checkin")
         
         room_ref = rooms_ref.document(room)
+        batch.expect(room_ref, {"status": "vacant"})
         batch.update(room_ref, {
             "status": "occupied",
             "guest": guest,
@@ -516,7 +2120,6 @@ def checkin():
             "last_renewal_time": None
         })
         
-        totals = get_totals()
         
         if payment != "balance":
             if amount_paid > 0:
@@ -534,7 +2137,7 @@ def checkin():
                 batch.update(logs_ref.document(payment), {
                     "entries": firestore.ArrayUnion([log_entry])
                 })
-                totals[payment] += amount_paid
+                add_total(batch, payment, amount_paid)
         else:
             pay_later_log = {
                 "room": room,
@@ -565,12 +2168,13 @@ def checkin():
             batch.update(logs_ref.document("balance"), {
                 "entries": firestore.ArrayUnion([balance_log])
             })
-            totals["balance"] += balance
+            add_total(batch, "balance", balance)
         
-        batch.set(totals_ref.document('current_totals'), totals)
+        record_guest(batch, guest["mobile"], guest["name"], photo=data_json.get("photo"), visit=True)
         batch.commit()
         
-        invalidate_cache()
+        renewal_index.upsert(room, {"status": "occupied", "checkin_time": current_time, "renewal_count": 0})
+        bump_versions("rooms", "totals", "logs", "guests")
         cleanup_memory()
         
         logger.info(f"Check-in successful for room {room}, guest: {guest['name']}, serial: {serial_number}")
@@ -595,13 +2199,13 @@ def checkout():
         process_refund = data_json.get("process_refund", False)
         settle_later = data_json.get("settle_later", False)
         
-        room_doc = rooms_ref.document(room).get(timeout=10)
-        if not room_doc.exists:
+        room_data = read_room_for_write(room)
+        if room_data is None:
             return jsonify(success=False, message="Room not found")
             
-        room_data = room_doc.to_dict()
-        totals = get_totals()
-        batch = db.batch()
+        batch = write_batch()
+        # Everything below is worked out from this state of the room
+        batch.expect(rooms_ref.document(room), room_guard(room_data))
         
         if amount > 0 and payment_mode and not is_refund and not process_refund:
             current_balance = room_data["balance"]
@@ -630,11 +2234,11 @@ def checkout():
                 "entries": firestore.ArrayUnion([log_entry])
             })
             
-            totals[payment_mode] += amount
+            add_total(batch, payment_mode, amount)
             
             if current_balance > 0:
                 if amount >= current_balance:
-                    totals["balance"] -= current_balance
+                    add_total(batch, "balance", -current_balance)
                     overpayment = amount - current_balance
                     
                     if overpayment > 0:
@@ -645,17 +2249,16 @@ def checkout():
                         message = f"Payment of ₹{amount} received. Balance cleared."
                 else:
                     new_balance = current_balance - amount
-                    totals["balance"] -= amount
+                    add_total(batch, "balance", -amount)
                     message = "Payment recorded successfully."
             else:
                 new_balance = current_balance - amount
                 message = "Payment recorded successfully."
             
             batch.update(rooms_ref.document(room), {"balance": new_balance})
-            batch.set(totals_ref.document('current_totals'), totals)
             batch.commit()
             
-            invalidate_cache()
+            bump_versions("rooms", "totals", "logs")
             
             logger.info(f"Payment of ₹{amount} recorded for room {room}")
             return jsonify(success=True, message=message)
@@ -690,11 +2293,10 @@ def checkout():
             new_balance = current_balance + amount
             batch.update(rooms_ref.document(room), {"balance": new_balance})
             
-            totals["refunds"] += amount
-            batch.set(totals_ref.document('current_totals'), totals)
+            add_total(batch, "refunds", amount)
             batch.commit()
             
-            invalidate_cache()
+            bump_versions("rooms", "totals", "logs")
             
             logger.info(f"Manual refund of ₹{amount} processed for room {room}")
             return jsonify(success=True, message=f"Refund of ₹{amount} processed successfully")
@@ -723,7 +2325,7 @@ def checkout():
                 
                 batch.set(settlements_ref.document(settlement_id), settlement)
                 
-                totals["balance"] -= settlement_amount
+                add_total(batch, "balance", -settlement_amount)
                 
                 balance_log = {
                     "room": room,
@@ -739,6 +2341,8 @@ def checkout():
                 batch.update(logs_ref.document("balance"), {
                     "entries": firestore.ArrayUnion([balance_log])
                 })
+                record_guest(batch, guest_info["mobile"], guest_info["name"], photo=guest_info.get("photo"),
+                             pending={settlement_id: settlement_amount})
                 
                 logger.info(f"Settlement created for room {room}, amount: ₹{settlement_amount}")
             
@@ -765,7 +2369,7 @@ def checkout():
                     "entries": firestore.ArrayUnion([checkout_refund_log])
                 })
                 
-                totals["refunds"] += refund_amount
+                add_total(batch, "refunds", refund_amount)
                 refund_processed = True
                 
                 logger.info(f"Checkout refund of ₹{refund_amount} processed for room {room}")
@@ -780,10 +2384,10 @@ def checkout():
                 "last_renewal_time": None
             })
             
-            batch.set(totals_ref.document('current_totals'), totals)
             batch.commit()
             
-            invalidate_cache()
+            renewal_index.remove(room)
+            bump_versions("rooms", "totals", "logs", "settlements", "guests")
             cleanup_memory()
             
             if refund_processed:
@@ -818,8 +2422,8 @@ def add_on():
             return jsonify(success=False, message="Room not found")
             
         room_data = room_doc.to_dict()
-        totals = get_totals()
-        batch = db.batch()
+        batch = write_batch()
+        batch.expect(rooms_ref.document(room), room_guard(room_data))
         
         add_on_entry = {
             "room": room,
@@ -850,12 +2454,12 @@ def add_on():
             batch.update(logs_ref.document(payment_method), {
                 "entries": firestore.ArrayUnion([payment_log])
             })
-            totals[payment_method] += price
+            add_total(batch, payment_method, price)
         else:
             new_balance = room_data["balance"] + price
             batch.update(rooms_ref.document(room), {"balance": new_balance})
             
-            totals["balance"] += price
+            add_total(batch, "balance", price)
             
             balance_log = {
                 "room": room,
@@ -882,10 +2486,9 @@ def add_on():
             "entries": firestore.ArrayUnion([add_on_entry])
         })
         
-        batch.set(totals_ref.document('current_totals'), totals)
         batch.commit()
         
-        invalidate_cache()
+        bump_versions("rooms", "totals", "logs")
         
         logger.info(f"Add-on '{item}' added to room {room}, price: ₹{price}, payment: {payment_method}")
         
@@ -897,32 +2500,290 @@ def add_on():
         logger.error(f"Error adding add-on: {str(e)}")
         return jsonify(success=False, message=f"Error adding add-on: {str(e)}")
 
+# /batch: several front-desk actions on one room, validated against one read of
+# the room and written in one Firestore batch
+BATCH_MAX_OPERATIONS = 20
+
+class BatchError(Exception):
+    """An operation in a /batch request was rejected; nothing has been written"""
+
+class RoomBatch:
+    """Applies operations to a working copy of one room and collects their writes"""
+    def __init__(self, room, room_data):
+        self.room = room
+        self.room_data = room_data
+        # The state every operation is worked out from, before any of them change room_data
+        self.guard = room_guard(room_data)
+        self.batch_id = str(uuid.uuid4())
+        self.room_updates = {}
+        self.add_ons = []
+        self.discounts = []
+        self.logs = {}
+        self.totals_delta = {}
+        self.documents = []
+        self.guests = []
+        self.datasets = {"rooms", "totals", "logs"}
+        self.messages = []
+        self._totals = None
+        self._index = 0
+        self.now = datetime.now(IST)
+        self.date = self.now.strftime("%Y-%m-%d")
+        self.time = self.now.strftime("%H:%M")
+    
+    def apply(self, index, operation):
+        self._index = index
+        handler = getattr(self, f"op_{operation.get('op')}", None)
+        if handler is None:
+            raise BatchError(f"Unknown operation: {operation.get('op')}")
+        if self.room_data.get("status") != "occupied":
+            raise BatchError("Room is not occupied")
+        self.messages.append(handler(operation))
+    
+    @property
+    def balance(self):
+        return self.room_data.get("balance") or 0
+    
+    def set_balance(self, value):
+        self.room_data["balance"] = value
+        self.room_updates["balance"] = value
+    
+    def add_total(self, total_type, amount):
+        self.totals_delta[total_type] = self.totals_delta.get(total_type, 0) + amount
+    
+    def current_total(self, total_type):
+        if self._totals is None:
+            self._totals = get_totals()
+        return self._totals.get(total_type, 0) + self.totals_delta.get(total_type, 0)
+    
+    def log(self, log_type, entry):
+        # Tagged so identical entries in one batch are not merged by ArrayUnion
+        entry.update(batch_id=self.batch_id, batch_op=self._index)
+        self.logs.setdefault(log_type, []).append(entry)
+    
+    @staticmethod
+    def amount(operation, field="amount"):
+        try:
+            amount = int(operation.get(field, 0))
+        except (TypeError, ValueError):
+            raise BatchError(f"Invalid {field}")
+        if amount <= 0:
+            raise BatchError(f"Please provide a valid {field}")
+        return amount
+    
+    @staticmethod
+    def method(operation, field, default=None, allowed=("cash", "online")):
+        value = operation.get(field) or default
+        if value not in allowed:
+            raise BatchError(f"Invalid {field}: {value}")
+        return value
+    
+    def op_discount(self, operation):
+        amount = self.amount(operation)
+        reason = operation.get("reason", "Discount")
+        self.discounts.append({"amount": amount, "reason": reason, "date": self.date, "time": self.time,
+                               "batch_id": self.batch_id, "batch_op": self._index})
+        if self.balance > 0:
+            self.add_total("balance", max(0, self.current_total("balance") - amount) - self.current_total("balance"))
+            self.set_balance(max(0, self.balance - amount))
+        else:
+            self.set_balance(self.balance - amount)
+        self.log("discounts", {"room": self.room, "name": self.room_data["guest"]["name"], "amount": amount,
+                               "reason": reason, "date": self.date, "time": self.time})
+        return f"Discount of ₹{amount} applied"
+    
+    def op_add_on(self, operation):
+        item = operation.get("item")
+        if not item:
+            raise BatchError("Missing item")
+        price = self.amount(operation, "price")
+        payment_method = self.method(operation, "payment_method", "balance", ("cash", "online", "balance"))
+        unit_price = operation.get("unit_price", price)
+        quantity = operation.get("quantity", 1)
+        add_on_entry = {"room": self.room, "item": item, "price": price, "unit_price": unit_price,
+                        "quantity": quantity, "time": self.time, "date": self.date,
+                        "payment_method": payment_method, "transaction_type": "service"}
+        details = {"room": self.room, "name": self.room_data["guest"]["name"], "amount": price,
+                   "time": self.time, "date": self.date, "item": item, "unit_price": unit_price,
+                   "quantity": quantity, "transaction_type": "service"}
+        if payment_method == "balance":
+            self.set_balance(self.balance + price)
+            self.add_total("balance", price)
+            self.log("balance", {**details, "note": f"Added {item} to balance"})
+        else:
+            self.add_total(payment_method, price)
+            self.log(payment_method, {**details, "payment_method": payment_method})
+        self.log("add_ons", add_on_entry)
+        self.add_ons.append(dict(add_on_entry))
+        return f"Added {item} (₹{price})"
+    
+    def op_payment(self, operation):
+        amount = self.amount(operation)
+        payment_mode = self.method(operation, "payment_mode")
+        is_renewal_payment = False
+        if self.room_data.get("guest") and self.room_data.get("checkin_time"):
+            try:
+                checkin_date = datetime.strptime(self.room_data["checkin_time"].split()[0], "%Y-%m-%d").date()
+                is_renewal_payment = (self.now.date() - checkin_date).days >= 1
+            except ValueError:
+                is_renewal_payment = False
+        self.log(payment_mode, {"room": self.room, "name": self.room_data["guest"]["name"], "amount": amount,
+                                "time": self.time, "date": self.date, "is_renewal": is_renewal_payment,
+                                "transaction_type": "renewal_payment" if is_renewal_payment else "regular_payment"})
+        self.add_total(payment_mode, amount)
+        if self.balance > 0:
+            self.add_total("balance", -min(amount, self.balance))
+        self.set_balance(self.balance - amount)
+        return f"Payment of ₹{amount} received"
+    
+    def op_refund(self, operation):
+        amount = self.amount(operation)
+        refund_method = self.method(operation, "payment_mode", "cash")
+        if abs(self.balance) < amount:
+            raise BatchError(f"Refund amount (₹{amount}) exceeds available balance (₹{abs(self.balance)})")
+        self.log("refunds", {"room": self.room, "name": self.room_data["guest"]["name"], "amount": amount,
+                             "payment_mode": refund_method, "time": self.time, "date": self.date,
+                             "note": "Manual refund", "transaction_type": "manual_refund"})
+        self.set_balance(self.balance + amount)
+        self.add_total("refunds", amount)
+        return f"Refund of ₹{amount} processed"
+    
+    def op_checkout(self, operation):
+        balance = self.balance
+        guest = self.room_data["guest"]
+        message = "Checkout successful"
+        if balance > 0:
+            if not operation.get("settle_later"):
+                raise BatchError("Please clear the balance before checkout")
+            settlement_id = str(uuid.uuid4())
+            self.documents.append((settlements_ref.document(settlement_id), {
+                "id": settlement_id,
+                "guest_name": guest["name"],
+                "guest_mobile": guest["mobile"],
+                "room": self.room,
+                "amount": balance,
+                "checkout_date": self.date,
+                "checkout_time": self.time,
+                "status": "pending",
+                "notes": operation.get("settlement_notes", ""),
+                "photo": guest.get("photo")
+            }))
+            self.add_total("balance", -balance)
+            self.log("balance", {"room": self.room, "name": guest["name"], "amount": -balance,
+                                 "time": self.time, "date": self.date,
+                                 "note": "Converted to 'settle later' during checkout",
+                                 "settlement_id": settlement_id, "transaction_type": "settlement"})
+            self.guests.append((guest["mobile"], guest["name"], guest.get("photo"), {settlement_id: balance}))
+            self.datasets.update(("settlements", "guests"))
+            message = f"Checkout successful. ₹{balance} moved to pending settlements."
+        elif balance < 0 and operation.get("refund_method"):
+            refund_method = self.method(operation, "refund_method")
+            self.log("refunds", {"room": self.room, "name": guest["name"], "amount": -balance,
+                                 "payment_mode": refund_method, "time": self.time, "date": self.date,
+                                 "note": "Checkout refund", "transaction_type": "checkout_refund"})
+            self.add_total("refunds", -balance)
+            message = f"Checkout successful. Refund of ₹{-balance} processed."
+        # The room is reset, so add-ons queued earlier in the batch only go to the log
+        self.add_ons = []
+        vacant = {"status": "vacant", "guest": None, "checkin_time": None, "balance": 0, "add_ons": [],
+                  "renewal_count": 0, "last_renewal_time": None}
+        self.room_data.update(vacant)
+        self.room_updates.update(vacant)
+        return message
+    
+    def commit(self):
+        batch = write_batch()
+        batch.expect(rooms_ref.document(self.room), self.guard)
+        room_updates = dict(self.room_updates)
+        if self.add_ons:
+            room_updates["add_ons"] = firestore.ArrayUnion(self.add_ons)
+        if self.discounts:
+            room_updates["discounts"] = firestore.ArrayUnion(self.discounts)
+        if room_updates:
+            batch.update(rooms_ref.document(self.room), room_updates)
+        for log_type, entries in self.logs.items():
+            batch.update(logs_ref.document(log_type), {"entries": firestore.ArrayUnion(entries)})
+        for total_type, amount in self.totals_delta.items():
+            add_total(batch, total_type, amount)
+        for doc_ref, data in self.documents:
+            batch.set(doc_ref, data)
+        for mobile, name, photo, pending in self.guests:
+            record_guest(batch, mobile, name, photo=photo, pending=pending)
+        batch.commit()
+        renewal_index.upsert(self.room, self.room_data)
+        bump_versions(*sorted(self.datasets))
+
+@app.route("/batch", methods=["POST"])
+def batch_operations():
+    """Apply an ordered list of operations to one room and commit them together
+
+    Body: {"room": "101", "operations": [{"op": "discount" | "add_on" | "payment" |
+    "refund" | "checkout", ...the fields the single-action route takes}, ...]}.
+    Either every operation is written or none is.
+    """
+    try:
+        data_json = request.json
+        room = str(data_json.get("room", ""))
+        operations = data_json.get("operations") or []
+        if not room or not operations:
+            return jsonify(success=False, message="A room and at least one operation are required")
+        if len(operations) > BATCH_MAX_OPERATIONS:
+            return jsonify(success=False, message=f"At most {BATCH_MAX_OPERATIONS} operations per batch")
+        checkouts = [i for i, operation in enumerate(operations) if operation.get("op") == "checkout"]
+        if checkouts and checkouts != [len(operations) - 1]:
+            return jsonify(success=False, message="Checkout must be the last operation")
+        
+        room_data = read_room_for_write(room)
+        if room_data is None:
+            return jsonify(success=False, message="Room not found")
+        
+        room_batch = RoomBatch(room, room_data)
+        for index, operation in enumerate(operations):
+            try:
+                room_batch.apply(index, operation)
+            except BatchError as e:
+                return jsonify(success=False, failed_operation=index,
+                               message=f"Operation {index + 1} ({operation.get('op')}): {str(e)}")
+        
+        room_batch.commit()
+        if checkouts:
+            cleanup_memory()
+        
+        logger.info(f"Batch {room_batch.batch_id} applied {len(operations)} operations to room {room}")
+        return jsonify(success=True, batch_id=room_batch.batch_id, messages=room_batch.messages,
+                       balance=room_batch.balance, message="; ".join(room_batch.messages))
+    except Exception as e:
+        logger.error(f"Error applying batch: {str(e)}")
+        return jsonify(success=False, message=f"Error applying batch: {str(e)}")
+
 @app.route("/get_rooms_only")
+@conditional("rooms")
 def get_rooms_only():
     """Get only rooms data - faster endpoint"""
     try:
-        rooms = get_all_rooms()
-        return jsonify(success=True, rooms=rooms)
+        rooms, info = read_rooms()
+        return jsonify(success=True, rooms=rooms, **freshness(info))
     except Exception as e:
         logger.error(f"Error getting rooms: {str(e)}")
         return jsonify(success=False, message=str(e))
 
 @app.route("/get_logs_only")
+@conditional("logs")
 def get_logs_only():
     """Get only logs data - with limits"""
     try:
         logs = get_all_logs_limited()
-        return jsonify(success=True, logs=logs)
+        return jsonify(success=True, logs=shape_logs(logs), **freshness(get_all_logs_limited.freshness()))
     except Exception as e:
         logger.error(f"Error getting logs: {str(e)}")
         return jsonify(success=False, message=str(e))
 
 @app.route("/get_totals_only")
+@conditional("totals")
 def get_totals_only():
     """Get only totals - fastest endpoint"""
     try:
-        totals = get_totals()
-        return jsonify(success=True, totals=totals)
+        totals, info = read_totals()
+        return jsonify(success=True, totals=totals, **freshness(info))
     except Exception as e:
         logger.error(f"Error getting totals: {str(e)}")
         return jsonify(success=False, message=str(e))
@@ -935,15 +2796,15 @@ def get_data():
         start_time = time.time()
         
         # Use parallel fetching with timeout
-        rooms_future = executor.submit(get_all_rooms)
+        rooms_future = executor.submit(read_rooms)
         logs_future = executor.submit(get_all_logs_limited)
-        totals_future = executor.submit(get_totals)
+        totals_future = executor.submit(read_totals)
         
         try:
-            rooms_data = rooms_future.result(timeout=60)
+            rooms_data, rooms_info = rooms_future.result(timeout=60)
         except TimeoutError:
             logger.error("Timeout fetching rooms")
-            rooms_data = {}
+            rooms_data, rooms_info = {}, None
         
         try:
             logs_data = logs_future.result(timeout=60)
@@ -952,18 +2813,19 @@ def get_data():
             logs_data = {}
         
         try:
-            totals_data = totals_future.result(timeout=30)
+            totals_data, totals_info = totals_future.result(timeout=30)
         except TimeoutError:
             logger.error("Timeout fetching totals")
-            totals_data = {}
+            totals_data, totals_info = {}, None
         
         elapsed = time.time() - start_time
         logger.info(f"Completed get_data request in {elapsed:.2f}s")
         
         return jsonify(
             rooms=rooms_data,
-            logs=logs_data,
-            totals=totals_data
+            logs=shape_logs(logs_data),
+            totals=totals_data,
+            **freshness(rooms_info, get_all_logs_limited.freshness(), totals_info)
         )
     except Exception as e:
         logger.error(f"Error getting data: {str(e)}")
@@ -1020,16 +2882,15 @@ def renew_rent():
         new_balance = room_data["balance"] + price
         renewal_count = data_json.get("renewal_count", 0)
         
-        batch = db.batch()
+        batch = write_batch()
+        batch.expect(rooms_ref.document(room), room_guard(room_data))
         
         batch.update(rooms_ref.document(room), {
             "balance": new_balance,
             "renewal_count": renewal_count
         })
         
-        totals = get_totals()
-        totals["balance"] += price
-        batch.set(totals_ref.document('current_totals'), totals)
+        add_total(batch, "balance", price)
         
         renewal_log = {
             "room": room,
@@ -1051,7 +2912,8 @@ def renew_rent():
         })
         
         batch.commit()
-        invalidate_cache()
+        renewal_index.upsert(room, dict(room_data, renewal_count=renewal_count))
+        bump_versions("rooms", "totals", "logs")
         
         update_last_rent_check()
         
@@ -1061,6 +2923,51 @@ def renew_rent():
         logger.error(f"Error renewing rent: {str(e)}")
         return jsonify(success=False, message=f"Error renewing rent: {str(e)}")
 
+WINDOW_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+def parse_window(text):
+    """Seconds in a window like "2h", "90m" or "1d" (a bare number is hours)"""
+    text = (text or "0").strip().lower()
+    unit = WINDOW_UNITS.get(text[-1:])
+    value = float(text[:-1] if unit else text)
+    if value < 0:
+        raise ValueError(f"Negative window: {text}")
+    return value * (unit or 3600)
+
+@app.route("/renewals_due")
+def renewals_due():
+    """Occupied rooms whose rent is due within ?within= (default 0: overdue only), soonest first"""
+    try:
+        try:
+            window = parse_window(request.args.get("within"))
+        except ValueError:
+            return jsonify(success=False, message="within must look like 30m, 2h or 1d"), 400
+        if not rooms_mirror.ready:
+            rooms, info = read_rooms()
+            # read_rooms builds a new dict every call, so rebuild only when the rooms were
+            # actually read again; local writes keep the index current in between
+            if info is None or renewal_index.source != info:
+                renewal_index.replace(rooms, source=info)
+        now = datetime.now(IST).replace(tzinfo=None)
+        due = []
+        for room, when in renewal_index.due_within(now, timedelta(seconds=window)):
+            seconds_left = int((when - now).total_seconds())
+            due.append({
+                "room": room,
+                "due": when.strftime("%Y-%m-%d %H:%M"),
+                "seconds_left": seconds_left,
+                "overdue": seconds_left <= 0,
+            })
+        return jsonify(
+            success=True,
+            within_seconds=int(window),
+            overdue_count=sum(1 for item in due if item["overdue"]),
+            due=due
+        )
+    except Exception as e:
+        logger.error(f"Error listing renewals due: {str(e)}")
+        return jsonify(success=False, message=f"Error listing renewals due: {str(e)}")
+
 @app.route("/update_checkin_time", methods=["POST"])
 def update_checkin_time():
     try:
@@ -1085,7 +2992,8 @@ def update_checkin_time():
             "last_renewal_time": None
         })
         
-        invalidate_cache()
+        renewal_index.upsert(room, dict(room_data, checkin_time=new_checkin_time, renewal_count=0))
+        bump_versions("rooms")
         
         logger.info(f"Check-in time updated for room {room}: {new_checkin_time}")
         return jsonify(success=True, message="Check-in time updated successfully.")
@@ -1094,6 +3002,7 @@ def update_checkin_time():
         return jsonify(success=False, message=f"Error updating check-in time: {str(e)}")
 
 @app.route("/get_room_numbers", methods=["GET"])
+@conditional("rooms")
 def get_room_numbers():
     try:
         # Use cached rooms data if available
@@ -1144,7 +3053,7 @@ def add_room():
             "last_renewal_time": None
         })
         
-        invalidate_cache()
+        bump_versions("rooms")
         
         logger.info(f"New room {room_number} added")
         return jsonify(success=True, message=f"Room {room_number} added successfully")
@@ -1173,7 +3082,8 @@ def apply_discount():
         if amount <= 0:
             return jsonify(success=False, message="Please provide a valid discount amount.")
         
-        batch = db.batch()
+        batch = write_batch()
+        batch.expect(rooms_ref.document(room), room_guard(room_data))
         
         discount_entry = {
             "amount": amount,
@@ -1194,12 +3104,11 @@ def apply_discount():
         if current_balance > 0:
             new_balance = max(0, current_balance - amount)
             if "balance" in totals:
-                totals["balance"] = max(0, totals["balance"] - amount)
+                add_total(batch, "balance", max(0, totals["balance"] - amount) - totals["balance"])
         else:
             new_balance = current_balance - amount
         
         batch.update(rooms_ref.document(room), {"balance": new_balance})
-        batch.set(totals_ref.document('current_totals'), totals)
         
         discount_log = {
             "room": room,
@@ -1215,7 +3124,7 @@ def apply_discount():
         })
         
         batch.commit()
-        invalidate_cache()
+        bump_versions("rooms", "totals", "logs")
         
         logger.info(f"Discount of ₹{amount} applied to room {room}, reason: {reason}")
         
@@ -1233,22 +3142,24 @@ def transfer_room():
         new_price = data_json.get("new_price")
         is_ac = data_json.get("is_ac", False)
         
-        rooms_dict = get_all_rooms()
+        old_room_data = read_room_for_write(old_room)
+        destination = read_room_for_write(new_room)
         
-        if old_room not in rooms_dict or new_room not in rooms_dict:
+        if old_room_data is None or destination is None:
             return jsonify(success=False, message="One or both rooms do not exist.")
             
-        if rooms_dict[old_room]["status"] != "occupied":
+        if old_room_data["status"] != "occupied":
             return jsonify(success=False, message="Source room is not occupied.")
             
-        if rooms_dict[new_room]["status"] != "vacant":
+        if destination["status"] != "vacant":
             return jsonify(success=False, message="Destination room is not vacant.")
         
-        guest_name = rooms_dict[old_room]["guest"]["name"]
-        guest_mobile = rooms_dict[old_room]["guest"]["mobile"]
-        checkin_time = rooms_dict[old_room]["checkin_time"]
+        guest_name = old_room_data["guest"]["name"]
+        guest_mobile = old_room_data["guest"]["mobile"]
+        checkin_time = old_room_data["checkin_time"]
         
-        new_room_data = rooms_dict[old_room].copy()
+        # The guest dict is changed below, so nothing else may share it
+        new_room_data = copy.deepcopy(old_room_data)
         
         if new_price:
             new_room_data["guest"]["price"] = int(new_price)
@@ -1256,7 +3167,10 @@ def transfer_room():
         if new_room >= "202" and new_room <= "205":
             new_room_data["guest"]["isAC"] = is_ac
         
-        batch = db.batch()
+        batch = write_batch()
+        batch.expect(rooms_ref.document(old_room), room_guard(old_room_data))
+        # A full overwrite, so it must not land on a room someone checked into meanwhile
+        batch.expect(rooms_ref.document(new_room), {"status": "vacant"})
         
         batch.set(rooms_ref.document(new_room), new_room_data)
         
@@ -1286,11 +3200,13 @@ def transfer_room():
                         
                         if updated:
                             logs_ref.document(log_type).set({"entries": entries})
+                
+                bump_versions("logs")
             except Exception as e:
                 logger.error(f"Error updating logs: {str(e)}")
         
         # Start log updates in background
-        threading.Thread(target=update_logs_async, daemon=True).start()
+        tenants.spawn(update_logs_async)
         
         batch.update(rooms_ref.document(old_room), {
             "status": "vacant",
@@ -1326,7 +3242,9 @@ def transfer_room():
         })
         
         batch.commit()
-        invalidate_cache()
+        renewal_index.remove(old_room)
+        renewal_index.upsert(new_room, new_room_data)
+        bump_versions("rooms", "logs")
         
         logger.info(f"Guest {guest_name} transferred from Room {old_room} to Room {new_room}")
         
@@ -1339,6 +3257,340 @@ def transfer_room():
         logger.error(f"Error transferring room: {str(e)}", exc_info=True)
         return jsonify(success=False, message=f"Error transferring room: {str(e)}")
 
+# Totals reconciliation: current_totals against the logs and rooms it summarises.
+# A checkpoint of the ledger sums is stored once a day and kept in memory between
+# runs, so each run only adds up the log entries written since the previous one.
+# That saves CPU, not Firestore reads: the ledger logs are whole-array documents,
+# so every run still downloads each of them in full. Set RECONCILE_INTERVAL with
+# that in mind.
+RECONCILE_INTERVAL = int(os.environ.get('RECONCILE_INTERVAL', '0'))
+RECONCILE_AUTO_CORRECT = os.environ.get('RECONCILE_AUTO_CORRECT', '0') == '1'
+_reconcile_state = tenants.PerTenant(lambda tenant: {"checkpoint": None, "stored_day": None, "report": None},
+                                     "reconcile state")
+_reconcile_lock = threading.Lock()
+
+def latest_totals_checkpoint():
+    """Newest checkpoint: the one from the previous run in this process, else the newest stored"""
+    if _reconcile_state["checkpoint"] is None:
+        query = totals_checkpoints_ref.order_by("day", direction="DESCENDING").limit(1)
+        for doc in query.stream(timeout=READ_TIMEOUT):
+            _reconcile_state["checkpoint"] = doc.to_dict()
+            _reconcile_state["stored_day"] = doc.id
+    return _reconcile_state["checkpoint"]
+
+def read_reconcile_snapshot(room_ids, transaction=None):
+    """Ledger logs, current_totals and rooms from a single read, so they agree with each other"""
+    kinds = {logs_ref.document(log_type).path: "logs" for log_type in reconcile.LEDGER_LOGS}
+    kinds[totals_ref.document('current_totals').path] = "totals"
+    kinds.update((rooms_ref.document(room).path, "rooms") for room in room_ids)
+    refs = [db.document(path) for path in kinds]
+    logs, totals, rooms = {}, {}, {}
+    for doc in db.get_all(refs, transaction=transaction, timeout=READ_TIMEOUT):
+        if not doc.exists:
+            continue
+        kind = kinds.get(doc.reference.path)
+        if kind == "logs":
+            logs[doc.id] = doc.to_dict().get("entries", [])
+        elif kind == "totals":
+            totals = doc.to_dict()
+        elif kind == "rooms":
+            rooms[doc.id] = doc.to_dict()
+    return logs, totals, rooms
+
+def reconcile_totals(correct=False):
+    """Drift report for current_totals; with correct=True drifted totals are set to the expected values
+
+    Reads every ledger log document in full each run; the checkpoint only limits
+    which of the downloaded entries are summed.
+    """
+    with _reconcile_lock:
+        checkpoint = latest_totals_checkpoint()
+        room_ids = list(read_rooms()[0])
+        
+        def compare(transaction=None):
+            logs, totals, rooms = read_reconcile_snapshot(room_ids, transaction)
+            base = checkpoint if checkpoint and reconcile.checkpoint_holds(checkpoint, logs) else None
+            sums, positions, scanned = reconcile.ledger_sums(logs, base)
+            expected = dict(sums, balance=reconcile.outstanding_balance(rooms))
+            report = reconcile.drift_report(totals, expected, (checkpoint or {}).get("drift"))
+            drift = reconcile.drifted(report)
+            if transaction is not None and drift:
+                # Inside the transaction, so no write lands between the read and this update
+                transaction.update(totals_ref.document('current_totals'),
+                                   {bucket: row["expected"] for bucket, row in drift.items()})
+            return base, sums, positions, scanned, report, drift
+        
+        if correct:
+            result = firestore.transactional(compare)(db.transaction())
+        else:
+            result = firestore_breaker.call(compare)
+        base, sums, positions, scanned, report, drift = result
+        
+        now = datetime.now(IST)
+        corrected = sorted(drift) if correct else []
+        if corrected:
+            bump_versions("totals")
+        if drift:
+            summary = ", ".join(f"{bucket} {row['drift']:+}" for bucket, row in drift.items())
+            logger.warning(f"Totals drift{' (corrected)' if corrected else ''}: {summary}")
+        
+        # The next run continues from here; the first run of each day also stores it
+        _reconcile_state["checkpoint"] = {
+            "day": now.strftime("%Y-%m-%d"),
+            "sums": sums,
+            "positions": positions,
+            "totals": {bucket: row["expected"] for bucket, row in report.items()},
+            "drift": {bucket: 0 if bucket in corrected else row["drift"] for bucket, row in report.items()},
+            "verified_at": now.strftime("%Y-%m-%d %H:%M:%S"),
+        }
+        if _reconcile_state["stored_day"] != _reconcile_state["checkpoint"]["day"]:
+            totals_checkpoints_ref.document(_reconcile_state["checkpoint"]["day"]).set(_reconcile_state["checkpoint"])
+            _reconcile_state["stored_day"] = _reconcile_state["checkpoint"]["day"]
+        
+        _reconcile_state["report"] = {
+            "checked_at": now.strftime("%Y-%m-%d %H:%M:%S"),
+            "checkpoint": checkpoint["day"] if base else None,
+            "entries_scanned": scanned,
+            "buckets": report,
+            "drift": {bucket: row["drift"] for bucket, row in drift.items()},
+            "corrected": corrected,
+        }
+        return _reconcile_state["report"]
+
+def reconcile_health():
+    """Last reconciliation result for /health"""
+    report = _reconcile_state["report"]
+    if report is None:
+        return None
+    return {key: report[key] for key in ("checked_at", "checkpoint", "drift", "corrected")}
+
+def reconcile_loop():
+    """Background reconciliation every RECONCILE_INTERVAL seconds"""
+    while True:
+        time.sleep(RECONCILE_INTERVAL)
+        try:
+            reconcile_totals(correct=RECONCILE_AUTO_CORRECT)
+        except Exception as e:
+            logger.error(f"Error reconciling totals: {str(e)}")
+
+@app.route("/totals/reconcile", methods=["GET", "POST"])
+def reconcile_totals_route():
+    """Per-bucket drift of current_totals against the logs; POST {"correct": true} also fixes it"""
+    try:
+        correct = request.method == "POST" and bool((request.get_json(silent=True) or {}).get("correct"))
+        return jsonify(success=True, **reconcile_totals(correct=correct))
+    except Exception as e:
+        logger.error(f"Error reconciling totals: {str(e)}")
+        return jsonify(success=False, message=f"Error reconciling totals: {str(e)}")
+
+@app.route("/journal/conflicts")
+def journal_conflicts():
+    """Journaled writes Firestore never got: conflicts with newer writes and rejections"""
+    try:
+        if write_journal is None:
+            return jsonify(success=True, conflicts=[])
+        return jsonify(success=True, conflicts=write_journal.conflicts())
+    except Exception as e:
+        logger.error(f"Error listing journal conflicts: {str(e)}")
+        return jsonify(success=False, message=f"Error listing journal conflicts: {str(e)}")
+
+@app.route("/journal/conflicts/<entry>", methods=["POST"])
+def resolve_journal_conflict(entry):
+    """{"action": "retry"} queues the writes again (guards checked again); "discard" drops them"""
+    try:
+        if write_journal is None:
+            return jsonify(success=False, message="The write journal is off")
+        action = (request.get_json(silent=True) or {}).get("action")
+        if action not in ("retry", "discard"):
+            return jsonify(success=False, message="action must be retry or discard"), 400
+        if not write_journal.resolve(entry, action):
+            return jsonify(success=False, message=f"No unresolved journal entry {entry}"), 404
+        return jsonify(success=True, message=f"Journal entry {entry}: {action}")
+    except Exception as e:
+        logger.error(f"Error resolving journal entry {entry}: {str(e)}")
+        return jsonify(success=False, message=f"Error resolving journal entry: {str(e)}")
+
+# Expense ledger: one document per expense next to the logs/expenses array, so
+# expenses can be queried by date, category, payment method and type, plus a
+# per-month summary document kept current with Increment on every write
+EXPENSE_PAGE_SIZE = 50
+EXPENSE_PAGE_MAX = 200
+# Each combination of these has a composite index with sort_key (firestore.indexes.json)
+EXPENSE_FILTERS = ("category", "payment_method", "expense_type")
+_expense_ledger = tenants.PerTenant(lambda tenant: {"ready": False}, "expense ledger state")
+_expense_backfill_lock = threading.Lock()
+
+def expense_document(expense_id, entry):
+    """Ledger document for a log entry; sort_key orders by date, time, then id"""
+    document = {field: entry.get(field) for field in
+                ("date", "time", "category", "description", "amount", "payment_method")}
+    document["expense_type"] = reconcile.expense_type(entry)
+    document["month"] = (entry.get("date") or "")[:7]
+    document["sort_key"] = f"{entry.get('date', '')} {entry.get('time') or '00:00'} {expense_id}"
+    return document
+
+def expense_summary_delta(entries):
+    """{month: nested Increment map} to add these entries to the monthly summaries"""
+    months = {}
+    for entry in entries:
+        month = (entry.get("date") or "")[:7]
+        amount = entry.get("amount") or 0
+        summary = months.setdefault(month, {"month": month, "total": 0, "count": 0, "categories": {},
+                                            "expense_types": {}, "payment_methods": {}})
+        summary["total"] += amount
+        summary["count"] += 1
+        category = summary["categories"].setdefault(entry.get("category") or "other", {"amount": 0, "count": 0})
+        category["amount"] += amount
+        category["count"] += 1
+        name = reconcile.expense_type(entry)
+        summary["expense_types"][name] = summary["expense_types"].get(name, 0) + amount
+        name = entry.get("payment_method") or "unknown"
+        summary["payment_methods"][name] = summary["payment_methods"].get(name, 0) + amount
+    
+    def increments(value):
+        if isinstance(value, dict):
+            return {key: increments(item) for key, item in value.items()}
+        return value if isinstance(value, str) else firestore.Increment(value)
+    return {month: increments(summary) for month, summary in months.items()}
+
+def backfill_expense_ledger():
+    """Copy expenses logged before the ledger existed into it, once"""
+    with _expense_backfill_lock:
+        try:
+            marker_ref = settings_ref.document('expense_ledger')
+            marker = marker_ref.get(timeout=READ_TIMEOUT)
+            if marker.exists and marker.to_dict().get("backfilled"):
+                _expense_ledger["ready"] = True
+                return
+            
+            log_doc = logs_ref.document("expenses").get(timeout=READ_TIMEOUT)
+            entries = log_doc.to_dict().get("entries", []) if log_doc.exists else []
+            legacy = [entry for entry in entries if not entry.get("expense_id")]
+            
+            # Ledger documents first, with ids derived from the entry so a rerun
+            # after a crash overwrites instead of duplicating
+            batch = db.batch()
+            pending = 0
+            for entry in legacy:
+                digest = hashlib.sha1(json.dumps(entry, sort_keys=True, default=str).encode()).hexdigest()[:20]
+                batch.set(expenses_ref.document(f"legacy-{digest}"), expense_document(f"legacy-{digest}", entry))
+                pending += 1
+                if pending >= 400:
+                    batch.commit()
+                    batch = db.batch()
+                    pending = 0
+            if pending:
+                batch.commit()
+            
+            # Summaries and the marker in one transaction that first checks the
+            # marker, so another instance backfilling at the same time can't
+            # add the same entries to the summaries twice
+            @firestore.transactional
+            def claim_in_transaction(transaction):
+                marker = marker_ref.get(transaction=transaction)
+                if marker.exists and marker.to_dict().get("backfilled"):
+                    return False
+                for month, delta in expense_summary_delta(legacy).items():
+                    transaction.set(expense_summaries_ref.document(month), delta, merge=True)
+                transaction.set(marker_ref, {"backfilled": True, "legacy_entries": len(legacy),
+                                             "completed_at": datetime.now(IST).strftime("%Y-%m-%d %H:%M:%S")})
+                return True
+            
+            claimed = claim_in_transaction(db.transaction())
+            _expense_ledger["ready"] = True
+            bump_versions("expenses")
+            if claimed:
+                logger.info(f"Expense ledger backfilled with {len(legacy)} entries")
+        except Exception as e:
+            logger.error(f"Error backfilling expense ledger: {str(e)}")
+
+def query_expenses(start_date=None, end_date=None, filters=None, limit=None, cursor=None):
+    """Newest-first ledger query; sort_key starts with the date, so it carries the date range too"""
+    query = expenses_ref
+    for field, value in (filters or {}).items():
+        query = query.where(field, "==", value)
+    if start_date:
+        query = query.where("sort_key", ">=", start_date)
+    if end_date:
+        query = query.where("sort_key", "<", f"{end_date}~")
+    query = query.order_by("sort_key", direction="DESCENDING")
+    if cursor:
+        query = query.start_after([cursor])
+    if limit:
+        query = query.limit(limit)
+    for expense_doc in query.stream(timeout=READ_TIMEOUT):
+        expense = expense_doc.to_dict()
+        expense["expense_id"] = expense_doc.id
+        yield expense
+
+@app.route("/expenses")
+@conditional("expenses")
+def get_expenses():
+    """One page of expenses, newest first (?start_date, end_date, category, payment_method, expense_type, limit, cursor)"""
+    try:
+        args = request.args
+        for field in ("start_date", "end_date"):
+            if args.get(field):
+                try:
+                    datetime.strptime(args[field], "%Y-%m-%d")
+                except ValueError:
+                    return jsonify(success=False, message="Invalid date format. Use YYYY-MM-DD")
+        try:
+            limit = min(int(args.get("limit", EXPENSE_PAGE_SIZE)), EXPENSE_PAGE_MAX)
+        except ValueError:
+            return jsonify(success=False, message="Invalid limit")
+        if limit <= 0:
+            return jsonify(success=False, message="Invalid limit")
+        filters = {field: args[field] for field in EXPENSE_FILTERS if args.get(field)}
+        
+        # One extra row says whether there is another page without a count query
+        expenses = list(query_expenses(args.get("start_date"), args.get("end_date"), filters,
+                                       limit=limit + 1, cursor=args.get("cursor")))
+        next_cursor = expenses[limit - 1]["sort_key"] if len(expenses) > limit else None
+        expenses = expenses[:limit]
+        for expense in expenses:
+            expense.pop("sort_key", None)
+        return jsonify(success=True, expenses=expenses, next_cursor=next_cursor,
+                       ledger_ready=_expense_ledger["ready"])
+    except Exception as e:
+        logger.error(f"Error querying expenses: {str(e)}")
+        return jsonify(success=False, message=f"Error querying expenses: {str(e)}")
+
+@app.route("/expenses/summary")
+@conditional("expenses")
+def get_expense_summary():
+    """Per-month expense summaries for ?start_month=YYYY-MM&end_month=YYYY-MM, plus their sum"""
+    try:
+        start_month = request.args.get("start_month") or datetime.now(IST).strftime("%Y-%m")
+        end_month = request.args.get("end_month") or start_month
+        try:
+            datetime.strptime(start_month, "%Y-%m")
+            datetime.strptime(end_month, "%Y-%m")
+        except ValueError:
+            return jsonify(success=False, message="Invalid month. Use YYYY-MM")
+        
+        query = (expense_summaries_ref.where("month", ">=", start_month)
+                 .where("month", "<=", end_month).order_by("month"))
+        months = [summary_doc.to_dict() for summary_doc in query.stream(timeout=READ_TIMEOUT)]
+        
+        combined = {"total": 0, "count": 0, "categories": {}, "expense_types": {}, "payment_methods": {}}
+        for summary in months:
+            combined["total"] += summary.get("total", 0)
+            combined["count"] += summary.get("count", 0)
+            for category, values in (summary.get("categories") or {}).items():
+                target = combined["categories"].setdefault(category, {"amount": 0, "count": 0})
+                target["amount"] += values.get("amount", 0)
+                target["count"] += values.get("count", 0)
+            for field in ("expense_types", "payment_methods"):
+                for name, amount in (summary.get(field) or {}).items():
+                    combined[field][name] = combined[field].get(name, 0) + amount
+        
+        return jsonify(success=True, start_month=start_month, end_month=end_month, months=months,
+                       combined=combined, ledger_ready=_expense_ledger["ready"])
+    except Exception as e:
+        logger.error(f"Error loading expense summary: {str(e)}")
+        return jsonify(success=False, message=f"Error loading expense summary: {str(e)}")
+
 @app.route("/add_expense", methods=["POST"])
 def add_expense():
     try:
@@ -1348,12 +3600,17 @@ def add_expense():
         description = data_json.get("description")
         amount = int(data_json.get("amount", 0))
         payment_method = data_json.get("payment_method", "cash")
-        expense_type = data_json.get("type", "transaction")
+        expense_type = data_json.get("type", reconcile.DEFAULT_EXPENSE_TYPE)
         
         if not date or not category or not description or amount <= 0 or not payment_method:
             return jsonify(success=False, message="All fields are required")
+        try:
+            datetime.strptime(date, "%Y-%m-%d")
+        except ValueError:
+            return jsonify(success=False, message="Invalid date format. Use YYYY-MM-DD")
         
-        batch = db.batch()
+        batch = write_batch()
+        expense_id = str(uuid.uuid4())
         
         expense_entry = {
             "date": date,
@@ -1362,20 +3619,22 @@ def add_expense():
             "amount": amount,
             "payment_method": payment_method,
             "expense_type": expense_type,
-            "time": datetime.now(IST).strftime("%H:%M")
+            "time": datetime.now(IST).strftime("%H:%M"),
+            "expense_id": expense_id
         }
         
         batch.update(logs_ref.document("expenses"), {
             "entries": firestore.ArrayUnion([expense_entry])
         })
+        batch.set(expenses_ref.document(expense_id), expense_document(expense_id, expense_entry))
+        for month, delta in expense_summary_delta([expense_entry]).items():
+            batch.set(expense_summaries_ref.document(month), delta, merge=True)
         
         if expense_type == "transaction":
-            totals = get_totals()
-            totals["expenses"] += amount
-            batch.set(totals_ref.document('current_totals'), totals)
+            add_total(batch, "expenses", amount)
         
         batch.commit()
-        invalidate_cache()
+        bump_versions("totals", "logs", "expenses")
         
         logger.info(f"Expense added: {description}, Category: {category}, Amount: ₹{amount}, Type: {expense_type}")
         
@@ -1405,16 +3664,24 @@ def get_reports():
         refund_logs = [log for log in all_logs.get("refunds", []) if start <= datetime.strptime(log.get("date", "1970-01-01"), "%Y-%m-%d") < end]
         renewal_logs = [log for log in all_logs.get("renewals", []) if start <= datetime.strptime(log.get("date", "1970-01-01"), "%Y-%m-%d") < end]
         
-        expense_logs = all_logs.get("expenses", [])
-        filtered_expense_logs = [log for log in expense_logs if start <= datetime.strptime(log.get("date", "1970-01-01"), "%Y-%m-%d") < end]
+        if _expense_ledger["ready"]:
+            # The whole range from the ledger, not just what is left of the log tail
+            filtered_expense_logs = list(query_expenses(start_date, end_date))
+            for log in filtered_expense_logs:
+                log.pop("sort_key", None)
+        else:
+            expense_logs = all_logs.get("expenses", [])
+            filtered_expense_logs = [log for log in expense_logs if start <= datetime.strptime(log.get("date", "1970-01-01"), "%Y-%m-%d") < end]
+        # Untyped legacy entries get the default type, as in the ledger and reconciliation
+        filtered_expense_logs = [{**log, "expense_type": reconcile.expense_type(log)} for log in filtered_expense_logs]
         
         cash_total = sum(log["amount"] for log in cash_logs)
         online_total = sum(log["amount"] for log in online_logs)
         addon_total = sum(log["price"] for log in add_on_logs)
         refund_total = sum(log["amount"] for log in refund_logs)
         
-        transaction_expense_total = sum(log["amount"] for log in filtered_expense_logs if log.get("expense_type") == "transaction")
-        report_expense_total = sum(log["amount"] for log in filtered_expense_logs if log.get("expense_type") == "report")
+        transaction_expense_total = sum(log["amount"] for log in filtered_expense_logs if log["expense_type"] == "transaction")
+        report_expense_total = sum(log["amount"] for log in filtered_expense_logs if log["expense_type"] == "report")
         total_expense = transaction_expense_total + report_expense_total
         
         checkins = 0
@@ -1440,21 +3707,235 @@ def get_reports():
             expense_total=total_expense,
             transaction_expense_total=transaction_expense_total,
             report_expense_total=report_expense_total,
-            total_revenue=cash_total + online_total - refund_total - transaction_expense_total,
+            total_revenue=reconcile.net_revenue(cash_total, online_total, refund_total, transaction_expense_total),
             checkins=checkins,
             renewals=renewals,
-            cash_logs=cash_logs,
-            online_logs=online_logs,
-            addon_logs=add_on_logs,
-            refund_logs=refund_logs,
-            renewal_logs=renewal_logs,
-            expense_logs=filtered_expense_logs
+            **shape_logs({
+                "cash_logs": cash_logs,
+                "online_logs": online_logs,
+                "addon_logs": add_on_logs,
+                "refund_logs": refund_logs,
+                "renewal_logs": renewal_logs,
+                "expense_logs": filtered_expense_logs
+            })
         )
     
     except Exception as e:
         logger.error(f"Error generating report: {str(e)}")
         return jsonify(success=False, message=f"Error generating report: {str(e)}")
 
+# Log types offered by /reports/export, in the order rows for the same minute are written
+EXPORT_LOG_TYPES = ["cash", "online", "add_ons", "refunds", "renewals", "booking_payments",
+                    "discounts", "balance", "expenses", "room_shifts"]
+EXPORT_DEFAULT_TYPES = ["cash", "online", "expenses", "refunds"]
+EXPORT_HEADER = ["Date", "Time", "Type", "Room", "Guest Name", "Amount", "Payment Method",
+                 "Category", "Description", "Item", "Note"]
+EXPORT_FORMATS = {
+    "csv": (exports.csv_chunks, "text/csv; charset=utf-8"),
+    "xlsx": (exports.xlsx_chunks, "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"),
+}
+
+def _export_row(log_type, entry):
+    """One export row from a log entry; the logs share most field names but not all"""
+    amount = entry.get("amount", entry.get("price", ""))
+    method = entry.get("payment_method") or entry.get("payment_mode") or (
+        log_type if log_type in ("cash", "online") else "")
+    return (entry.get("date", ""), entry.get("time", ""), log_type, entry.get("room", ""),
+            entry.get("name") or entry.get("guest_name", ""), amount, method,
+            entry.get("category", ""), entry.get("description", ""), entry.get("item", ""),
+            entry.get("note", ""))
+
+def _export_rows(log_types, start_date, end_date):
+    """Rows of every log in log_types dated start_date..end_date, one log after another
+
+    A log is fetched only once the previous one has been written out, so a single
+    log document is held at a time however many types are exported. Rows within
+    a log are in date and time order; the type column tells the logs apart.
+    """
+    for log_type in log_types:
+        try:
+            log_doc = firestore_breaker.call(logs_ref.document(log_type).get, timeout=READ_TIMEOUT)
+        except Exception as e:
+            # Headers are already sent by now, so the client just sees a truncated file
+            logger.error(f"Error reading {log_type} log for export: {str(e)}")
+            raise
+        if not log_doc.exists:
+            continue
+        rows = [_export_row(log_type, entry) for entry in log_doc.to_dict().get('entries', [])
+                if start_date <= entry.get("date", "") <= end_date]
+        del log_doc
+        # Entries are appended as they happen, but backdated expenses and refunds are not
+        rows.sort(key=lambda row: (row[0], row[1]))
+        yield from rows
+
+@app.route("/reports/export")
+def export_report():
+    """Stream the logs for ?start_date=..&end_date=.. as CSV or XLSX (?format=, ?types=cash,online,..)"""
+    try:
+        start_date = request.args.get("start_date")
+        end_date = request.args.get("end_date")
+        if not start_date or not end_date:
+            return jsonify(success=False, message="Start and end dates are required.")
+        datetime.strptime(start_date, "%Y-%m-%d")
+        datetime.strptime(end_date, "%Y-%m-%d")
+        
+        export_format = request.args.get("format", "csv").lower()
+        if export_format not in EXPORT_FORMATS:
+            return jsonify(success=False, message=f"Unsupported export format: {export_format}")
+        log_types = [t for t in request.args.get("types", "").split(",") if t] or EXPORT_DEFAULT_TYPES
+        unknown = [t for t in log_types if t not in EXPORT_LOG_TYPES]
+        if unknown:
+            return jsonify(success=False, message=f"Unknown log types: {', '.join(unknown)}")
+        
+        write, mimetype = EXPORT_FORMATS[export_format]
+        # Both writers yield the header before pulling the first row, and the rows
+        # are read lazily, so the download starts before any log is fetched
+        chunks = write(EXPORT_HEADER, _export_rows(log_types, start_date, end_date))
+        filename = f"report_{start_date}_to_{end_date}.{export_format}"
+        return Response(chunks, mimetype=mimetype, headers={
+            "Content-Disposition": f'attachment; filename="{filename}"',
+            "Cache-Control": "no-store",
+        })
+    except Exception as e:
+        logger.error(f"Error exporting report: {str(e)}")
+        return jsonify(success=False, message=f"Error exporting report: {str(e)}")
+
+@app.route("/analytics")
+@conditional("logs", "rooms")
+def get_analytics():
+    """Chart-ready series for the analytics tab over ?start_date=..&end_date=.."""
+    try:
+        if not analytics.available:
+            return jsonify(success=False, message="Analytics backend unavailable (numpy not installed)")
+        start_date = request.args.get("start_date")
+        end_date = request.args.get("end_date")
+        if not start_date or not end_date:
+            return jsonify(success=False, message="Start and end dates are required.")
+        start = datetime.strptime(start_date, "%Y-%m-%d").date()
+        end = datetime.strptime(end_date, "%Y-%m-%d").date()
+        if end < start:
+            return jsonify(success=False, message="Start date must be before end date")
+        
+        rooms, _ = read_rooms()
+        checkins = 0
+        for room_info in rooms.values():
+            checkin_time = room_info.get("checkin_time")
+            if checkin_time and start_date <= checkin_time.split(" ")[0] <= end_date:
+                checkins += 1
+        
+        series = analytics.chart_series(get_log_columns(), start, end, checkins=checkins)
+        return jsonify(success=True, start_date=start_date, end_date=end_date,
+                       **series, **freshness(get_log_columns.freshness()))
+    except Exception as e:
+        logger.error(f"Error generating analytics: {str(e)}")
+        return jsonify(success=False, message=f"Error generating analytics: {str(e)}")
+
+# Booking calendar: the booking half of each month's page is cached per month and
+# dropped by this process's booking writes whose dates show on that page; a peer's
+# booking change drops every month (COARSE_DATASET_CACHES)
+CALENDAR_TTL = 3600
+
+def calendar_range(month):
+    """First and last day on the calendar page for YYYY-MM: whole Sunday-to-Saturday weeks"""
+    first = datetime.strptime(month, "%Y-%m").date()
+    last = (first.replace(day=28) + timedelta(days=4)).replace(day=1) - timedelta(days=1)
+    return (first - timedelta(days=(first.weekday() + 1) % 7),
+            last + timedelta(days=(5 - last.weekday()) % 7))
+
+def calendar_months(*bookings):
+    """Months whose calendar page shows at least one night of any of these bookings"""
+    months = set()
+    for booking in bookings:
+        try:
+            check_in = datetime.strptime(booking["check_in_date"], "%Y-%m-%d").date()
+            check_out = datetime.strptime(booking["check_out_date"], "%Y-%m-%d").date()
+        except (KeyError, TypeError, ValueError):
+            continue
+        # A page also shows up to six days of the months either side
+        month = (check_in - timedelta(days=7)).replace(day=1)
+        while month <= check_out + timedelta(days=7):
+            start, end = calendar_range(month.strftime("%Y-%m"))
+            if check_in <= end and check_out > start:
+                months.add(month.strftime("%Y-%m"))
+            month = (month + timedelta(days=32)).replace(day=1)
+    return months
+
+def invalidate_booking_calendar(*bookings):
+    for month in calendar_months(*bookings):
+        get_booking_calendar.invalidate(month)
+
+@cached(ttl=CALENDAR_TTL)
+def get_booking_calendar(month):
+    """Booking ids and per-room booking status for each day on one month's calendar page"""
+    return firestore_breaker.call(_load_booking_calendar, month)
+
+def _load_booking_calendar(month):
+    start, end = calendar_range(month)
+    start_str, end_str = start.isoformat(), end.isoformat()
+    days = {(start + timedelta(days=offset)).isoformat(): {"bookings": [], "rooms": {}}
+            for offset in range((end - start).days + 1)}
+    bookings = {}
+    try:
+        # The check-out day is not a night of the stay, so this skips everything that
+        # ended before the page; the check-in bound is applied below
+        query = bookings_ref.where("check_out_date", ">", start_str)
+        for booking_doc in query.stream(timeout=READ_TIMEOUT):
+            booking = booking_doc.to_dict()
+            check_in = booking.get("check_in_date") or ""
+            if not check_in or check_in > end_str:
+                continue
+            booking["booking_id"] = booking_doc.id
+            bookings[booking_doc.id] = Booking.from_dict(booking)
+            status = booking.get("status")
+            day = max(datetime.strptime(check_in, "%Y-%m-%d").date(), start)
+            last = min(datetime.strptime(booking["check_out_date"], "%Y-%m-%d").date() - timedelta(days=1), end)
+            while day <= last:
+                cell = days[day.isoformat()]
+                cell["bookings"].append(booking_doc.id)
+                if status != "cancelled":
+                    cell["rooms"][booking.get("room")] = "checked_in" if status == "checked_in" else "booked"
+                day += timedelta(days=1)
+    except Exception as e:
+        logger.error(f"Error loading booking calendar for {month}: {str(e)}")
+        raise
+    return {"start": start_str, "end": end_str, "days": days, "bookings": bookings}
+
+@app.route("/booking_calendar")
+@conditional("bookings", "rooms")
+def booking_calendar():
+    """Per-day, per-room occupancy for the calendar page of ?month=YYYY-MM"""
+    try:
+        month = request.args.get("month") or datetime.now(IST).strftime("%Y-%m")
+        try:
+            calendar_range(month)
+        except ValueError:
+            return jsonify(success=False, message="Invalid month. Use YYYY-MM")
+        calendar = get_booking_calendar(month)
+        
+        # Current stays change with every check-in and checkout, so they are laid
+        # over the cached bookings per request instead of invalidating it
+        rooms, rooms_info = read_rooms()
+        today = datetime.now(IST).strftime("%Y-%m-%d")
+        stays = {}
+        for room_id, room_info in rooms.items():
+            checkin_time = room_info.get("checkin_time")
+            if room_info.get("status") == "occupied" and checkin_time:
+                stays[room_id] = checkin_time.split(" ")[0]
+        
+        days = {}
+        for day, cell in calendar["days"].items():
+            occupancy = {room_id: "occupied" for room_id, since in stays.items() if since <= day <= today}
+            occupancy.update(cell["rooms"])
+            days[day] = {"bookings": cell["bookings"], "rooms": occupancy}
+        
+        room_ids = sorted(rooms, key=lambda r: (int(r) if r.isdigit() else float('inf'), r))
+        return jsonify(success=True, month=month, start=calendar["start"], end=calendar["end"],
+                       rooms=room_ids, days=days, bookings=calendar["bookings"],
+                       **freshness(get_booking_calendar.freshness(month), rooms_info))
+    except Exception as e:
+        logger.error(f"Error building booking calendar: {str(e)}")
+        return jsonify(success=False, message=f"Error building booking calendar: {str(e)}")
+
 @app.route("/get_bookings", methods=["GET"])
 def get_bookings():
     try:
@@ -1502,7 +3983,7 @@ def create_booking():
             "guest_count": int(booking_data.get("guest_count", 1))
         }
         
-        batch = db.batch()
+        batch = write_batch()
         
         paid_amount = int(booking_data.get("paid_amount", 0))
         if paid_amount > 0:
@@ -1537,15 +4018,15 @@ def create_booking():
                 "entries": firestore.ArrayUnion([booking_payment])
             })
             
-            totals = get_totals()
-            totals[payment_method] += paid_amount
-            totals["advance_bookings"] += paid_amount
-            batch.set(totals_ref.document('current_totals'), totals)
+            add_total(batch, payment_method, paid_amount)
+            add_total(batch, "advance_bookings", paid_amount)
         
         batch.set(bookings_ref.document(booking_id), booking)
+        record_guest(batch, booking["guest_mobile"], booking["guest_name"], photo=booking["photo_path"])
         batch.commit()
         
-        invalidate_cache()
+        bump_versions("bookings", "totals", "logs", "guests")
+        invalidate_booking_calendar(booking)
         
         logger.info(f"Booking created: {booking_id} for {booking['guest_name']}")
         return jsonify(success=True, booking_id=booking_id, message="Booking created successfully")
@@ -1565,7 +4046,8 @@ def update_booking():
             return jsonify(success=False, message="Invalid booking ID")
         
         booking = booking_doc.to_dict()
-        batch = db.batch()
+        previous = dict(booking)
+        batch = write_batch()
         
         new_payment_amount = int(booking_data.get("new_payment", 0))
         if new_payment_amount > 0:
@@ -1600,10 +4082,8 @@ def update_booking():
                 "entries": firestore.ArrayUnion([booking_payment])
             })
             
-            totals = get_totals()
-            totals[payment_method] += new_payment_amount
-            totals["advance_bookings"] += new_payment_amount
-            batch.set(totals_ref.document('current_totals'), totals)
+            add_total(batch, payment_method, new_payment_amount)
+            add_total(batch, "advance_bookings", new_payment_amount)
             
             booking["paid_amount"] += new_payment_amount
             booking["balance"] = booking["total_amount"] - booking["paid_amount"]
@@ -1622,9 +4102,14 @@ def update_booking():
             booking["balance"] = booking["total_amount"] - booking["paid_amount"]
             
         batch.set(bookings_ref.document(booking_id), booking)
+        guest_changed = "guest_name" in booking_data or "guest_mobile" in booking_data
+        if guest_changed:
+            record_guest(batch, booking.get("guest_mobile"), booking.get("guest_name"))
         batch.commit()
         
-        invalidate_cache()
+        bump_versions("bookings", "totals", "logs", *(["guests"] if guest_changed else []))
+        # Dates or room may have moved, so both the old and the new months change
+        invalidate_booking_calendar(previous, booking)
         
         logger.info(f"Booking updated: {booking_id}")
         return jsonify(success=True, booking=booking, message="Booking updated successfully")
@@ -1644,7 +4129,7 @@ def cancel_booking():
             return jsonify(success=False, message="Invalid booking ID")
         
         booking = booking_doc.to_dict()
-        batch = db.batch()
+        batch = write_batch()
         
         refund_amount = int(booking_data.get("refund_amount", 0))
         if refund_amount > 0:
@@ -1665,9 +4150,7 @@ def cancel_booking():
                 "entries": firestore.ArrayUnion([refund_log])
             })
             
-            totals = get_totals()
-            totals["refunds"] += refund_amount
-            batch.set(totals_ref.document('current_totals'), totals)
+            add_total(batch, "refunds", refund_amount)
             
             booking["paid_amount"] -= refund_amount
             booking["balance"] = booking["total_amount"] - booking["paid_amount"]
@@ -1679,7 +4162,8 @@ def cancel_booking():
         batch.set(bookings_ref.document(booking_id), booking)
         batch.commit()
         
-        invalidate_cache()
+        bump_versions("bookings", "totals", "logs")
+        invalidate_booking_calendar(booking)
         
         logger.info(f"Booking cancelled: {booking_id}")
         return jsonify(success=True, message="Booking cancelled successfully")
@@ -1720,8 +4204,7 @@ def convert_booking_to_checkin():
         
         store_transaction_metadata(room_number, current_date, serial_number, "booking_conversion")
         
-        batch = db.batch()
-        totals = get_totals()
+        batch = write_batch()
         
         if remaining_payment > 0:
             payment_log = {
@@ -1741,7 +4224,7 @@ def convert_booking_to_checkin():
                 "entries": firestore.ArrayUnion([payment_log])
             })
             
-            totals[payment_method] += remaining_payment
+            add_total(batch, payment_method, remaining_payment)
         else:
             zero_payment_log = {
                 "booking_id": booking_id,
@@ -1816,16 +4299,17 @@ def convert_booking_to_checkin():
                 "entries": firestore.ArrayUnion([balance_log])
             })
             
-            totals["balance"] += balance_after_payment
+            add_total(batch, "balance", balance_after_payment)
         
         booking["status"] = "checked_in"
         booking["check_in_time"] = datetime.now(IST).strftime("%Y-%m-%d %H:%M")
         
         batch.set(bookings_ref.document(booking_id), booking)
-        batch.set(totals_ref.document('current_totals'), totals)
+        record_guest(batch, guest["mobile"], guest["name"], photo=guest.get("photo"), visit=True)
         batch.commit()
         
-        invalidate_cache()
+        bump_versions("bookings", "rooms", "totals", "logs", "guests")
+        invalidate_booking_calendar(booking)
         
         logger.info(f"Booking {booking_id} converted to check-in for room {room_number} with serial #{serial_number}")
         
@@ -1906,6 +4390,8 @@ def fetch_settlements():
 @app.route("/get_pending_settlements", methods=["GET"])
 def get_pending_settlements_route():
     try:
+        if request.args.get("status") == "open":
+            return jsonify(success=True, settlements=read_open_settlements())
         settlements = fetch_settlements()
         return jsonify(success=True, settlements=settlements)
     except Exception as e:
@@ -1928,7 +4414,7 @@ def collect_settlement():
             return jsonify(success=False, message="Settlement not found")
         
         settlement = settlement_doc.to_dict()
-        batch = db.batch()
+        batch = write_batch()
         
         if discount_amount > 0:
             if discount_amount > settlement["amount"]:
@@ -1971,9 +4457,7 @@ def collect_settlement():
             "entries": firestore.ArrayUnion([payment_log])
         })
         
-        totals = get_totals()
-        totals[payment_mode] += payment_amount
-        batch.set(totals_ref.document('current_totals'), totals)
+        add_total(batch, payment_mode, payment_amount)
         
         if payment_amount == settlement["amount"]:
             settlement["status"] = "paid"
@@ -1995,9 +4479,11 @@ def collect_settlement():
             })
         
         batch.set(settlements_ref.document(settlement_id), settlement)
+        record_guest(batch, settlement.get("guest_mobile"), pending={
+            settlement_id: None if settlement["status"] == "paid" else settlement["amount"]})
         batch.commit()
         
-        invalidate_cache()
+        bump_versions("settlements", "totals", "logs", "guests")
         
         if payment_amount == settlement["amount"]:
             message = f"Full payment of ₹{payment_amount} collected successfully"
@@ -2031,17 +4517,20 @@ def cancel_settlement():
         guest_name = settlement["guest_name"]
         amount = settlement["amount"]
         
+        batch = write_batch()
         if data_json.get("delete", False):
-            settlements_ref.document(settlement_id).delete()
+            batch.delete(settlements_ref.document(settlement_id))
         else:
             settlement["status"] = "cancelled"
             settlement["cancel_date"] = datetime.now(IST).strftime("%Y-%m-%d")
             settlement["cancel_time"] = datetime.now(IST).strftime("%H:%M")
             settlement["cancel_reason"] = reason
             
-            settlements_ref.document(settlement_id).set(settlement)
+            batch.set(settlements_ref.document(settlement_id), settlement)
+        record_guest(batch, settlement.get("guest_mobile"), pending={settlement_id: None})
+        batch.commit()
         
-        invalidate_cache()
+        bump_versions("settlements", "guests")
         
         logger.info(f"Settlement cancelled: ₹{amount} from {guest_name}, reason: {reason}")
         
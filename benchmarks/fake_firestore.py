@@ -0,0 +1,471 @@
+"""In-memory stand-in for the parts of the Firestore client app.py uses.
+
+Documents are stored as plain dicts and copied on every read and write, like
+a real client would deserialize them. Each call that would be an RPC sleeps
+for ``rpc_latency`` seconds and is reported to ``on_rpc(name, seconds)``.
+
+    fake = FakeFirestore(rpc_latency=0.02)
+    install(lodge_app_module, fake)
+"""
+import copy
+import itertools
+import threading
+import time
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def _clone(value):
+    if orjson is not None:
+        return orjson.loads(orjson.dumps(value, option=orjson.OPT_NON_STR_KEYS))
+    return copy.deepcopy(value)
+
+
+class ArrayUnion:
+    def __init__(self, values):
+        self.values = list(values)
+
+
+class ArrayRemove:
+    def __init__(self, values):
+        self.values = list(values)
+
+
+class _Increment:
+    def __init__(self, value):
+        self.value = value
+
+
+Increment = _Increment
+DELETE_FIELD = object()
+SERVER_TIMESTAMP = object()
+
+
+def _apply_field(current, value):
+    if isinstance(value, ArrayUnion):
+        result = list(current or [])
+        for item in value.values:
+            if item not in result:
+                result.append(_clone(item))
+        return result
+    if isinstance(value, ArrayRemove):
+        return [item for item in (current or []) if item not in value.values]
+    if isinstance(value, _Increment):
+        return (current or 0) + value.value
+    if value is SERVER_TIMESTAMP:
+        return time.time()
+    return _clone(value)
+
+
+def _merge_field(current, value):
+    """set(merge=True) merges nested maps field by field, as Firestore does"""
+    if isinstance(value, dict):
+        merged = dict(current) if isinstance(current, dict) else {}
+        for key, item in value.items():
+            if item is DELETE_FIELD:
+                merged.pop(key, None)
+            else:
+                merged[key] = _merge_field(merged.get(key), item)
+        return merged
+    return _apply_field(current, value)
+
+
+def _set_path(doc, path, value):
+    parts = path.split(".")
+    target = doc
+    for part in parts[:-1]:
+        target = target.setdefault(part, {})
+    if value is DELETE_FIELD:
+        target.pop(parts[-1], None)
+    else:
+        target[parts[-1]] = _apply_field(target.get(parts[-1]), value)
+
+
+def _get_path(doc, path):
+    value = doc
+    for part in path.split("."):
+        if not isinstance(value, dict) or part not in value:
+            return None
+        value = value[part]
+    return value
+
+
+class NotFound(Exception):
+    pass
+
+
+class DocumentSnapshot:
+    def __init__(self, reference, data):
+        self.reference = reference
+        self.id = reference.id
+        self._data = data
+
+    @property
+    def exists(self):
+        return self._data is not None
+
+    def to_dict(self):
+        return None if self._data is None else _clone(self._data)
+
+    def get(self, field):
+        return _get_path(self._data or {}, field)
+
+
+class DocumentReference:
+    def __init__(self, client, collection, doc_id):
+        self._client = client
+        self._collection = collection
+        self.id = doc_id
+
+    @property
+    def path(self):
+        return f"{self._collection}/{self.id}"
+
+    def get(self, timeout=None, transaction=None, **kwargs):
+        self._client._rpc("batch_get_documents")
+        with self._client._lock:
+            data = self._client._docs(self._collection).get(self.id)
+            return DocumentSnapshot(self, _clone(data) if data is not None else None)
+
+    def set(self, data, merge=False, timeout=None):
+        self._client._rpc("commit")
+        with self._client._lock:
+            self._client._write(self._collection, self.id, "set", data, merge)
+
+    def update(self, data, timeout=None):
+        self._client._rpc("commit")
+        with self._client._lock:
+            self._client._write(self._collection, self.id, "update", data)
+
+    def delete(self, timeout=None):
+        self._client._rpc("commit")
+        with self._client._lock:
+            self._client._write(self._collection, self.id, "delete", None)
+
+    def collection(self, name):
+        return CollectionReference(self._client, f"{self.path}/{name}")
+
+    def on_snapshot(self, callback):
+        return Query(self._client, self._collection).where("__name__", "==", self.id).on_snapshot(callback)
+
+
+class Query:
+    def __init__(self, client, collection, filters=(), orders=(), limit=None, offset=0, start_after=None):
+        self._client = client
+        self._collection = collection
+        self._filters = list(filters)
+        self._orders = list(orders)
+        self._limit = limit
+        self._offset = offset
+        self._start_after = start_after
+
+    def _copy(self, **changes):
+        state = dict(filters=self._filters, orders=self._orders, limit=self._limit,
+                     offset=self._offset, start_after=self._start_after)
+        state.update(changes)
+        return Query(self._client, self._collection, **state)
+
+    def where(self, field=None, op=None, value=None, filter=None):
+        if filter is not None:
+            field, op, value = filter.field_path, filter.op_string, filter.value
+        return self._copy(filters=self._filters + [(field, op, value)])
+
+    def order_by(self, field, direction="ASCENDING"):
+        return self._copy(orders=self._orders + [(field, direction)])
+
+    def limit(self, count):
+        return self._copy(limit=count)
+
+    def offset(self, count):
+        return self._copy(offset=count)
+
+    def start_after(self, values):
+        return self._copy(start_after=values)
+
+    def _matches(self, doc_id, data):
+        for field, op, value in self._filters:
+            actual = doc_id if field == "__name__" else _get_path(data, field)
+            if op == "==" and not actual == value:
+                return False
+            if op == "!=" and not actual != value:
+                return False
+            if op == "in" and actual not in value:
+                return False
+            if op == "array_contains" and value not in (actual or []):
+                return False
+            if op in ("<", "<=", ">", ">=") and (actual is None or not {
+                "<": actual < value, "<=": actual <= value, ">": actual > value, ">=": actual >= value
+            }[op]):
+                return False
+        return True
+
+    def _sort_key(self, item):
+        doc_id, data = item
+        return tuple(doc_id if f == "__name__" else _get_path(data, f) for f, _ in self._orders)
+
+    def _results(self):
+        with self._client._lock:
+            items = [(doc_id, _clone(data)) for doc_id, data in self._client._docs(self._collection).items()
+                     if self._matches(doc_id, data)]
+        if self._orders:
+            descending = self._orders[0][1] in ("DESCENDING", "desc")
+            items.sort(key=lambda item: tuple("" if v is None else v for v in self._sort_key(item)),
+                       reverse=descending)
+        else:
+            items.sort(key=lambda item: item[0])
+        if self._start_after is not None:
+            cursor = self._start_after if isinstance(self._start_after, (list, tuple)) else [self._start_after]
+            cursor = tuple(cursor)
+            descending = self._orders and self._orders[0][1] in ("DESCENDING", "desc")
+            items = [item for item in items if (self._sort_key(item) < cursor if descending
+                                                else self._sort_key(item) > cursor)]
+        items = items[self._offset:]
+        if self._limit is not None:
+            items = items[:self._limit]
+        return [DocumentSnapshot(DocumentReference(self._client, self._collection, doc_id), data)
+                for doc_id, data in items]
+
+    def stream(self, transaction=None, timeout=None):
+        self._client._rpc("run_query")
+        return iter(self._results())
+
+    def get(self, transaction=None, timeout=None):
+        return list(self.stream())
+
+    def on_snapshot(self, callback):
+        return self._client._listen(self, callback)
+
+
+class CollectionReference(Query):
+    def __init__(self, client, name):
+        super().__init__(client, name)
+        self.id = name.split("/")[-1]
+
+    def document(self, doc_id=None):
+        if doc_id is None:
+            doc_id = f"auto{next(self._client._ids)}"
+        return DocumentReference(self._client, self._collection, doc_id)
+
+    def list_documents(self):
+        self._client._rpc("list_documents")
+        with self._client._lock:
+            return [self.document(doc_id) for doc_id in self._client._docs(self._collection)]
+
+
+class WriteBatch:
+    def __init__(self, client):
+        self._client = client
+        self._writes = []
+
+    def set(self, reference, data, merge=False):
+        self._writes.append((reference, "set", _clone(data) if not merge else data, merge))
+        return self
+
+    def update(self, reference, data):
+        self._writes.append((reference, "update", data, False))
+        return self
+
+    def delete(self, reference):
+        self._writes.append((reference, "delete", None, False))
+        return self
+
+    def __len__(self):
+        return len(self._writes)
+
+    def commit(self, timeout=None):
+        self._client._rpc("commit")
+        with self._client._lock:
+            for reference, kind, data, merge in self._writes:
+                if kind == "update" and reference.id not in self._client._docs(reference._collection):
+                    raise NotFound(f"No document to update: {reference.path}")
+            for reference, kind, data, merge in self._writes:
+                self._client._write(reference._collection, reference.id, kind, data, merge)
+            committed = time.time()
+        writes, self._writes = self._writes, []
+        return [WriteResult(committed) for _ in writes]
+
+
+class WriteResult:
+    def __init__(self, update_time):
+        self.update_time = update_time
+
+
+class Transaction(WriteBatch):
+    pass
+
+
+def transactional(func):
+    def wrapper(transaction, *args, **kwargs):
+        with transaction._client._transaction_lock:
+            result = func(transaction, *args, **kwargs)
+            transaction.commit()
+            return result
+    return wrapper
+
+
+class ChangeType:
+    def __init__(self, name):
+        self.name = name
+
+
+ADDED, MODIFIED, REMOVED = ChangeType("ADDED"), ChangeType("MODIFIED"), ChangeType("REMOVED")
+
+
+class DocumentChange:
+    def __init__(self, type, document):
+        self.type = type
+        self.document = document
+
+
+class Watch:
+    def __init__(self, client, query, callback):
+        self._client = client
+        self._query = query
+        self._callback = callback
+        self._previous = {}
+        self._fire_lock = threading.Lock()
+        self.active = True
+
+    @property
+    def is_active(self):
+        return self.active
+
+    def unsubscribe(self):
+        self.active = False
+        with self._client._lock:
+            if self in self._client._watches:
+                self._client._watches.remove(self)
+
+    def _fire(self):
+        # Like the real listener, deliver the full result set plus what changed since the last push
+        with self._fire_lock:
+            if not self.active:
+                return
+            docs = self._query._results()
+            current = {doc.id: doc for doc in docs}
+            changes = [DocumentChange(REMOVED, DocumentSnapshot(doc.reference, None))
+                       for doc_id, doc in self._previous.items() if doc_id not in current]
+            for doc_id, doc in current.items():
+                previous = self._previous.get(doc_id)
+                if previous is None:
+                    changes.append(DocumentChange(ADDED, doc))
+                elif previous._data != doc._data:
+                    changes.append(DocumentChange(MODIFIED, doc))
+            self._previous = current
+            if changes or not self._previous:
+                self._callback(docs, changes, time.time())
+
+
+class FakeFirestore:
+    """Thread-safe in-memory document store with Firestore's call shapes"""
+
+    def __init__(self, rpc_latency=0.0, on_rpc=None):
+        self.rpc_latency = rpc_latency
+        self.on_rpc = on_rpc
+        self.rpc_counts = {}
+        self._collections = {}
+        self._lock = threading.RLock()
+        self._transaction_lock = threading.Lock()
+        self._watches = []
+        self._ids = itertools.count(1)
+
+    def _rpc(self, name):
+        start_time = time.perf_counter()
+        if self.rpc_latency:
+            time.sleep(self.rpc_latency)
+        with self._lock:
+            self.rpc_counts[name] = self.rpc_counts.get(name, 0) + 1
+        if self.on_rpc:
+            self.on_rpc(name, time.perf_counter() - start_time)
+
+    def _docs(self, collection):
+        return self._collections.setdefault(collection, {})
+
+    def _write(self, collection, doc_id, kind, data, merge=False):
+        docs = self._docs(collection)
+        if kind == "delete":
+            docs.pop(doc_id, None)
+        elif kind == "set" and not merge:
+            docs[doc_id] = {key: _apply_field(None, value) for key, value in data.items()}
+        elif kind == "set":
+            docs[doc_id] = _merge_field(docs.get(doc_id), data)
+        else:
+            if kind == "update" and doc_id not in docs:
+                raise NotFound(f"No document to update: {collection}/{doc_id}")
+            doc = docs.setdefault(doc_id, {})
+            for key, value in data.items():
+                _set_path(doc, key, value)
+        for watch in [w for w in self._watches if w._query._collection == collection]:
+            threading.Thread(target=watch._fire, daemon=True).start()
+
+    def _listen(self, query, callback):
+        watch = Watch(self, query, callback)
+        with self._lock:
+            self._watches.append(watch)
+        threading.Thread(target=watch._fire, daemon=True).start()
+        return watch
+
+    # Client API
+    def collection(self, name):
+        return CollectionReference(self, name)
+
+    def document(self, path):
+        collection, doc_id = path.rsplit("/", 1)
+        return DocumentReference(self, collection, doc_id)
+
+    def get_all(self, references, field_paths=None, transaction=None, timeout=None):
+        self._rpc("batch_get_documents")
+        with self._lock:
+            snapshots = []
+            for reference in references:
+                data = self._docs(reference._collection).get(reference.id)
+                snapshots.append(DocumentSnapshot(reference, _clone(data) if data is not None else None))
+        return iter(snapshots)
+
+    def batch(self):
+        return WriteBatch(self)
+
+    def transaction(self, **kwargs):
+        return Transaction(self)
+
+    def seed(self, collection, documents):
+        """Load {doc_id: data} without counting RPCs"""
+        with self._lock:
+            docs = self._docs(collection)
+            for doc_id, data in documents.items():
+                docs[doc_id] = _clone(data)
+
+
+class FakeFirestoreModule:
+    """Replacement for ``firebase_admin.firestore`` backed by one FakeFirestore"""
+    ArrayUnion = ArrayUnion
+    ArrayRemove = ArrayRemove
+    Increment = Increment
+    DELETE_FIELD = DELETE_FIELD
+    SERVER_TIMESTAMP = SERVER_TIMESTAMP
+    transactional = staticmethod(transactional)
+
+    def __init__(self, client):
+        self._client = client
+
+    def client(self):
+        return self._client
+
+
+def install(lodge, fake):
+    """Point app.py's lazy Firestore objects at ``fake``"""
+    lodge.firestore._target = FakeFirestoreModule(fake)
+    lodge.db._target = fake
+    for name in dir(lodge):
+        proxy = getattr(lodge, name)
+        if isinstance(proxy, lodge.LazyProxy) and name.endswith("_ref"):
+            proxy._target = None
+        elif isinstance(proxy, lodge.tenants.PerTenant) and name.endswith("_ref"):
+            proxy._instances.clear()
+    if fake.on_rpc is None:
+        fake.on_rpc = lodge.record_rpc
+    lodge._firebase_app = object()
+    return fake
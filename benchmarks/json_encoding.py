@@ -0,0 +1,111 @@
+"""Bytes and encode time for the large JSON endpoints.
+
+Builds the payloads of /get_data, /get_logs_only, /reports and /get_bookings
+from lodge_data.json (logs repeated SCALE times) and compares the stdlib
+encoder Flask used before with the orjson provider, plus gzip/brotli and the
+?shape=columnar log layout.
+
+    python benchmarks/json_encoding.py [--scale 10] [--json results.json]
+"""
+import argparse
+import gzip
+import json
+import os
+import sys
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as lodge  # noqa: E402
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+def load_payloads(scale):
+    with open(os.path.join(os.path.dirname(lodge.__file__), "lodge_data.json")) as f:
+        data = json.load(f)
+    full_logs = {log_type: entries * scale for log_type, entries in data["logs"].items()}
+    tail_logs = {log_type: entries[-50:] for log_type, entries in full_logs.items()}
+    bookings = [
+        {
+            "booking_id": str(uuid.uuid4()), "room": str(200 + i % 29), "guest_name": f"Guest {i}",
+            "guest_mobile": f"98{i:08d}", "booking_date": "2025-04-01", "check_in_date": "2025-04-10",
+            "check_out_date": "2025-04-12", "status": "confirmed", "total_amount": 1500, "paid_amount": 500,
+            "balance": 1000, "payment_method": "cash", "notes": "", "photo_path": None, "guest_count": 2
+        }
+        for i in range(40 * scale)
+    ]
+    reports = {
+        "cash_logs": full_logs["cash"], "online_logs": full_logs["online"], "addon_logs": full_logs["add_ons"],
+        "refund_logs": full_logs["refunds"], "renewal_logs": full_logs["renewals"],
+        "expense_logs": full_logs["expenses"]
+    }
+    return {
+        "/get_data": ({"rooms": data["rooms"], "logs": tail_logs, "totals": data["totals"]}, ("logs",)),
+        "/get_logs_only": ({"success": True, "logs": tail_logs}, ("logs",)),
+        "/reports": (dict(success=True, **reports), tuple(reports)),
+        "/get_bookings": ({"success": True, "bookings": bookings}, ()),
+    }
+
+
+def timed(fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return result, best * 1000
+
+
+def columnar(payload, log_keys):
+    shaped = dict(payload)
+    for key in log_keys:
+        if key == "logs":
+            shaped[key] = {t: lodge.to_columnar(e) for t, e in payload[key].items()}
+        else:
+            shaped[key] = lodge.to_columnar(payload[key])
+    return shaped
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scale", type=int, default=10)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+
+    results = []
+    for endpoint, (payload, log_keys) in load_payloads(args.scale).items():
+        stdlib, stdlib_ms = timed(
+            lambda: json.dumps(payload, sort_keys=True, separators=(",", ":")).encode(), args.repeat)
+        row = {"endpoint": endpoint, "bytes": len(stdlib), "stdlib_ms": round(stdlib_ms, 3)}
+        if lodge.orjson:
+            _, row["orjson_ms"] = timed(lambda: lodge.app.json.response(payload).get_data(), args.repeat)
+            row["orjson_ms"] = round(row["orjson_ms"], 3)
+        gz, row["gzip_ms"] = timed(lambda: gzip.compress(stdlib, compresslevel=6), args.repeat)
+        row["gzip_bytes"], row["gzip_ms"] = len(gz), round(row["gzip_ms"], 3)
+        if brotli:
+            br, row["br_ms"] = timed(lambda: brotli.compress(stdlib, quality=4), args.repeat)
+            row["br_bytes"], row["br_ms"] = len(br), round(row["br_ms"], 3)
+        if log_keys:
+            col = json.dumps(columnar(payload, log_keys), separators=(",", ":")).encode()
+            row["columnar_bytes"] = len(col)
+            if brotli:
+                row["columnar_br_bytes"] = len(brotli.compress(col, quality=4))
+        results.append(row)
+
+    columns = list(dict.fromkeys(k for row in results for k in row))
+    print("  ".join(f"{c:>17}" for c in columns))
+    for row in results:
+        print("  ".join(f"{str(row.get(c, '-')):>17}" for c in columns))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"scale": args.scale, "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
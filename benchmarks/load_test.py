@@ -0,0 +1,391 @@
+"""Reproducible load test for the lodge API against an in-memory Firestore.
+
+Boots app.py in-process behind a threaded WSGI server, seeds the fake backend
+from lodge_data.json scaled up to --rooms rooms and --log-entries log entries,
+then replays a mixed front-desk tablet workload from --concurrency workers for
+--duration seconds. Prints p50/p95/p99 latency and throughput per endpoint and
+can write them as JSON for comparison between commits:
+
+    python benchmarks/load_test.py --json before.json
+    python benchmarks/load_test.py --json after.json --compare before.json
+"""
+import argparse
+import gzip
+import http.client
+import json
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_firestore import FakeFirestore, install  # noqa: E402
+
+# (operation, weight) - roughly what a tablet session does
+WORKLOAD = [
+    ("get_rooms_only", 25),
+    ("get_totals_only", 12),
+    ("get_logs_only", 8),
+    ("get_data", 10),
+    ("get_room_numbers", 3),
+    ("get_bookings", 4),
+    ("get_pending_settlements", 3),
+    ("reports", 4),
+    ("checkin", 8),
+    ("checkout", 8),
+    ("payment", 5),
+    ("add_on", 6),
+    ("renew_rent", 4),
+]
+
+LOG_TYPES = ["cash", "online", "balance", "add_ons", "refunds", "renewals",
+             "booking_payments", "discounts", "expenses", "room_shifts"]
+
+
+def build_dataset(rooms_target, log_entries_target, seed):
+    """Scale lodge_data.json up to the requested size, deterministically"""
+    rng = random.Random(seed)
+    with open(os.path.join(ROOT, "lodge_data.json")) as f:
+        data = json.load(f)
+
+    templates = list(data["rooms"].values())
+    rooms = {}
+    for room_id, room in data["rooms"].items():
+        rooms[room_id] = dict(room, renewal_count=0, last_renewal_time=None)
+    number = 1000
+    while len(rooms) < rooms_target:
+        rooms[str(number)] = dict(rng.choice(templates), renewal_count=0, last_renewal_time=None)
+        number += 1
+    now = datetime.now()
+    for room in rooms.values():
+        if room.get("guest"):
+            room["checkin_time"] = (now - timedelta(hours=rng.randint(1, 20))).strftime("%Y-%m-%d %H:%M")
+
+    source_total = sum(len(entries) for entries in data["logs"].values()) or 1
+    room_ids = list(rooms)
+    start_day = datetime.now() - timedelta(days=365)
+    logs = {}
+    for log_type in LOG_TYPES:
+        source = data["logs"].get(log_type) or [{"room": "1", "name": "Guest", "amount": 100}]
+        count = max(1, log_entries_target * len(source) // source_total)
+        entries = []
+        for i in range(count):
+            entry = dict(source[i % len(source)])
+            day = start_day + timedelta(days=365 * i // count)
+            entry["date"] = day.strftime("%Y-%m-%d")
+            if "room" in entry:
+                entry["room"] = rng.choice(room_ids)
+            entry["seq"] = i
+            entries.append(entry)
+        logs[log_type] = {"entries": entries}
+
+    bookings = {}
+    for i in range(max(50, rooms_target // 10)):
+        check_in = now + timedelta(days=rng.randint(-30, 60))
+        bookings[f"booking-{i}"] = {
+            "room": rng.choice(room_ids), "guest_name": f"Guest {i}", "guest_mobile": f"98{i:08d}",
+            "booking_date": now.strftime("%Y-%m-%d"), "check_in_date": check_in.strftime("%Y-%m-%d"),
+            "check_out_date": (check_in + timedelta(days=rng.randint(1, 4))).strftime("%Y-%m-%d"),
+            "status": rng.choice(["confirmed", "confirmed", "cancelled", "checked_in"]),
+            "total_amount": 1500, "paid_amount": 500, "balance": 1000, "payment_method": "cash",
+            "notes": "", "photo_path": None, "guest_count": 2
+        }
+
+    settlements = {}
+    for i in range(max(20, rooms_target // 50)):
+        settlements[f"settlement-{i}"] = {
+            "id": f"settlement-{i}", "guest_name": f"Guest {i}", "guest_mobile": f"97{i:08d}",
+            "room": rng.choice(room_ids), "amount": rng.randint(100, 2000),
+            "checkout_date": now.strftime("%Y-%m-%d"), "checkout_time": "10:00",
+            "status": rng.choice(["pending", "pending", "paid"]), "notes": "", "photo": None
+        }
+
+    return {
+        "rooms": rooms,
+        "logs": logs,
+        "totals": {"current_totals": data["totals"]},
+        "settings": {"app_settings": {"last_rent_check": now.strftime("%Y-%m-%d %H:%M:%S")}},
+        "bookings": bookings,
+        "settlements": settlements,
+    }
+
+
+class Worker(threading.Thread):
+    """Replays the weighted workload against rooms it owns exclusively"""
+
+    def __init__(self, index, port, rooms, deadline, seed, revalidate):
+        super().__init__(daemon=True)
+        self.port = port
+        self.rooms = rooms  # room id -> {"occupied": bool, "balance": int}
+        self.deadline = deadline
+        self.rng = random.Random(seed + index)
+        self.revalidate = revalidate
+        self.etags = {}
+        self.samples = []  # (operation, seconds, ok)
+        self.operations = [name for name, _ in WORKLOAD]
+        self.weights = [weight for _, weight in WORKLOAD]
+
+    def request(self, method, path, body=None):
+        headers = {"Accept-Encoding": "gzip, br"}
+        if body is not None:
+            headers["Content-Type"] = "application/json"
+            body = json.dumps(body)
+        if method == "GET" and self.revalidate and path in self.etags:
+            headers["If-None-Match"] = self.etags[path]
+        connection = http.client.HTTPConnection("127.0.0.1", self.port, timeout=120)
+        try:
+            connection.request(method, path, body=body, headers=headers)
+            response = connection.getresponse()
+            payload = response.read()
+            if response.getheader("ETag"):
+                self.etags[path] = response.getheader("ETag")
+            return response.status, decode_json(payload, response.getheader("Content-Encoding"),
+                                                response.getheader("Content-Type"))
+        finally:
+            connection.close()
+
+    def pick_room(self, occupied, predicate=lambda state: True):
+        candidates = [room for room, state in self.rooms.items()
+                      if state["occupied"] == occupied and predicate(state)]
+        return self.rng.choice(candidates) if candidates else None
+
+    def plan(self, operation):
+        """Turn an operation name into (method, path, body, on_success) or None"""
+        today = datetime.now().strftime("%Y-%m-%d")
+        if operation == "reports":
+            start = (datetime.now() - timedelta(days=30)).strftime("%Y-%m-%d")
+            return "POST", "/reports", {"start_date": start, "end_date": today}, None
+        if operation == "checkin":
+            room = self.pick_room(False)
+            if room is None:
+                return None
+            price = self.rng.choice([400, 500, 700, 1000])
+
+            def done():
+                self.rooms[room].update(occupied=True, balance=0, price=price)
+            return "POST", "/checkin", {
+                "room": room, "name": f"Load Guest {self.rng.randint(1, 99999)}", "mobile": "9000000000",
+                "price": price, "amountPaid": price, "payment": self.rng.choice(["cash", "online"]),
+                "guests": 2
+            }, done
+        if operation == "checkout":
+            room = self.pick_room(True, lambda state: state["balance"] <= 0)
+            if room is None:
+                return None
+
+            def done():
+                self.rooms[room].update(occupied=False, balance=0)
+            return "POST", "/checkout", {"room": room, "final_checkout": True, "refund_method": "cash"}, done
+        if operation == "payment":
+            room = self.pick_room(True, lambda state: state["balance"] > 0)
+            if room is None:
+                return None
+            amount = self.rooms[room]["balance"]
+
+            def done():
+                self.rooms[room]["balance"] = 0
+            return "POST", "/checkout", {"room": room, "amount": amount, "payment_mode": "cash"}, done
+        if operation == "add_on":
+            room = self.pick_room(True)
+            if room is None:
+                return None
+            return "POST", "/add_on", {"room": room, "item": "Tea", "price": 20, "payment_method": "cash"}, None
+        if operation == "renew_rent":
+            room = self.pick_room(True)
+            if room is None:
+                return None
+            price = self.rooms[room].get("price", 500)
+
+            def done():
+                self.rooms[room]["balance"] += price
+            return "POST", "/renew_rent", {"room": room, "renewal_count": 1}, done
+        return "GET", f"/{operation}", None, None
+
+    def run(self):
+        while time.perf_counter() < self.deadline:
+            operation = self.rng.choices(self.operations, self.weights)[0]
+            planned = self.plan(operation)
+            if planned is None:
+                operation, planned = "get_rooms_only", self.plan("get_rooms_only")
+            method, path, body, on_success = planned
+            start_time = time.perf_counter()
+            try:
+                status, result = self.request(method, path, body)
+                # The app reports most failures as 200 {"success": false}
+                ok = status == 304 or (status == 200 and not (isinstance(result, dict)
+                                                              and result.get("success") is False))
+            except Exception:
+                ok = False
+            self.samples.append((operation, time.perf_counter() - start_time, ok))
+            if ok and on_success:
+                on_success()
+
+
+def decode_json(payload, content_encoding, content_type):
+    """A JSON response body as an object, or None for anything else"""
+    if not payload or "json" not in (content_type or ""):
+        return None
+    if content_encoding == "gzip":
+        payload = gzip.decompress(payload)
+    elif content_encoding == "br":
+        import brotli
+        payload = brotli.decompress(payload)
+    return json.loads(payload)
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(fraction * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+
+def summarize(samples, duration):
+    by_operation = {}
+    for operation, seconds, ok in samples:
+        by_operation.setdefault(operation, []).append((seconds, ok))
+    by_operation["ALL"] = [(seconds, ok) for _, seconds, ok in samples]
+    summary = {}
+    for operation, values in sorted(by_operation.items()):
+        latencies = sorted(seconds for seconds, _ in values)
+        summary[operation] = {
+            "count": len(values),
+            "errors": sum(1 for _, ok in values if not ok),
+            "throughput_rps": round(len(values) / duration, 2),
+            "mean_ms": round(1000 * sum(latencies) / len(latencies), 2),
+            "p50_ms": round(1000 * percentile(latencies, 0.50), 2),
+            "p95_ms": round(1000 * percentile(latencies, 0.95), 2),
+            "p99_ms": round(1000 * percentile(latencies, 0.99), 2),
+        }
+    return summary
+
+
+def print_table(summary, baseline=None):
+    header = f"{'endpoint':<26}{'count':>8}{'errors':>8}{'rps':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}"
+    print(header)
+    print("-" * len(header))
+    for operation, row in summary.items():
+        line = (f"{operation:<26}{row['count']:>8}{row['errors']:>8}{row['throughput_rps']:>9}"
+                f"{row['p50_ms']:>10}{row['p95_ms']:>10}{row['p99_ms']:>10}")
+        old = (baseline or {}).get(operation)
+        if old and old["p95_ms"]:
+            line += f"   p95 {100 * (row['p95_ms'] - old['p95_ms']) / old['p95_ms']:+.0f}%"
+            line += f"  rps {100 * (row['throughput_rps'] - old['throughput_rps']) / max(old['throughput_rps'], 0.01):+.0f}%"
+        print(line)
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except Exception:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rooms", type=int, default=2000)
+    parser.add_argument("--log-entries", type=int, default=200000)
+    parser.add_argument("--duration", type=float, default=30)
+    parser.add_argument("--warmup", type=float, default=3)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--rpc-latency-ms", type=float, default=0,
+                        help="simulated Firestore round-trip per RPC")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--no-revalidate", action="store_true",
+                        help="do not send If-None-Match like a browser would")
+    parser.add_argument("--json", help="write machine-readable results to this file")
+    parser.add_argument("--compare", help="baseline JSON from a previous run")
+    args = parser.parse_args()
+
+    import app as lodge
+    from werkzeug.serving import make_server
+
+    fake = install(lodge, FakeFirestore(rpc_latency=args.rpc_latency_ms / 1000))
+    dataset = build_dataset(args.rooms, args.log_entries, args.seed)
+    for collection, documents in dataset.items():
+        fake.seed(collection, documents)
+
+    server = make_server("127.0.0.1", 0, lodge.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    port = server.server_port
+
+    room_ids = sorted(dataset["rooms"])
+    random.Random(args.seed).shuffle(room_ids)
+
+    def make_workers(deadline):
+        workers = []
+        for i in range(args.concurrency):
+            owned = {room: {"occupied": dataset["rooms"][room]["status"] == "occupied",
+                            "balance": dataset["rooms"][room].get("balance", 0) or 0,
+                            "price": ((dataset["rooms"][room].get("guest") or {}).get("price") or 500)}
+                     for room in room_ids[i::args.concurrency]}
+            workers.append(Worker(i, port, owned, deadline, args.seed, not args.no_revalidate))
+        return workers
+
+    if args.warmup:
+        warmup_workers = make_workers(time.perf_counter() + args.warmup)
+        for worker in warmup_workers:
+            worker.start()
+        for worker in warmup_workers:
+            worker.join()
+        # Seeded state was mutated by the warmup; reseed so every run starts equal
+        for collection, documents in dataset.items():
+            fake.seed(collection, documents)
+        lodge.invalidate_cache()
+
+    rpc_before = dict(fake.rpc_counts)
+    groups_before = dict(lodge.write_coalescer.stats)
+    start_time = time.perf_counter()
+    workers = make_workers(start_time + args.duration)
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    duration = time.perf_counter() - start_time
+    server.shutdown()
+
+    samples = [sample for worker in workers for sample in worker.samples]
+    summary = summarize(samples, duration)
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)["endpoints"]
+    print_table(summary, baseline)
+    write_groups = {key: lodge.write_coalescer.stats[key] - groups_before.get(key, 0)
+                    for key in ("groups", "writes", "isolated_retries")}
+    write_groups["largest_group"] = lodge.write_coalescer.stats["largest_group"]
+    if write_groups["groups"]:
+        print(f"\nwrite groups: {write_groups['writes']} writes in {write_groups['groups']} commits "
+              f"({write_groups['writes'] / write_groups['groups']:.2f} per commit, "
+              f"largest {write_groups['largest_group']})")
+
+    result = {
+        "meta": {
+            "revision": git_revision(),
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "python": sys.version.split()[0],
+            "rooms": args.rooms,
+            "log_entries": args.log_entries,
+            "concurrency": args.concurrency,
+            "duration_s": round(duration, 2),
+            "rpc_latency_ms": args.rpc_latency_ms,
+            "revalidate": not args.no_revalidate,
+            "rpc_counts": {rpc: count - rpc_before.get(rpc, 0) for rpc, count in fake.rpc_counts.items()},
+            "write_groups": write_groups,
+        },
+        "endpoints": summary,
+    }
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(result, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""Memory held by cached log entries and rooms as dicts vs models.Record.
+
+Rebuilds every document from its own JSON string, the way the Firestore
+client hands back a fresh dict (and fresh key/value strings) per document,
+then measures the retained size with tracemalloc.
+
+    python benchmarks/model_memory.py [--scale 10]
+"""
+import argparse
+import gc
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import models  # noqa: E402
+
+
+def load(scale):
+    with open(os.path.join(os.path.dirname(os.path.abspath(models.__file__)), "lodge_data.json")) as f:
+        data = json.load(f)
+    full_logs = {log_type: [json.dumps(e) for e in entries] * scale for log_type, entries in data["logs"].items()}
+    tail_logs = {log_type: entries[-50:] for log_type, entries in full_logs.items()}
+    rooms = {room_id: json.dumps(room) for room_id, room in data["rooms"].items()}
+    return full_logs, tail_logs, rooms
+
+
+def retained(build):
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    value = build()
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    return value, size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scale", type=int, default=10)
+    args = parser.parse_args()
+    full_logs, tail_logs, rooms = load(args.scale)
+
+    cases = {
+        "log tail (50/type)": (
+            lambda: {t: [json.loads(e) for e in entries] for t, entries in tail_logs.items()},
+            lambda: {t: models.log_entries([json.loads(e) for e in entries]) for t, entries in tail_logs.items()},
+        ),
+        f"full logs x{args.scale}": (
+            lambda: {t: [json.loads(e) for e in entries] for t, entries in full_logs.items()},
+            lambda: {t: models.log_entries([json.loads(e) for e in entries]) for t, entries in full_logs.items()},
+        ),
+        "rooms": (
+            lambda: {r: json.loads(doc) for r, doc in rooms.items()},
+            lambda: {r: models.Room.from_dict(json.loads(doc)) for r, doc in rooms.items()},
+        ),
+    }
+    print(f"{'data':>20}  {'entries':>8}  {'dict KB':>9}  {'record KB':>9}  {'saved':>6}  "
+          f"{'dict ms':>8}  {'record ms':>9}")
+    for name, (as_dicts, as_records) in cases.items():
+        dicts, dict_bytes = retained(as_dicts)
+        records, record_bytes = retained(as_records)
+        start = time.perf_counter()
+        as_dicts()
+        dict_ms = (time.perf_counter() - start) * 1000
+        start = time.perf_counter()
+        as_records()
+        record_ms = (time.perf_counter() - start) * 1000
+        # Round trip must be lossless
+        flat = [r.to_dict() for v in records.values() for r in (v if isinstance(v, list) else [v])]
+        expected = [d for v in dicts.values() for d in (v if isinstance(v, list) else [v])]
+        assert flat == expected, name
+        print(f"{name:>20}  {len(flat):>8}  {dict_bytes / 1024:>9.1f}  {record_bytes / 1024:>9.1f}  "
+              f"{1 - record_bytes / dict_bytes:>6.0%}  {dict_ms:>8.1f}  {record_ms:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+"""In-process memoization for the Firestore read paths.
+
+MemoCache keeps results in a bounded LRU keyed by (function name, args),
+with TTLs measured on the monotonic clock. Concurrent misses on the same key
+share a single load (single-flight), entries past their TTL but inside their
+stale window are served immediately while one background refresh runs, and
+entries can be invalidated one key or one function at a time. When a reload
+fails, callers get the last value that loaded successfully instead of the error.
+Invalidating a key detaches any load in flight for it, so a read that starts
+after a write never joins a load that started before it.
+"""
+import contextvars
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+
+class _Entry:
+    __slots__ = ("value", "expires", "stale_until", "loaded_at", "failed")
+
+    def __init__(self, value, expires, stale_until, loaded_at):
+        self.value = value
+        self.expires = expires
+        self.stale_until = stale_until
+        self.loaded_at = loaded_at  # wall clock, for reporting freshness
+        self.failed = False  # the last reload raised, so value is a fallback
+
+
+class _Flight:
+    """One in-progress load that other callers can wait on"""
+    __slots__ = ("done", "value", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class MemoCache:
+    def __init__(self, max_entries=50, clock=time.monotonic, on_lookup=None):
+        self.max_entries = max_entries
+        self.clock = clock
+        # on_lookup(name, result) with result one of hit/stale/miss/coalesced/fallback
+        self.on_lookup = on_lookup
+        self._entries = OrderedDict()
+        # key -> the load new callers join; invalidation detaches it
+        self._flights = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _report(self, key, result):
+        if self.on_lookup:
+            self.on_lookup(key[0] if isinstance(key, tuple) else key, result)
+
+    def get(self, key, loader, ttl, stale_ttl=0):
+        """Return the cached value for key, calling loader() at most once per miss"""
+        now = self.clock()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and now < entry.expires:
+                self._entries.move_to_end(key)
+                result = "hit"
+            elif entry is not None and now < entry.stale_until:
+                self._entries.move_to_end(key)
+                result = "stale"
+                if key not in self._flights:
+                    flight = self._flights[key] = _Flight()
+                    # In the caller's context, so the loader sees the same request-scoped state
+                    threading.Thread(target=contextvars.copy_context().run,
+                                     args=(self._load, key, loader, ttl, stale_ttl, flight),
+                                     daemon=True).start()
+            else:
+                flight = self._flights.get(key)
+                if flight is None:
+                    flight = self._flights[key] = _Flight()
+                    result = "miss"
+                else:
+                    result = "coalesced"
+        self._report(key, result)
+
+        if result in ("hit", "stale"):
+            return entry.value
+        if result == "miss":
+            self._load(key, loader, ttl, stale_ttl, flight)
+        else:
+            flight.done.wait()
+        if flight.error is not None:
+            if entry is not None:
+                # Past its stale window but still the last good value
+                self._report(key, "fallback")
+                return entry.value
+            raise flight.error
+        return flight.value
+
+    def _load(self, key, loader, ttl, stale_ttl, flight):
+        try:
+            flight.value = loader()
+        except BaseException as e:
+            flight.error = e
+        now = self.clock()
+        with self._lock:
+            # A detached flight was invalidated mid-load, so its value may predate a write
+            current = self._flights.get(key) is flight
+            if current:
+                del self._flights[key]
+            if current and flight.error is not None and key in self._entries:
+                self._entries[key].failed = True
+            elif current and flight.error is None:
+                self._entries[key] = _Entry(flight.value, now + ttl, now + ttl + stale_ttl, time.time())
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        flight.done.set()
+
+    def freshness(self, key):
+        """(wall-clock load time, not a fallback) for a cached key, or None
+
+        Serving inside the stale window while a refresh runs is ordinary; the
+        value only counts as a fallback once a reload failed or the window passed.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            return entry.loaded_at, not entry.failed and self.clock() < entry.stale_until
+
+    def _invalidate_locked(self, key):
+        self._entries.pop(key, None)
+        # Callers already waiting keep the load they joined; later ones start a new one
+        self._flights.pop(key, None)
+
+    def invalidate(self, key):
+        """Drop one key; a load already in flight for it is detached and will not be cached"""
+        with self._lock:
+            self._invalidate_locked(key)
+
+    def invalidate_function(self, name):
+        """Drop every key memoized for the function called name"""
+        with self._lock:
+            keys = {k for k in list(self._entries) + list(self._flights) if isinstance(k, tuple) and k[0] == name}
+            for key in keys:
+                self._invalidate_locked(key)
+
+    def clear(self):
+        with self._lock:
+            for key in set(self._entries) | set(self._flights):
+                self._invalidate_locked(key)
+
+    def prune(self):
+        """Drop entries whose stale window has also passed"""
+        now = self.clock()
+        with self._lock:
+            for key in [k for k, e in self._entries.items() if now >= e.stale_until]:
+                del self._entries[key]
+
+    def memoize(self, ttl, stale_ttl=0, copy=None):
+        """Decorator caching func(*args, **kwargs); copy is applied to every returned value"""
+        def decorator(func):
+            name = func.__name__
+
+            def make_key(args, kwargs):
+                return (name, args, tuple(sorted(kwargs.items()))) if kwargs else (name, args)
+
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                value = self.get(make_key(args, kwargs), lambda: func(*args, **kwargs), ttl, stale_ttl)
+                return copy(value) if copy else value
+
+            wrapper.invalidate = lambda *args, **kwargs: self.invalidate(make_key(args, kwargs))
+            wrapper.invalidate_all = lambda: self.invalidate_function(name)
+            wrapper.freshness = lambda *args, **kwargs: self.freshness(make_key(args, kwargs))
+            return wrapper
+        return decorator
@@ -0,0 +1,219 @@
+"""Group commit for the write routes.
+
+Every mutating route used to commit its own batch and overwrite
+current_totals with a read-modify-write copy, so concurrent check-ins
+queued on that one document and could undo each other's totals. Routes now
+fill a CoalescedBatch: ordinary writes are recorded as they are, and counter
+changes as increments. WriteCoalescer.commit() adds the batch to the group
+being collected. The group's first caller waits a short window while others
+join, then commits everyone's writes plus one merged Increment per counter
+document as a single Firestore batch. Each caller returns, or raises its own
+error, once its group is done.
+
+The window is only waited out while writes are actually concurrent (a
+commit in flight, or the previous group had company), so a lone write goes
+straight through.
+
+With a journal (see journal.py) each caller's writes are appended to it
+before the group commits, and a caller is acknowledged once they are on
+disk: when the commit fails in a way that may be temporary, or the journal
+says to queue behind older entries, the writes are left to its replayer
+instead of failing the request.
+"""
+import contextvars
+import threading
+import time
+
+MAX_BATCH_OPS = 500
+# Errors meaning Firestore applied nothing and would reject the same write again:
+# a group failing with one of these is retried member by member, so one bad
+# write does not fail the others. Anything else (timeouts) may have been applied
+# and fails the whole group rather than risk counting increments twice.
+ISOLATABLE_ERRORS = ("NotFound", "InvalidArgument", "FailedPrecondition", "AlreadyExists")
+
+# Server commit time of the batch this context committed last, or None when it was
+# left to the journal; read (and reset) by whoever invalidates after the write
+last_commit_time = contextvars.ContextVar("last_commit_time", default=None)
+
+
+class CoalescedBatch:
+    """Stand-in for a Firestore WriteBatch that records writes for WriteCoalescer"""
+    def __init__(self, coalescer):
+        self._coalescer = coalescer
+        self.writes = []
+        # document path -> (reference, {field: amount})
+        self.increments = {}
+        # (reference, {field: value}) the document must still match when a journaled entry is replayed
+        self.guards = []
+        self.entry = None
+        self.error = None
+        self.commit_time = None
+
+    def set(self, reference, document_data, merge=False):
+        self.writes.append(("set", reference, document_data, merge))
+
+    def update(self, reference, field_updates):
+        self.writes.append(("update", reference, field_updates, None))
+
+    def delete(self, reference):
+        self.writes.append(("delete", reference, None, None))
+
+    def increment(self, reference, field, amount):
+        """Add amount to a numeric field; merged with the rest of the group's increments"""
+        if not amount:
+            return
+        _, fields = self.increments.setdefault(reference.path, (reference, {}))
+        fields[field] = fields.get(field, 0) + amount
+
+    def expect(self, reference, fields):
+        """Only replay these writes later if reference still has these field values"""
+        self.guards.append((reference, fields))
+
+    def __len__(self):
+        return len(self.writes) + len(self.increments)
+
+    def commit(self):
+        try:
+            self._coalescer.commit(self)
+        finally:
+            last_commit_time.set(self.commit_time)
+
+
+class _Group:
+    __slots__ = ("members", "ops", "done")
+
+    def __init__(self, member):
+        self.members = [member]
+        self.ops = len(member)
+        self.done = threading.Event()
+
+
+class WriteCoalescer:
+    def __init__(self, new_batch, increment, window=0.015, max_ops=MAX_BATCH_OPS, journal=None,
+                 commit_timeout=None):
+        # new_batch() -> Firestore WriteBatch; increment(amount) -> Increment transform
+        self.new_batch = new_batch
+        self.increment = increment
+        self.window = window
+        self.max_ops = max_ops
+        self.journal = journal
+        self.commit_timeout = commit_timeout
+        self._lock = threading.Lock()
+        self._collecting = None
+        self._in_flight = 0
+        self._last_group_size = 1
+        self.stats = {"groups": 0, "writes": 0, "largest_group": 0, "isolated_retries": 0}
+
+    def batch(self):
+        return CoalescedBatch(self)
+
+    def commit(self, member):
+        """Commit member with whatever else arrives inside the window; raises member's own error"""
+        # A journaled member also commits its marker
+        size = len(member) + (1 if self.journal is not None else 0)
+        with self._lock:
+            group = self._collecting
+            if group is not None and group.ops + size <= self.max_ops:
+                group.members.append(member)
+                group.ops += size
+                leader = False
+            else:
+                group = self._collecting = _Group(member)
+                group.ops = size
+                leader = True
+                concurrent = self._in_flight > 0 or self._last_group_size > 1
+        if leader:
+            if self.window and concurrent:
+                time.sleep(self.window)
+            with self._lock:
+                if self._collecting is group:
+                    self._collecting = None
+                self._in_flight += 1
+            try:
+                self._flush(group)
+            finally:
+                with self._lock:
+                    self._in_flight -= 1
+                    self._last_group_size = len(group.members)
+                group.done.set()
+        else:
+            group.done.wait()
+        if member.error is not None:
+            raise member.error
+
+    def _write(self, members):
+        batch = self.new_batch()
+        counters = {}
+        for member in members:
+            for kind, reference, data, merge in member.writes:
+                if kind == "set":
+                    batch.set(reference, data, merge=merge)
+                elif kind == "update":
+                    batch.update(reference, data)
+                else:
+                    batch.delete(reference)
+            if member.entry is not None:
+                for reference, data in self.journal.markers([member]):
+                    batch.set(reference, data)
+            for path, (reference, fields) in member.increments.items():
+                _, merged = counters.setdefault(path, (reference, {}))
+                for field, amount in fields.items():
+                    merged[field] = merged.get(field, 0) + amount
+        writes = sum(len(member.writes) + (member.entry is not None) for member in members)
+        for reference, fields in counters.values():
+            fields = {field: self.increment(amount) for field, amount in fields.items() if amount}
+            if fields:
+                batch.set(reference, fields, merge=True)
+                writes += 1
+        if writes:
+            if self.commit_timeout:
+                results = batch.commit(timeout=self.commit_timeout)
+            else:
+                results = batch.commit()
+            commit_time = max((result.update_time for result in results or ()
+                               if getattr(result, "update_time", None) is not None), default=None)
+            for member in members:
+                member.commit_time = commit_time
+
+    def _finish(self, members, error=None):
+        """Record the outcome of committing members: done, or failed with error"""
+        journaled = all(member.entry is not None for member in members)
+        if error is None:
+            if journaled:
+                self.journal.settle(members)
+        elif journaled and type(error).__name__ not in ISOLATABLE_ERRORS:
+            # May or may not have been applied: the writes are on disk, so the callers are
+            # acknowledged and the replayer finds out from the markers
+            self.journal.release(members, error)
+        else:
+            if journaled:
+                self.journal.settle(members, error)
+            for member in members:
+                member.error = error
+
+    def _flush(self, group):
+        members = group.members
+        journaled = self.journal is not None and self.journal.record(members)
+        if journaled and self.journal.defer():
+            # Older entries are still waiting, or Firestore is down: queue behind them
+            self.journal.release(members)
+        else:
+            try:
+                self._write(members)
+            except Exception as e:
+                if len(members) > 1 and type(e).__name__ in ISOLATABLE_ERRORS:
+                    self.stats["isolated_retries"] += 1
+                    for member in members:
+                        try:
+                            self._write([member])
+                        except Exception as member_error:
+                            self._finish([member], member_error)
+                        else:
+                            self._finish([member])
+                else:
+                    self._finish(members, e)
+            else:
+                self._finish(members)
+        self.stats["groups"] += 1
+        self.stats["writes"] += len(members)
+        self.stats["largest_group"] = max(self.stats["largest_group"], len(members))
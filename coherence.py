@@ -0,0 +1,259 @@
+"""Cache coherence between workers and instances.
+
+Every process keeps its own read cache and mirrors, so a write handled by
+one worker has to reach the others before they serve that data again.
+
+On one host that is a small memory-mapped table of dataset versions (in
+/dev/shm where there is one) shared by every worker: a write bumps its
+(property, dataset) counters under a file lock before its response goes
+out, and each request first compares the counters with the ones its
+process last saw and drops whatever a peer changed. A request that starts
+after a write returned never reads around it, whichever worker it lands on.
+
+Across instances the same changes go out on a pluggable transport
+(udp:// peers, or redis:// when the redis package is installed). A receiver
+bumps its own host's table, so all of its workers catch up on their next
+request. That path is asynchronous, so an instance can serve the old data
+for as long as a message takes.
+"""
+import fcntl
+import json
+import logging
+import mmap
+import os
+import secrets
+import socket
+import struct
+import threading
+import zlib
+from urllib.parse import parse_qs, urlparse
+
+logger = logging.getLogger(__name__)
+
+_HEADER = struct.Struct("<8sQ")
+_MAGIC = b"lodgever"
+# Properties hash into this many rows; a collision only costs an extra invalidation
+TENANT_SLOTS = 64
+MAX_MESSAGE_BYTES = 4096
+
+
+class VersionTable:
+    """Per-(tenant, dataset) counters in a file every process on the host maps"""
+    def __init__(self, directory, datasets, tenant_slots=TENANT_SLOTS):
+        self.datasets = tuple(datasets)
+        self.tenant_slots = tenant_slots
+        layout = zlib.crc32(",".join(self.datasets).encode("utf-8"))
+        self.path = os.path.join(directory, f"versions-{layout:08x}-{tenant_slots}.bin")
+        self._row = struct.Struct(f"<{len(self.datasets)}Q")
+        self._size = _HEADER.size + self._row.size * tenant_slots
+        self._lock = threading.Lock()
+        self._pid = None
+        self._fd = None
+        self._map = None
+        self.epoch = None
+
+    def _open(self):
+        # Opened per process: a descriptor inherited across fork shares its flock with the parent
+        if self._pid == os.getpid():
+            return
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        try:
+            if os.fstat(fd).st_size != self._size:
+                os.ftruncate(fd, self._size)
+                os.pwrite(fd, _HEADER.pack(_MAGIC, secrets.randbits(63)), 0)
+        finally:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+        self._map = mmap.mmap(fd, self._size)
+        self._fd = fd
+        self._pid = os.getpid()
+        self.epoch = _HEADER.unpack_from(self._map, 0)[1]
+
+    def _offset(self, tenant):
+        return _HEADER.size + self._row.size * (zlib.crc32(tenant.encode("utf-8")) % self.tenant_slots)
+
+    def read(self, tenant):
+        """Counters for every dataset of tenant, in self.datasets order"""
+        with self._lock:
+            self._open()
+            return self._row.unpack_from(self._map, self._offset(tenant))
+
+    def bump(self, tenant, datasets):
+        """Increment datasets for tenant; returns (counters before, counters after)"""
+        with self._lock:
+            self._open()
+            offset = self._offset(tenant)
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+            try:
+                before = self._row.unpack_from(self._map, offset)
+                after = tuple(value + 1 if dataset in datasets else value
+                              for dataset, value in zip(self.datasets, before))
+                self._row.pack_into(self._map, offset, *after)
+            finally:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+            return before, after
+
+
+class UdpTransport:
+    """udp://host:port?peers=host:port,host:port - datagrams to a fixed list of instances"""
+    def __init__(self, url):
+        parsed = urlparse(url)
+        self.address = (parsed.hostname or "0.0.0.0", parsed.port or 7071)
+        peers = ",".join(parse_qs(parsed.query).get("peers", []))
+        self.peers = [(host, int(port)) for host, _, port in
+                      (peer.strip().rpartition(":") for peer in peers.split(",") if peer.strip())]
+        self._socket = None
+
+    def start(self, deliver):
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if hasattr(socket, "SO_REUSEPORT"):
+            # Every worker binds; the kernel hands each datagram to one of them, which is
+            # enough because the receiver bumps the table all of them read
+            self._socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        self._socket.bind(self.address)
+
+        def receive():
+            while True:
+                payload, _ = self._socket.recvfrom(MAX_MESSAGE_BYTES)
+                deliver(payload)
+
+        threading.Thread(target=receive, name="coherence-udp", daemon=True).start()
+
+    def send(self, payload):
+        for peer in self.peers:
+            self._socket.sendto(payload, peer)
+
+
+class RedisTransport:
+    """redis://host:port/db?channel=name - pub/sub through a Redis server (needs the redis package)"""
+    def __init__(self, url):
+        import redis
+        parsed = urlparse(url)
+        self.channel = (parse_qs(parsed.query).get("channel") or ["lodge-coherence"])[0]
+        self._client = redis.Redis.from_url(parsed._replace(query="").geturl())
+
+    def start(self, deliver):
+        pubsub = self._client.pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(self.channel)
+
+        def receive():
+            for message in pubsub.listen():
+                deliver(message["data"])
+
+        threading.Thread(target=receive, name="coherence-redis", daemon=True).start()
+
+    def send(self, payload):
+        self._client.publish(self.channel, payload)
+
+
+TRANSPORTS = {"udp": UdpTransport, "redis": RedisTransport}
+
+
+def register_transport(scheme, factory):
+    """factory(url) -> object with start(deliver) and send(payload)"""
+    TRANSPORTS[scheme] = factory
+
+
+def transport_from_url(url):
+    scheme = urlparse(url).scheme
+    if scheme not in TRANSPORTS:
+        raise ValueError(f"No coherence transport for {scheme}://")
+    return TRANSPORTS[scheme](url)
+
+
+class Coherence:
+    """Publishes local writes and applies peers' through on_change(tenant, datasets)
+
+    Messages naming a tenant outside known_tenants are dropped, so a peer can't
+    bump table rows or create per-tenant state for a property this process doesn't serve.
+    """
+    def __init__(self, datasets, on_change, table=None, transport_url=None, known_tenants=None):
+        self.datasets = tuple(datasets)
+        self.on_change = on_change
+        self.known_tenants = frozenset(known_tenants) if known_tenants is not None else None
+        self.table = table
+        self.transport_url = transport_url
+        # Made before gunicorn forks, so one per instance: messages from this host are skipped,
+        # the shared table has already covered them
+        self.origin = secrets.token_hex(8)
+        self._transport = None
+        self._transport_pid = None
+        self._seen = {}
+        self._lock = threading.Lock()
+        self.stats = {"published": 0, "received": 0, "peer_changes": 0, "rejected": 0, "errors": 0}
+
+    def start(self):
+        """Connect the network transport in this process (after fork, not in the preloading master)"""
+        if not self.transport_url or self._transport_pid == os.getpid():
+            return
+        self._transport_pid = os.getpid()
+        self._transport = transport_from_url(self.transport_url)
+        self._transport.start(self._deliver)
+
+    def versions(self, tenant, datasets):
+        """(epoch, counters) for datasets from the shared table, or None without one"""
+        if self.table is None:
+            return None
+        counters = dict(zip(self.datasets, self.table.read(tenant)))
+        return self.table.epoch, [counters[dataset] for dataset in datasets]
+
+    def publish(self, tenant, datasets):
+        """A write in this process changed datasets; the caller has already dropped its own copies"""
+        if self.table is not None:
+            before, after = self.table.bump(tenant, datasets)
+            with self._lock:
+                seen = self._seen.get(tenant)
+                if seen is not None:
+                    # Only skip our own bump: a peer's that this process has not seen yet still
+                    # has to be picked up by the next sync
+                    self._seen[tenant] = tuple(new if old == prior else prior for old, new, prior
+                                               in zip(before, after, seen))
+        if self._transport is not None:
+            payload = json.dumps({"origin": self.origin, "tenant": tenant, "datasets": list(datasets)})
+            self._transport.send(payload.encode("utf-8"))
+        self.stats["published"] += 1
+
+    def sync(self, tenant):
+        """Apply whatever peers on this host changed for tenant since this process last looked"""
+        if self.table is None:
+            return []
+        current = self.table.read(tenant)
+        with self._lock:
+            seen = self._seen.get(tenant)
+            self._seen[tenant] = current
+        if seen is None or seen == current:
+            return []
+        changed = [dataset for dataset, old, new in zip(self.datasets, seen, current) if old != new]
+        self.stats["peer_changes"] += 1
+        self.on_change(tenant, changed)
+        return changed
+
+    def _deliver(self, payload):
+        try:
+            message = json.loads(payload)
+            if message.get("origin") == self.origin:
+                return
+            tenant = message.get("tenant")
+            if not isinstance(tenant, str) or (self.known_tenants is not None and tenant not in self.known_tenants):
+                self.stats["rejected"] += 1
+                logger.warning(f"Coherence message for unknown property {tenant!r} dropped")
+                return
+            datasets = [dataset for dataset in message.get("datasets", []) if dataset in self.datasets]
+            self.stats["received"] += 1
+            if self.table is not None:
+                # Every worker on this host picks it up from the table on its next request
+                self.table.bump(tenant, datasets)
+            else:
+                self.on_change(tenant, datasets)
+        except Exception as e:
+            self.stats["errors"] += 1
+            logger.error(f"Coherence message dropped: {str(e)}")
+
+    def status(self):
+        return {
+            "table": self.table.path if self.table is not None else None,
+            "transport": urlparse(self.transport_url).scheme if self.transport_url else None,
+            **self.stats,
+        }
@@ -0,0 +1,158 @@
+"""Deduplicated guest directory with prefix search for the check-in form.
+
+Guests are keyed by mobile number (digits only, the last ten), so the same
+person checking in, booking and settling later is one entry whatever name
+spelling each path used. GuestIndex keeps two sorted arrays of
+(term, key) pairs, one of mobile numbers and one of lower-cased names and
+name words, so a prefix query is two bisects and a short slice instead of a
+scan of rooms, bookings and settlements.
+"""
+import bisect
+import threading
+
+MOBILE_DIGITS = 10
+# Dialling code stripped from numbers typed with a leading + or 00
+COUNTRY_CODE = "91"
+# Index entries looked at per query before ranking
+SCAN_LIMIT = 200
+
+
+def guest_key(mobile):
+    """Directory key for a mobile number, or None if it has too few digits to be one"""
+    digits = "".join(ch for ch in str(mobile or "") if ch.isdigit())
+    if len(digits) < MOBILE_DIGITS:
+        return None
+    return digits[-MOBILE_DIGITS:]
+
+
+def mobile_prefix(query):
+    """The start of a directory key that a typed (possibly partial) number can match"""
+    typed = query.replace(" ", "").replace("-", "")
+    digits = "".join(ch for ch in typed if ch.isdigit())
+    if typed.startswith("+") or digits.startswith("00"):
+        digits = digits[2:] if digits.startswith("00") else digits
+        if digits.startswith(COUNTRY_CODE):
+            digits = digits[len(COUNTRY_CODE):]
+    elif digits.startswith("0"):
+        # Trunk prefix
+        digits = digits[1:]
+    return digits[-MOBILE_DIGITS:]
+
+
+def pending_amount(guest):
+    return sum(amount or 0 for amount in (guest.get("pending_settlements") or {}).values())
+
+
+def _name_terms(name):
+    name = " ".join((name or "").lower().split())
+    if not name:
+        return set()
+    return {name, *name.split(" ")}
+
+
+class GuestIndex:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._guests = {}
+        self._mobiles = []
+        self._names = []
+        # The documents dict the index was last rebuilt from, see replace()
+        self.source = None
+
+    def __len__(self):
+        return len(self._guests)
+
+    def get(self, key):
+        guest = self._guests.get(key)
+        return dict(guest) if guest is not None else None
+
+    def _terms(self, key, guest):
+        return [(key, key)], [(term, key) for term in _name_terms(guest.get("name"))]
+
+    def _remove_locked(self, key):
+        guest = self._guests.pop(key, None)
+        if guest is None:
+            return
+        mobiles, names = self._terms(key, guest)
+        for array, entries in ((self._mobiles, mobiles), (self._names, names)):
+            for entry in entries:
+                i = bisect.bisect_left(array, entry)
+                if i < len(array) and array[i] == entry:
+                    del array[i]
+
+    def upsert(self, key, guest):
+        with self._lock:
+            self._remove_locked(key)
+            self._guests[key] = guest
+            mobiles, names = self._terms(key, guest)
+            for entry in mobiles:
+                bisect.insort(self._mobiles, entry)
+            for entry in names:
+                bisect.insort(self._names, entry)
+
+    def remove(self, key):
+        with self._lock:
+            self._remove_locked(key)
+
+    def replace(self, documents):
+        """Rebuild from a full {key: guest} snapshot"""
+        mobiles, names = [], []
+        for key, guest in documents.items():
+            key_mobiles, key_names = self._terms(key, guest)
+            mobiles.extend(key_mobiles)
+            names.extend(key_names)
+        mobiles.sort()
+        names.sort()
+        with self._lock:
+            self._guests = dict(documents)
+            self._mobiles = mobiles
+            self._names = names
+            self.source = documents
+
+    def apply_changes(self, documents, changes):
+        """SnapshotMirror on_change hook: changes is None for a full snapshot"""
+        if changes is None:
+            self.replace(documents)
+            return
+        for key, guest in changes:
+            if guest is None:
+                self.remove(key)
+            else:
+                self.upsert(key, guest)
+
+    def search(self, query, limit=8):
+        """Guests whose mobile or any name word starts with query, most recent first"""
+        query = " ".join((query or "").lower().split())
+        if not query:
+            return []
+        digits = "".join(ch for ch in query if ch.isdigit())
+        if digits and len(digits) == len(query.replace(" ", "").replace("-", "").lstrip("+")):
+            # Typed with a country code or leading zero, maybe only partly
+            field, prefix = "_mobiles", mobile_prefix(query)
+            if not prefix:
+                return []
+        else:
+            field, prefix = "_names", query
+        with self._lock:
+            array = getattr(self, field)
+            start = bisect.bisect_left(array, (prefix,))
+            end = bisect.bisect_left(array, (prefix + "\uffff",), lo=start)
+            keys = dict.fromkeys(key for _, key in array[start:min(end, start + SCAN_LIMIT)])
+            matches = [(key, self._guests[key]) for key in keys]
+        matches.sort(key=lambda match: match[1].get("last_seen") or "", reverse=True)
+        return [self.describe(key, guest) for key, guest in matches[:limit]]
+
+    @staticmethod
+    def describe(key, guest):
+        """Autocomplete row for one guest"""
+        pending = guest.get("pending_settlements") or {}
+        return {
+            "key": key,
+            "name": guest.get("name"),
+            "mobile": guest.get("mobile") or key,
+            "photo": guest.get("photo"),
+            "visits": guest.get("visits", 0),
+            "last_seen": guest.get("last_seen"),
+            "pending_settlements": len(pending),
+            "pending_amount": pending_amount(guest),
+        }
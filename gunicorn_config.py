@@ -4,17 +4,23 @@ import os
 bind = f"0.0.0.0:{os.environ.get('PORT', 10000)}"
 backlog = 128
 
-# CRITICAL: Only 1 worker on free tier
+# CRITICAL: Only 1 worker on free tier. Threads let concurrent requests share
+# Firestore commits (see coalescer.py); a sync worker handles one request at a
+# time, so every write group would be a single write.
 workers = 1
-worker_class = 'sync'
-worker_connections = 5
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', 8))
 timeout = 300  # 5 minutes for slow Firebase
 graceful_timeout = 30
 keepalive = 5
 
-# Worker recycling
-max_requests = 50
-max_requests_jitter = 10
+# Worker recycling - off unless GUNICORN_MAX_REQUESTS is set. The worker holds the
+# snapshot mirrors and their listeners, the renewal heap, the guest index and the
+# write journal's replayer; a restart rebuilds all of them from full Firestore reads
+# and adopts the journal again, so recycling every few dozen requests would undo
+# most of what they save.
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 0))
+max_requests_jitter = max_requests // 10
 
 # Logging
 accesslog = None
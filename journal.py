@@ -0,0 +1,667 @@
+"""Local write-ahead journal for the write routes.
+
+Without it a write route waits on Firestore for as long as Firestore takes,
+so an outage stalls the front desk until the worker is killed. With a
+journal the coalescer first appends each request's writes to a SQLite
+database on local disk (WAL mode, synchronous=FULL, one fsync per group)
+and a request is acknowledged once its entry is on disk. The group is then
+committed to Firestore as before; if that fails or times out, or older
+entries are still waiting, the entries stay pending and a background
+replayer applies them one by one, in journal order, once Firestore answers.
+
+Every commit of an entry also writes a marker document named after it, and
+the replayer applies an entry in a transaction that reads its marker first,
+so an entry whose commit did land (a timeout after the server applied it)
+is not applied twice. An entry can carry guards - field values a document
+must still have, such as the room a check-in fills still being vacant. A
+replayed entry whose guards no longer hold was overtaken by another write
+while it waited, and is set aside as a conflict instead of overwriting it.
+
+Each process appends to its own file and holds a lock on it; files left by
+a process that died are adopted and replayed ahead of new entries. Once an
+adopted file is drained, its conflicts and rejections move into the
+adopter's file, so they stay listed until an operator retries or discards
+them (conflicts(), resolve()). Until entries reach Firestore, overlay()
+applies them to documents read from Firestore or a mirror, so the desk sees
+its own writes.
+"""
+import fcntl
+import glob
+import json
+import logging
+import os
+import secrets
+import sqlite3
+import threading
+import time
+from collections import deque
+from datetime import datetime, timedelta, timezone
+
+from coalescer import ISOLATABLE_ERRORS
+
+logger = logging.getLogger(__name__)
+
+# Marks a Firestore transform or sentinel in journaled JSON
+TAG = "$journal"
+MARKER_COLLECTION = "journal_markers"
+RETRY_MAX_SECONDS = 30
+IDLE_SECONDS = 60
+PRUNE_INTERVAL = 600
+# Entry states that wait for an operator; resolve() moves them to 'resolved'
+UNRESOLVED = ("conflict", "rejected")
+ENTRY_COLUMNS = ("id", "created", "writes", "guards", "state", "attempts", "error", "settled", "origin")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS entries (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    created REAL NOT NULL,
+    writes TEXT NOT NULL,
+    guards TEXT NOT NULL,
+    state TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    settled REAL,
+    origin TEXT
+);
+CREATE INDEX IF NOT EXISTS entries_state ON entries (state, id);
+"""
+
+
+class JournalConflict(Exception):
+    """A replayed entry's guards no longer hold"""
+
+
+class Codec:
+    """Firestore write values to JSON and back; transforms and sentinels become tagged objects"""
+    def __init__(self, firestore):
+        self.firestore = firestore
+
+    def encode(self, value):
+        fs = self.firestore
+        if value is None or isinstance(value, (str, bool, int, float)):
+            return value
+        if isinstance(value, dict):
+            return {str(key): self.encode(item) for key, item in value.items()}
+        if isinstance(value, (list, tuple)):
+            return [self.encode(item) for item in value]
+        if value is fs.DELETE_FIELD:
+            return {TAG: "delete"}
+        if value is fs.SERVER_TIMESTAMP:
+            return {TAG: "server_timestamp"}
+        if isinstance(value, fs.ArrayUnion):
+            return {TAG: "array_union", "values": self.encode(list(value.values))}
+        if isinstance(value, fs.ArrayRemove):
+            return {TAG: "array_remove", "values": self.encode(list(value.values))}
+        if isinstance(value, fs.Increment):
+            return {TAG: "increment", "value": value.value}
+        raise TypeError(f"Cannot journal a {type(value).__name__}")
+
+    def decode(self, value):
+        fs = self.firestore
+        if isinstance(value, list):
+            return [self.decode(item) for item in value]
+        if not isinstance(value, dict):
+            return value
+        tag = value.get(TAG)
+        if tag is None:
+            return {key: self.decode(item) for key, item in value.items()}
+        if tag == "delete":
+            return fs.DELETE_FIELD
+        if tag == "server_timestamp":
+            return fs.SERVER_TIMESTAMP
+        if tag == "array_union":
+            return fs.ArrayUnion(self.decode(value["values"]))
+        if tag == "array_remove":
+            return fs.ArrayRemove(self.decode(value["values"]))
+        return fs.Increment(value["value"])
+
+
+def _apply_value(current, value):
+    if isinstance(value, dict) and TAG in value:
+        tag = value[TAG]
+        if tag == "array_union":
+            return list(current or []) + [item for item in value["values"] if item not in (current or [])]
+        if tag == "array_remove":
+            return [item for item in (current or []) if item not in value["values"]]
+        if tag == "increment":
+            return (current if isinstance(current, (int, float)) else 0) + value["value"]
+        if tag == "server_timestamp":
+            return datetime.now(timezone.utc)
+    return value
+
+
+def _merge(current, value):
+    if isinstance(value, dict) and TAG not in value:
+        merged = dict(current) if isinstance(current, dict) else {}
+        for key, item in value.items():
+            if isinstance(item, dict) and item.get(TAG) == "delete":
+                merged.pop(key, None)
+            else:
+                merged[key] = _merge(merged.get(key), item)
+        return merged
+    return _apply_value(current, value)
+
+
+def apply_write(document, kind, data, merge=False):
+    """document (a dict, or None when missing) after one journaled write, as Firestore would leave it"""
+    if kind == "delete":
+        return None
+    if kind == "set":
+        return _merge(document if merge else None, data)
+    if document is None:
+        # Firestore rejects an update to a missing document
+        return None
+    updated = dict(document)
+    for field_path, value in data.items():
+        *parents, leaf = field_path.split(".")
+        target = updated
+        for parent in parents:
+            child = target.get(parent)
+            target[parent] = child = dict(child) if isinstance(child, dict) else {}
+            target = child
+        if isinstance(value, dict) and value.get(TAG) == "delete":
+            target.pop(leaf, None)
+        else:
+            target[leaf] = _apply_value(target.get(leaf), value)
+    return updated
+
+
+def _field(document, field_path):
+    value = document
+    for part in field_path.split("."):
+        if not isinstance(value, dict):
+            return None
+        value = value.get(part)
+    return value
+
+
+class JournalFile:
+    """One process's entries: a SQLite database whose appends are fsync'd before they return"""
+    def __init__(self, path, lock_fd):
+        self.path = path
+        self._lock_fd = lock_fd
+        self._lock = threading.Lock()
+        # Appends must survive a crash; settling can be lost, the markers catch a replay of a landed entry
+        self._durable = self._connect("FULL")
+        self._durable.executescript(SCHEMA)
+        columns = {row[1] for row in self._durable.execute("PRAGMA table_info(entries)")}
+        if "origin" not in columns:
+            self._durable.execute("ALTER TABLE entries ADD COLUMN origin TEXT")
+        self._fast = self._connect("NORMAL")
+        row = self._durable.execute("SELECT value FROM meta WHERE key = 'id'").fetchone()
+        if row is None:
+            self.id = secrets.token_hex(6)
+            self._durable.execute("INSERT INTO meta (key, value) VALUES ('id', ?)", (self.id,))
+        else:
+            self.id = row[0]
+        # id -> (created, writes, guards) for every pending entry, oldest first
+        self.pending = {
+            entry_id: (created, json.loads(writes), json.loads(guards))
+            for entry_id, created, writes, guards in self._durable.execute(
+                "SELECT id, created, writes, guards FROM entries WHERE state = 'pending' ORDER BY id")
+        }
+
+    def _connect(self, synchronous):
+        connection = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None, timeout=30)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute(f"PRAGMA synchronous={synchronous}")
+        return connection
+
+    def append(self, entries):
+        """Store [(writes, guards)] in one fsync'd transaction; returns their ids"""
+        now = time.time()
+        with self._lock:
+            ids = []
+            self._durable.execute("BEGIN IMMEDIATE")
+            try:
+                for writes, guards in entries:
+                    cursor = self._durable.execute(
+                        "INSERT INTO entries (created, writes, guards) VALUES (?, ?, ?)",
+                        (now, json.dumps(writes), json.dumps(guards)))
+                    ids.append(cursor.lastrowid)
+                self._durable.execute("COMMIT")
+            except Exception:
+                self._durable.execute("ROLLBACK")
+                raise
+            for entry_id, (writes, guards) in zip(ids, entries):
+                self.pending[entry_id] = (now, writes, guards)
+            return ids
+
+    def settle(self, entry_ids, state, error=None):
+        with self._lock:
+            self._fast.executemany(
+                "UPDATE entries SET state = ?, error = ?, settled = ? WHERE id = ?",
+                [(state, error, time.time(), entry_id) for entry_id in entry_ids])
+            for entry_id in entry_ids:
+                self.pending.pop(entry_id, None)
+
+    def failed_attempt(self, entry_id, error):
+        with self._lock:
+            self._fast.execute("UPDATE entries SET attempts = attempts + 1, error = ? WHERE id = ?",
+                               (error, entry_id))
+
+    def count(self, state):
+        with self._lock:
+            return self._fast.execute("SELECT COUNT(*) FROM entries WHERE state = ?", (state,)).fetchone()[0]
+
+    def prune(self, older_than):
+        """Drop applied and resolved entries settled before older_than; unresolved ones stay for review"""
+        with self._lock:
+            self._fast.execute("DELETE FROM entries WHERE state IN ('applied', 'resolved') AND settled < ?",
+                               (older_than,))
+
+    def unresolved(self):
+        """Conflicts and rejections as dicts of ENTRY_COLUMNS, oldest first"""
+        with self._lock:
+            return _unresolved_rows(self._fast)
+
+    def take_over(self, rows, origin):
+        """Copy another file's unresolved rows in, durably, remembering where they came from"""
+        with self._lock:
+            self._durable.execute("BEGIN IMMEDIATE")
+            try:
+                self._durable.executemany(
+                    "INSERT INTO entries (created, writes, guards, state, attempts, error, settled, origin)"
+                    " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    [(row["created"], row["writes"], row["guards"], row["state"], row["attempts"],
+                      row["error"], row["settled"], row["origin"] or f"{origin}-{row['id']}") for row in rows])
+                self._durable.execute("COMMIT")
+            except Exception:
+                self._durable.execute("ROLLBACK")
+                raise
+
+    def close(self, remove=False):
+        with self._lock:
+            self._durable.close()
+            self._fast.close()
+            if remove:
+                for path in (self.path, f"{self.path}-wal", f"{self.path}-shm"):
+                    if os.path.exists(path):
+                        os.remove(path)
+            os.close(self._lock_fd)
+
+
+def _unresolved_rows(connection):
+    placeholders = ", ".join("?" for _ in UNRESOLVED)
+    cursor = connection.execute(f"SELECT {', '.join(ENTRY_COLUMNS)} FROM entries"
+                                f" WHERE state IN ({placeholders}) ORDER BY id", UNRESOLVED)
+    return [dict(zip(ENTRY_COLUMNS, row)) for row in cursor]
+
+
+def _file_id(connection):
+    row = connection.execute("SELECT value FROM meta WHERE key = 'id'").fetchone()
+    return row[0] if row else None
+
+
+def _lock_file(path):
+    """An fd holding an exclusive flock on path, or None if a live process holds it"""
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        os.close(fd)
+        return None
+    return fd
+
+
+class Journal:
+    """Journal the coalescer writes through; see the module docstring
+
+    document(path) -> DocumentReference, transaction() -> Transaction and transactional(func)
+    are the Firestore calls replay needs; call(func, *args) wraps each replay attempt (a circuit
+    breaker) and available() says whether a direct commit is worth trying. on_replay(paths) is
+    called after a replayed entry reaches Firestore.
+    """
+    def __init__(self, directory, codec, document, transaction, transactional, call=None,
+                 available=None, on_replay=None, keep_seconds=86400):
+        self.directory = directory
+        self.codec = codec
+        self.document = document
+        self.transaction = transaction
+        self.transactional = transactional
+        self.call = call or (lambda func, *args: func(*args))
+        self.available = available or (lambda: True)
+        self.on_replay = on_replay
+        self.keep_seconds = keep_seconds
+        self._pid = None
+        self._own = None
+        self._adopted = []
+        # Entries whose direct commit is still running; the replayer leaves them alone
+        self._in_flight = set()
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._pruned_at = 0.0
+        self._failures = 0
+        self.last_error = None
+        self.recent_conflicts = deque(maxlen=5)
+        self.stats = {"appended": 0, "committed": 0, "deferred": 0, "commit_failures": 0,
+                      "replayed": 0, "duplicates": 0, "conflicts": 0, "rejected": 0, "errors": 0}
+
+    def start(self):
+        """Open this process's journal file and start its replayer (after fork, once per process)"""
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            os.makedirs(self.directory, exist_ok=True)
+            path = os.path.join(self.directory, f"journal-{os.getpid()}.db")
+            lock_fd = _lock_file(path)
+            if lock_fd is None:
+                raise RuntimeError(f"Journal {path} is locked by another process")
+            self._own = JournalFile(path, lock_fd)
+            self._adopted = []
+            self._in_flight = set()
+            self._pid = os.getpid()
+        self._adopt()
+        threading.Thread(target=self._run, name="journal-replay", daemon=True).start()
+
+    def _adopt(self):
+        """Take over journal files whose process has exited"""
+        adopted = {journal_file.path for journal_file in self._adopted}
+        for path in sorted(glob.glob(os.path.join(self.directory, "journal-*.db")), key=os.path.getmtime):
+            if path == self._own.path or path in adopted:
+                continue
+            lock_fd = _lock_file(path)
+            if lock_fd is None:
+                continue
+            journal_file = JournalFile(path, lock_fd)
+            if journal_file.pending:
+                logger.warning(f"Adopted {len(journal_file.pending)} unreplayed journal entries from {path}")
+                self._adopted.append(journal_file)
+            else:
+                self._retire(journal_file)
+
+    def _retire(self, journal_file):
+        """Remove a drained adopted file, keeping its unresolved entries in this process's file"""
+        rows = journal_file.unresolved()
+        if rows:
+            self._own.take_over(rows, journal_file.id)
+            logger.warning(f"Kept {len(rows)} unresolved journal entries from {journal_file.path}")
+        journal_file.close(remove=True)
+
+    def _files(self):
+        return [*self._adopted, self._own]
+
+    def backlog(self):
+        """Entries waiting for the replayer"""
+        if self._own is None:
+            return 0
+        return (len(self._own.pending.keys() - self._in_flight)
+                + sum(len(journal_file.pending) for journal_file in self._adopted))
+
+    # Coalescer hooks
+
+    def record(self, members):
+        """Append one entry per member; False (and no entries) if the journal cannot take them"""
+        try:
+            self.start()
+            entries = []
+            for member in members:
+                writes = [[kind, reference.path, self.codec.encode(data), bool(merge)]
+                          for kind, reference, data, merge in member.writes]
+                writes += [["set", path, {field: {TAG: "increment", "value": amount}
+                                          for field, amount in fields.items()}, True]
+                           for path, (reference, fields) in member.increments.items()]
+                guards = [[reference.path, self.codec.encode(fields)] for reference, fields in member.guards]
+                entries.append((writes, guards))
+            ids = self._own.append(entries)
+        except Exception as e:
+            self.stats["errors"] += 1
+            logger.error(f"Journal append failed, committing without it: {str(e)}")
+            return False
+        for member, entry_id in zip(members, ids):
+            member.entry = entry_id
+        with self._lock:
+            self._in_flight.update(ids)
+        self.stats["appended"] += len(ids)
+        return True
+
+    def defer(self):
+        """Whether new entries should wait for the replayer instead of committing now"""
+        return self.backlog() > 0 or not self.available()
+
+    def markers(self, members):
+        """(reference, data) marker writes to commit along with members' entries"""
+        return [self._marker(self._own, member.entry) for member in members]
+
+    def _marker(self, journal_file, entry_id):
+        reference = self.document(f"{MARKER_COLLECTION}/{journal_file.id}-{entry_id}")
+        # Only needed while the entry could still be replayed; a Firestore TTL policy on
+        # expires_at can delete it after that
+        expires_at = datetime.now(timezone.utc) + timedelta(seconds=self.keep_seconds)
+        return reference, {"journal": journal_file.id, "entry": entry_id, "expires_at": expires_at}
+
+    def settle(self, members, error=None):
+        """Members' entries were committed, or (with error) rejected for good"""
+        ids = [member.entry for member in members]
+        if error is None:
+            self._own.settle(ids, "applied")
+            self.stats["committed"] += len(ids)
+        else:
+            self._own.settle(ids, "rejected", str(error))
+            self.stats["rejected"] += len(ids)
+        with self._lock:
+            self._in_flight.difference_update(ids)
+
+    def release(self, members, error=None):
+        """Hand members' entries to the replayer: deferred, or a commit that may not have landed"""
+        if error is None:
+            self.stats["deferred"] += len(members)
+        else:
+            self.stats["commit_failures"] += 1
+            self.last_error = str(error)
+            logger.warning(f"Commit failed, {len(members)} journaled writes left for replay: {str(error)}")
+        with self._lock:
+            self._in_flight.difference_update(member.entry for member in members)
+        self._wake.set()
+
+    # Reads
+
+    def overlay(self, collection_path, documents, decode=None):
+        """documents ({doc_id: data}) of one collection with pending entries applied
+
+        Returns documents itself when nothing pending touches the collection; changed
+        documents come back as decode(dict), or plain dicts without decode.
+        """
+        if self._own is None or not any(journal_file.pending for journal_file in self._files()):
+            return documents
+        prefix = f"{collection_path}/"
+        result = None
+        for journal_file in self._files():
+            for _, writes, _ in list(journal_file.pending.values()):
+                for kind, path, data, merge in writes:
+                    if not path.startswith(prefix) or "/" in path[len(prefix):]:
+                        continue
+                    if result is None:
+                        result = dict(documents)
+                    doc_id = path[len(prefix):]
+                    current = result.get(doc_id)
+                    if current is not None and not isinstance(current, dict):
+                        current = current.to_dict()
+                    updated = apply_write(current, kind, data, merge)
+                    if updated is None:
+                        result.pop(doc_id, None)
+                    else:
+                        result[doc_id] = updated
+        if result is None:
+            return documents
+        if decode is not None:
+            result = {doc_id: decode(data) if isinstance(data, dict) else data for doc_id, data in result.items()}
+        return result
+
+    # Replay
+
+    def _run(self):
+        delay = 0
+        while True:
+            self._wake.wait(delay)
+            self._wake.clear()
+            try:
+                delay = self.replay()
+            except Exception as e:
+                self.stats["errors"] += 1
+                logger.error(f"Journal replay failed: {str(e)}")
+                delay = RETRY_MAX_SECONDS
+
+    def replay(self):
+        """Apply pending entries in order; returns seconds until the next attempt"""
+        self._adopt()
+        for journal_file in self._files():
+            for entry_id in list(journal_file.pending):
+                if journal_file is self._own and entry_id in self._in_flight:
+                    # Entries behind a commit still running have to wait for its outcome
+                    return 0.5
+                created, writes, guards = journal_file.pending[entry_id]
+                try:
+                    outcome = self.call(self._apply, journal_file, entry_id, writes, guards)
+                except Exception as e:
+                    if type(e).__name__ in ISOLATABLE_ERRORS:
+                        journal_file.settle([entry_id], "rejected", str(e))
+                        self.stats["rejected"] += 1
+                        logger.error(f"Journal entry {entry_id} rejected by Firestore: {str(e)}")
+                        continue
+                    journal_file.failed_attempt(entry_id, str(e))
+                    self.last_error = str(e)
+                    self._failures += 1
+                    return min(RETRY_MAX_SECONDS, 2 ** self._failures)
+                self._failures = 0
+                if isinstance(outcome, JournalConflict):
+                    journal_file.settle([entry_id], "conflict", str(outcome))
+                    self.stats["conflicts"] += 1
+                    self.recent_conflicts.append({"entry": f"{journal_file.id}-{entry_id}", "error": str(outcome),
+                                                  "queued_seconds": round(time.time() - created, 1)})
+                    logger.error(f"Journal entry {entry_id} conflicts with a newer write: {str(outcome)}")
+                    continue
+                journal_file.settle([entry_id], "applied")
+                if outcome:
+                    self.stats["replayed"] += 1
+                    if self.on_replay is not None:
+                        self.on_replay([path for _, path, _, _ in writes])
+                else:
+                    self.stats["duplicates"] += 1
+            if journal_file is not self._own:
+                self._adopted.remove(journal_file)
+                self._retire(journal_file)
+        self._failures = 0
+        self.last_error = None
+        if time.time() - self._pruned_at > PRUNE_INTERVAL:
+            self._own.prune(time.time() - self.keep_seconds)
+            self._pruned_at = time.time()
+        return IDLE_SECONDS
+
+    def _apply(self, journal_file, entry_id, writes, guards):
+        """Apply one entry in a transaction
+
+        Returns True once applied, False if its marker shows it had already landed, or the
+        JournalConflict when a guard fails (returned rather than raised, so a conflict does
+        not count as a Firestore failure in call).
+        """
+        marker, marker_data = self._marker(journal_file, entry_id)
+
+        def attempt(transaction):
+            if marker.get(transaction=transaction).exists:
+                return False
+            for path, fields in guards:
+                snapshot = self.document(path).get(transaction=transaction)
+                current = (snapshot.to_dict() if snapshot.exists else None) or {}
+                for field_path, expected in fields.items():
+                    actual = _field(current, field_path)
+                    if actual != expected:
+                        raise JournalConflict(f"{path} {field_path} is {actual!r}, expected {expected!r}")
+            for kind, path, data, merge in writes:
+                reference = self.document(path)
+                if kind == "set":
+                    transaction.set(reference, self.codec.decode(data), merge=merge)
+                elif kind == "update":
+                    transaction.update(reference, self.codec.decode(data))
+                else:
+                    transaction.delete(reference)
+            transaction.set(marker, marker_data)
+            return True
+
+        try:
+            return self.transactional(attempt)(self.transaction())
+        except JournalConflict as conflict:
+            return conflict
+
+    # Operators
+
+    def _peer_connections(self):
+        """Connections to the journal files other live processes hold; the caller closes them"""
+        loaded = {journal_file.path for journal_file in self._files()}
+        return [sqlite3.connect(path, isolation_level=None, timeout=30)
+                for path in sorted(glob.glob(os.path.join(self.directory, "journal-*.db"))) if path not in loaded]
+
+    def conflicts(self):
+        """Unresolved entries in every journal file of the directory, live workers' included"""
+        self.start()
+        listed = []
+        sources = [(journal_file.id, journal_file.unresolved()) for journal_file in self._files()]
+        for connection in self._peer_connections():
+            try:
+                sources.append((_file_id(connection), _unresolved_rows(connection)))
+            finally:
+                connection.close()
+        for file_id, rows in sources:
+            for row in rows:
+                writes = json.loads(row["writes"])
+                listed.append({
+                    "entry": f"{file_id}-{row['id']}",
+                    "state": row["state"],
+                    "error": row["error"],
+                    "created": datetime.fromtimestamp(row["created"], timezone.utc).isoformat(),
+                    "origin": row["origin"],
+                    "documents": sorted({path for _, path, _, _ in writes}),
+                    "writes": writes,
+                    "guards": json.loads(row["guards"]),
+                })
+        return listed
+
+    def resolve(self, entry, action):
+        """Retry (queue again, guards checked again) or discard an unresolved entry; False if not found"""
+        if action not in ("retry", "discard"):
+            raise ValueError(f"Unknown action: {action}")
+        self.start()
+        file_id, _, entry_id = entry.rpartition("-")
+        candidates = [(journal_file.id, journal_file._lock, journal_file._durable) for journal_file in self._files()]
+        peers = self._peer_connections()
+        try:
+            for connection in peers:
+                candidates.append((_file_id(connection), threading.Lock(), connection))
+            for candidate_id, lock, connection in candidates:
+                if candidate_id != file_id:
+                    continue
+                with lock:
+                    placeholders = ", ".join("?" for _ in UNRESOLVED)
+                    row = connection.execute(f"SELECT writes, guards FROM entries WHERE id = ?"
+                                             f" AND state IN ({placeholders})", (entry_id, *UNRESOLVED)).fetchone()
+                    if row is None:
+                        return False
+                    connection.execute("UPDATE entries SET state = 'resolved', error = ?, settled = ? WHERE id = ?",
+                                       (f"{action} by operator", time.time(), entry_id))
+                if action == "retry":
+                    self._own.append([(json.loads(row[0]), json.loads(row[1]))])
+                    self._wake.set()
+                logger.info(f"Journal entry {entry} resolved: {action}")
+                return True
+            return False
+        finally:
+            for connection in peers:
+                connection.close()
+
+    def status(self):
+        if self._own is None:
+            return {"directory": self.directory, "pending": 0, **self.stats}
+        pending = [created for journal_file in self._files() for created, _, _ in list(journal_file.pending.values())]
+        return {
+            "directory": self.directory,
+            "pending": len(pending),
+            "in_flight": len(self._in_flight),
+            "oldest_pending_seconds": round(time.time() - min(pending), 1) if pending else None,
+            "adopted_files": len(self._adopted),
+            "conflicts_recorded": sum(journal_file.count("conflict") for journal_file in self._files()),
+            "rejected_recorded": sum(journal_file.count("rejected") for journal_file in self._files()),
+            "last_error": self.last_error,
+            "recent_conflicts": list(self.recent_conflicts),
+            **self.stats,
+        }
@@ -0,0 +1,181 @@
+"""Local copies of Firestore queries kept current by on_snapshot listeners.
+
+A SnapshotMirror subscribes to a query (or a single document) and swaps in a
+new {doc_id: data} dict every time the listener delivers a snapshot, applying
+only the documents that changed, so a read is a dict lookup with no RPC. A
+supervisor thread resubscribes when the listen stream dies; until the first
+snapshot of the new stream arrives the mirror reports not ready and callers
+fall back to their Firestore read.
+
+After a local write, mark_dirty() keeps the mirror out of service until a
+snapshot arrives whose read time is at or after the write's commit time, so
+a client refreshing right after its own write never sees the pre-write state.
+"""
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+def _seconds(value):
+    """Epoch seconds from a Firestore timestamp or a number"""
+    return value.timestamp() if hasattr(value, "timestamp") else value
+
+
+class SnapshotMirror:
+    def __init__(self, name, target, decode=None, check_interval=10, dirty_timeout=5, on_snapshot=None,
+                 on_change=None):
+        self.name = name
+        # Called on every (re)subscribe; returns a query or document reference
+        self._target = target
+        # Applied to each document's dict before it is stored, e.g. a models.Record.from_dict
+        self._decode = decode
+        self.check_interval = check_interval
+        self.dirty_timeout = dirty_timeout
+        # on_snapshot(name, lag_seconds) after each delivered snapshot
+        self._on_snapshot_hook = on_snapshot
+        # on_change(documents, changes) with changes None for a full snapshot, else
+        # [(doc_id, data or None if removed), ...], for derived indexes
+        self._on_change_hook = on_change
+        self.state = "stopped"
+        self.reconnects = 0
+        self.read_time = None  # server time of the last snapshot
+        self.received_at = None  # local time it was delivered
+        self.lag = None
+        self._docs = None
+        self._watch = None
+        self._dirty_since = None  # local time of the first unmirrored write, for dirty_timeout
+        self._dirty_until = None  # server time a snapshot must reach to include the writes
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._supervise, name=f"mirror-{self.name}", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._unsubscribe()
+        with self._lock:
+            self._thread = None
+            self.state = "stopped"
+            self._docs = None
+
+    def _supervise(self):
+        while not self._stop.is_set():
+            watch = self._watch
+            if watch is None or not getattr(watch, "is_active", True):
+                self._subscribe(resubscribe=watch is not None)
+            self._stop.wait(self.check_interval)
+
+    def _subscribe(self, resubscribe):
+        self._unsubscribe()
+        with self._lock:
+            self.state = "connecting"
+            self._docs = None
+            if resubscribe:
+                self.reconnects += 1
+        if resubscribe:
+            logger.warning(f"Mirror {self.name} listener stopped, resubscribing")
+        try:
+            self._watch = self._target().on_snapshot(self._handle_snapshot)
+        except Exception as e:
+            logger.error(f"Mirror {self.name} could not subscribe: {str(e)}")
+            with self._lock:
+                self.state = "down"
+
+    def _unsubscribe(self):
+        watch, self._watch = self._watch, None
+        if watch is not None:
+            try:
+                watch.unsubscribe()
+            except Exception as e:
+                logger.debug(f"Mirror {self.name} unsubscribe failed: {str(e)}")
+
+    def _handle_snapshot(self, docs, changes, read_time):
+        current = self._docs
+        decode = self._decode or (lambda data: data)
+        if current is None:
+            snapshot = {doc.id: decode(doc.to_dict()) for doc in docs if doc.exists}
+        else:
+            # Copy-on-write: readers holding the previous dict never see it change
+            snapshot = dict(current)
+            for change in changes:
+                if change.type.name == "REMOVED":
+                    snapshot.pop(change.document.id, None)
+                else:
+                    snapshot[change.document.id] = decode(change.document.to_dict())
+        now = time.time()
+        server_time = _seconds(read_time) or now
+        with self._lock:
+            self._docs = snapshot
+            self.read_time = server_time
+            self.received_at = now
+            self.lag = max(0.0, now - server_time)
+            self.state = "live"
+            if self._dirty_since is not None and server_time >= self._dirty_until:
+                self._dirty_since = self._dirty_until = None
+        if self._on_change_hook:
+            changed = None if current is None else [
+                (change.document.id, snapshot.get(change.document.id)) for change in changes]
+            self._on_change_hook(snapshot, changed)
+        if self._on_snapshot_hook:
+            self._on_snapshot_hook(self.name, self.lag)
+
+    def mark_dirty(self, commit_time=None):
+        """A local write changed this data; wait for a snapshot that includes it
+
+        commit_time is the write's server commit time; without one (a transaction,
+        a journaled write, a peer's change) the local clock stands in for it.
+        """
+        with self._lock:
+            if self.state == "live":
+                now = time.time()
+                written = _seconds(commit_time) if commit_time is not None else now
+                if commit_time is not None and self._dirty_since is None and (self.read_time or 0) >= written:
+                    # The snapshot with this write already arrived
+                    return
+                if self._dirty_since is None:
+                    self._dirty_since = now
+                self._dirty_until = max(written, self._dirty_until or written)
+
+    @property
+    def ready(self):
+        with self._lock:
+            if self.state != "live" or self._docs is None:
+                return False
+            if self._dirty_since is not None:
+                if time.time() - self._dirty_since < self.dirty_timeout:
+                    return False
+                # No snapshot came, so the write did not change what we mirror
+                self._dirty_since = self._dirty_until = None
+            return True
+
+    def documents(self):
+        """The latest {doc_id: data}; replaced wholesale on each snapshot, so treat it as read-only"""
+        return self._docs or {}
+
+    def freshness(self):
+        """(server time of the snapshot, in sync) in the shape MemoCache.freshness uses"""
+        with self._lock:
+            if self.read_time is None:
+                return None
+            return self.read_time, self.state == "live"
+
+    def status(self):
+        with self._lock:
+            return {
+                "state": self.state,
+                "documents": len(self._docs or {}),
+                "lag_seconds": None if self.lag is None else round(self.lag, 3),
+                "last_snapshot_age_seconds": None if self.received_at is None
+                else round(time.time() - self.received_at, 1),
+                "reconnects": self.reconnects,
+                "catching_up": self._dirty_since is not None,
+            }
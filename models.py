@@ -0,0 +1,141 @@
+"""Compact read-only records for cached Firestore data.
+
+Firestore hands back every document as a fresh dict, so the cached log tail
+and the listener mirrors held hundreds of small dicts repeating the same keys
+and the same enum-like strings ("cash", "fresh_checkin", "2024-05-01", ...).
+These records keep the common fields in __slots__, intern the enum-like
+values, and put anything unusual in a small ``extra`` dict.
+
+They behave as read-only mappings, so code written against the dicts
+(``log["room"]``, ``log.get("date")``, ``for key in log``) keeps working,
+and ``to_dict()`` returns the document as it was stored.
+"""
+import sys
+from collections.abc import Mapping
+from operator import attrgetter
+
+
+class _Missing:
+    __slots__ = ()
+
+    def __repr__(self):
+        return "MISSING"
+
+
+MISSING = _Missing()
+
+
+class Record(Mapping):
+    __slots__ = ("extra",)
+    FIELDS = ()
+    INTERNED = frozenset()
+    # field -> Record subclass for nested documents
+    NESTED = {}
+
+    @classmethod
+    def from_dict(cls, data):
+        record = cls.__new__(cls)
+        for field in cls.FIELDS:
+            value = data.get(field, MISSING)
+            if field in cls.INTERNED and type(value) is str:
+                value = sys.intern(value)
+            elif field in cls.NESTED and type(value) is dict:
+                value = cls.NESTED[field].from_dict(value)
+            object.__setattr__(record, field, value)
+        extra = {key: value for key, value in data.items() if key not in cls._field_set}
+        object.__setattr__(record, "extra", extra or None)
+        return record
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls._field_set = frozenset(cls.FIELDS)
+        cls._values = attrgetter(*cls.FIELDS)
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"{type(self).__name__} is read-only; build a new one from a dict")
+
+    def to_dict(self):
+        data = {field: value for field, value in zip(self.FIELDS, self._values(self)) if value is not MISSING}
+        for field in self.NESTED:
+            if isinstance(data.get(field), Record):
+                data[field] = data[field].to_dict()
+        if self.extra:
+            data.update(self.extra)
+        return data
+
+    def __getitem__(self, key):
+        if key in self._field_set:
+            value = getattr(self, key)
+            if value is not MISSING:
+                return value
+        elif self.extra and key in self.extra:
+            return self.extra[key]
+        raise KeyError(key)
+
+    def get(self, key, default=None):
+        if key in self._field_set:
+            value = getattr(self, key)
+            return default if value is MISSING else value
+        if self.extra:
+            return self.extra.get(key, default)
+        return default
+
+    def __contains__(self, key):
+        if key in self._field_set:
+            return getattr(self, key) is not MISSING
+        return bool(self.extra) and key in self.extra
+
+    def __iter__(self):
+        for field, value in zip(self.FIELDS, self._values(self)):
+            if value is not MISSING:
+                yield field
+        if self.extra:
+            yield from self.extra
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.to_dict()!r})"
+
+
+class Guest(Record):
+    FIELDS = ("name", "mobile", "price", "guests", "payment", "balance", "isAC", "photo")
+    INTERNED = frozenset({"payment"})
+    __slots__ = FIELDS
+
+
+class Room(Record):
+    FIELDS = ("status", "guest", "checkin_time", "balance", "add_ons", "renewal_count",
+              "last_renewal_time", "discounts")
+    INTERNED = frozenset({"status"})
+    NESTED = {"guest": Guest}
+    __slots__ = FIELDS
+
+
+class LogEntry(Record):
+    FIELDS = ("room", "name", "amount", "date", "time", "transaction_type", "payment_method",
+              "note", "serial_number")
+    INTERNED = frozenset({"room", "date", "time", "transaction_type", "payment_method"})
+    __slots__ = FIELDS
+
+
+class Booking(Record):
+    FIELDS = ("room", "guest_name", "guest_mobile", "booking_date", "check_in_date", "check_out_date",
+              "status", "total_amount", "paid_amount", "balance", "payment_method", "notes",
+              "photo_path", "guest_count")
+    INTERNED = frozenset({"room", "booking_date", "check_in_date", "check_out_date", "status",
+                          "payment_method"})
+    __slots__ = FIELDS
+
+
+class Settlement(Record):
+    FIELDS = ("id", "guest_name", "guest_mobile", "room", "amount", "checkout_date", "checkout_time",
+              "status", "notes", "photo")
+    INTERNED = frozenset({"room", "checkout_date", "status"})
+    __slots__ = FIELDS
+
+
+def log_entries(entries):
+    """Compact a list of log dicts as read from a logs document"""
+    return [LogEntry.from_dict(entry) for entry in entries]
@@ -0,0 +1,153 @@
+"""Reconciliation of current_totals against the logs it summarises.
+
+Every route keeps current_totals by read-modify-write, so lost updates and
+the discount clamp leave it drifting from the logs. Each ledger total is the
+sum of one log, and logs only grow by ArrayUnion, so a checkpoint records
+the sums together with how many entries of each log they cover; the next
+run only adds up the entries past those positions. Backdated entries are
+still picked up because position, not date, decides what is new. A log that
+got shorter or whose last covered entry changed invalidates the checkpoint
+and that run falls back to a full pass.
+
+The checkpoint saves the summing, not the reading: each log is a single
+document holding its whole entries array, so every run still downloads every
+ledger log in full (one document read each, with bytes that grow with the log).
+
+The balance total is an amount outstanding rather than a running sum, so it
+is checked against the positive room balances instead of a log. Two writes
+move it by amounts no room balance shows, so its drift is not all lost
+updates; see outstanding_balance.
+"""
+import hashlib
+import json
+
+# Differences below this are float noise, not drift
+TOLERANCE = 0.01
+
+# Expenses logged before expense_type existed were paid from the takings
+DEFAULT_EXPENSE_TYPE = "transaction"
+
+
+def expense_type(entry):
+    """An expense entry's type, with untyped (legacy) entries as DEFAULT_EXPENSE_TYPE"""
+    return entry.get("expense_type") or DEFAULT_EXPENSE_TYPE
+
+
+# total -> (log type, filter for the entries that count towards it)
+LEDGER = {
+    "cash": ("cash", None),
+    "online": ("online", None),
+    "refunds": ("refunds", None),
+    "advance_bookings": ("booking_payments", None),
+    # Report-only expenses are recorded without touching the totals
+    "expenses": ("expenses", lambda entry: expense_type(entry) == "transaction"),
+}
+LEDGER_LOGS = sorted({log_type for log_type, _ in LEDGER.values()})
+BUCKETS = (*LEDGER, "balance")
+
+
+def net_revenue(cash, online, refunds, transaction_expenses):
+    """Net revenue as /reports and the analytics tab both show it
+
+    Money taken in, less refunds paid back and expenses paid from the takings;
+    "report" expenses are recorded for the books but not paid from the drawer.
+    """
+    return cash + online - refunds - transaction_expenses
+
+
+def _number(value):
+    try:
+        return float(value or 0)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def _plain(value):
+    value = round(float(value), 2)
+    return int(value) if value.is_integer() else value
+
+
+def fingerprint(entry):
+    return hashlib.sha1(json.dumps(entry, sort_keys=True, default=str).encode("utf-8")).hexdigest()[:16]
+
+
+def ledger_sums(logs, checkpoint=None):
+    """(sums, positions, entries summed) for LEDGER over {log type: entries}
+
+    positions maps each log to [entries covered, fingerprint of the last one]. With a checkpoint
+    (one that checkpoint_holds for these logs) only the entries past its positions are summed.
+    """
+    base_sums = checkpoint["sums"] if checkpoint else {}
+    base_positions = checkpoint["positions"] if checkpoint else {}
+    sums = {total: _number(base_sums.get(total)) for total in LEDGER}
+    positions = {}
+    scanned = 0
+    for log_type in LEDGER_LOGS:
+        entries = logs.get(log_type) or []
+        fresh = entries[(base_positions.get(log_type) or [0])[0]:]
+        scanned += len(fresh)
+        for total, (total_log, include) in LEDGER.items():
+            if total_log == log_type:
+                sums[total] += sum(_number(entry.get("amount")) for entry in fresh
+                                   if include is None or include(entry))
+        positions[log_type] = [len(entries), fingerprint(entries[-1]) if entries else None]
+    return sums, positions, scanned
+
+
+def checkpoint_holds(checkpoint, logs):
+    """Whether the entries a checkpoint covers are still the first entries of each log"""
+    for log_type in LEDGER_LOGS:
+        count, last = (checkpoint.get("positions") or {}).get(log_type) or [0, None]
+        entries = logs.get(log_type) or []
+        if len(entries) < count:
+            return False
+        if count and fingerprint(entries[count - 1]) != last:
+            return False
+    return True
+
+
+# Reported with the balance bucket, whose drift is not only lost updates
+BALANCE_DRIFT_NOTE = ("includes add-ons charged to rooms in credit and discounts larger than "
+                      "what the room owed, which move the balance total by more than the rooms")
+
+
+def outstanding_balance(rooms):
+    """What the balance total should be: the sum of what occupied rooms still owe
+
+    Two writes change the balance total by amounts the rooms do not reflect, so
+    balance drift includes them as well as lost updates:
+      - an add-on charged to a room in credit (negative balance) adds its full
+        price to the total, though the room only owes what exceeds the credit;
+      - a discount on a room that owes something takes the total down by the
+        whole amount (stopping at zero) while the room balance stops at zero,
+        so a discount larger than what the room owes lowers the total more.
+    Neither can be rebuilt from the rooms afterwards; correcting the bucket sets
+    it back to what the rooms owe.
+    """
+    return sum(max(0.0, _number(room.get("balance"))) for room in rooms.values()
+               if room.get("status") == "occupied")
+
+
+def drift_report(totals, expected, previous_drift=None):
+    """{bucket: {recorded, expected, drift, since_checkpoint}} for every bucket
+
+    drift is recorded - expected; since_checkpoint is how much of it appeared after the
+    checkpoint whose drift is previous_drift. The balance row also carries
+    BALANCE_DRIFT_NOTE.
+    """
+    report = {}
+    for bucket in BUCKETS:
+        recorded = _number(totals.get(bucket))
+        drift = recorded - expected[bucket]
+        report[bucket] = {
+            "recorded": _plain(recorded),
+            "expected": _plain(expected[bucket]),
+            "drift": _plain(drift),
+            "since_checkpoint": _plain(drift - _number((previous_drift or {}).get(bucket))),
+        }
+    report["balance"]["note"] = BALANCE_DRIFT_NOTE
+    return report
+
+
+def drifted(report):
+    return {bucket: row for bucket, row in report.items() if abs(row["drift"]) >= TOLERANCE}
@@ -0,0 +1,112 @@
+"""Rent renewal deadlines for occupied rooms, soonest first.
+
+A room's rent is due again (renewal_count + 1) days after its check-in
+time. The dashboard used to work that out for every room on every render;
+RenewalIndex keeps a min-heap of (due time, room) plus each room's current
+due time instead. A room whose deadline moves gets a new heap entry and the
+old one is left behind, to be skipped when it surfaces (the heap is rebuilt
+once leftovers outnumber live entries). due_within() walks the heap best
+first without popping it, so listing the k rooms due inside a window costs
+O(k log k) however many rooms there are.
+"""
+import heapq
+import threading
+from datetime import datetime, timedelta
+
+RENEWAL_PERIOD = timedelta(days=1)
+CHECKIN_FORMATS = ("%Y-%m-%d %H:%M", "%Y-%m-%d %H:%M:%S")
+
+
+def next_due(room):
+    """When an occupied room's next renewal is due, in the lodge's local time, else None"""
+    if not room or room.get("status") != "occupied" or not room.get("checkin_time"):
+        return None
+    for checkin_format in CHECKIN_FORMATS:
+        try:
+            checkin_time = datetime.strptime(room["checkin_time"], checkin_format)
+            break
+        except (TypeError, ValueError):
+            continue
+    else:
+        return None
+    return checkin_time + RENEWAL_PERIOD * ((room.get("renewal_count") or 0) + 1)
+
+
+class RenewalIndex:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._heap = []
+        # room -> due time of its live heap entry
+        self._due = {}
+        # What the index was last rebuilt from, see replace()
+        self.source = None
+
+    def __len__(self):
+        return len(self._due)
+
+    def _set_locked(self, room_id, due):
+        if self._due.get(room_id) == due:
+            return
+        if due is None:
+            self._due.pop(room_id, None)
+        else:
+            self._due[room_id] = due
+            heapq.heappush(self._heap, (due, room_id))
+        if len(self._heap) > 2 * len(self._due) + 16:
+            self._heap = [(when, room) for room, when in self._due.items()]
+            heapq.heapify(self._heap)
+
+    def upsert(self, room_id, room):
+        """Track room's current state: a new deadline, or none once it is vacant"""
+        due = next_due(room)
+        with self._lock:
+            self._set_locked(room_id, due)
+
+    def remove(self, room_id):
+        with self._lock:
+            self._set_locked(room_id, None)
+
+    def replace(self, documents, source=None):
+        """Rebuild from a full {room: room data} snapshot; source identifies that snapshot"""
+        due = {}
+        for room_id, room in documents.items():
+            when = next_due(room)
+            if when is not None:
+                due[room_id] = when
+        heap = [(when, room_id) for room_id, when in due.items()]
+        heapq.heapify(heap)
+        with self._lock:
+            self._due = due
+            self._heap = heap
+            self.source = source
+
+    def apply_changes(self, documents, changes):
+        """SnapshotMirror on_change hook: changes is None for a full snapshot"""
+        if changes is None:
+            self.replace(documents)
+            return
+        for room_id, room in changes:
+            if room is None:
+                self.remove(room_id)
+            else:
+                self.upsert(room_id, room)
+
+    def due_within(self, now, window):
+        """[(room, due)] for rooms due by now + window, overdue ones included, soonest first"""
+        horizon = now + window
+        due = []
+        seen = set()
+        with self._lock:
+            heap = self._heap
+            frontier = [(heap[0], 0)] if heap else []
+            while frontier:
+                (when, room_id), i = heapq.heappop(frontier)
+                if when > horizon:
+                    break
+                if self._due.get(room_id) == when and room_id not in seen:
+                    seen.add(room_id)
+                    due.append((room_id, when))
+                for child in (2 * i + 1, 2 * i + 2):
+                    if child < len(heap):
+                        heapq.heappush(frontier, (heap[child], child))
+        return due
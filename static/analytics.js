@@ -71,41 +71,153 @@ function initializeAnalytics() {
 }
 
 // Generate all analytics charts and summary cards
-async function generateAnalytics(reportData) {
+async function generateAnalytics(reportData, startDate, endDate) {
   if (!reportData) {
     console.error("No report data available for analytics");
     return;
   }
 
+  // Chart series come from the server; compute them here only if /analytics is unavailable
+  const series =
+    (await fetchAnalyticsSeries(startDate, endDate)) ||
+    analyticsSeriesFromReport(reportData);
+
   // Update summary cards
-  updateSummaryCards(reportData);
+  updateSummaryCards(series.summary);
 
   // Generate all charts
-  generateRevenueExpenseChart(reportData);
-  generateTopRoomsChart(reportData);
-  generatePaymentMethodsChart(reportData);
-  generateExpenseCategoriesChart(reportData);
-  generateDailyRevenueChart(reportData);
-  generateTopServicesChart(reportData);
+  generateRevenueExpenseChart(series.revenue_expense);
+  generateTopRoomsChart(series.top_rooms);
+  generatePaymentMethodsChart(series.payment_methods);
+  generateExpenseCategoriesChart(series.expense_categories);
+  generateDailyRevenueChart(series.daily_revenue);
+  generateTopServicesChart(series.top_services);
+}
+
+// Chart-ready series computed by the server over the full logs
+async function fetchAnalyticsSeries(startDate, endDate) {
+  if (!startDate || !endDate) return null;
+  try {
+    const params = new URLSearchParams({ start_date: startDate, end_date: endDate });
+    const response = await fetch(`/analytics?${params}`);
+    if (!response.ok) return null;
+    const data = await response.json();
+    return data.success ? data : null;
+  } catch (error) {
+    console.warn("Analytics endpoint unavailable, using report data:", error);
+    return null;
+  }
+}
+
+// Same series as /analytics, built in the browser from a /reports response
+function analyticsSeriesFromReport(data) {
+  const cashLogs = data.cash_logs || [];
+  const onlineLogs = data.online_logs || [];
+  const expenseLogs = data.expense_logs || [];
+
+  const sumBy = (logs, key, fallback, valueKey = "amount") =>
+    logs.reduce((acc, log) => {
+      const label = log[key] || fallback;
+      acc[label] = (acc[label] || 0) + log[valueKey];
+      return acc;
+    }, {});
+  const sumOn = (logs, date) =>
+    logs
+      .filter((log) => log.date === date)
+      .reduce((sum, log) => sum + log.amount, 0);
+  const formatDay = (date) => {
+    const [year, month, day] = date.split("-");
+    return `${day}/${month}`;
+  };
+  const top = (sums, limit) => {
+    const ranked = Object.entries(sums)
+      .sort((a, b) => b[1] - a[1])
+      .slice(0, limit);
+    return {
+      labels: ranked.map((entry) => entry[0]),
+      values: ranked.map((entry) => entry[1]),
+    };
+  };
+
+  const revenueDates = [
+    ...new Set([...cashLogs, ...onlineLogs].map((log) => log.date)),
+  ].sort();
+  const allDates = [
+    ...new Set(
+      [...cashLogs, ...onlineLogs, ...expenseLogs].map((log) => log.date)
+    ),
+  ].sort();
+
+  const cashTotal = data.cash_total || 0;
+  const onlineTotal = data.online_total || 0;
+  const expenseTotal = data.expense_total || 0;
+  const categories = top(sumBy(expenseLogs, "category", "Other"), Infinity);
+  const rooms = top(sumBy([...cashLogs, ...onlineLogs], "room", "Unknown"), 10);
+
+  return {
+    summary: {
+      cash_total: cashTotal,
+      online_total: onlineTotal,
+      total_income: cashTotal + onlineTotal,
+      expense_total: expenseTotal,
+      transaction_expense_total: data.transaction_expense_total || 0,
+      report_expense_total: data.report_expense_total || 0,
+      refund_total: data.refund_total || 0,
+      net_revenue: data.total_revenue || 0,
+      expense_categories: categories.labels.length,
+      checkins: data.checkins || 0,
+      renewals: data.renewals || 0,
+    },
+    revenue_expense: {
+      labels: allDates.map(formatDay),
+      revenue: allDates.map(
+        (date) => sumOn(cashLogs, date) + sumOn(onlineLogs, date)
+      ),
+      expenses: allDates.map((date) => sumOn(expenseLogs, date)),
+    },
+    daily_revenue: {
+      labels: revenueDates.map(formatDay),
+      cash: revenueDates.map((date) => sumOn(cashLogs, date)),
+      online: revenueDates.map((date) => sumOn(onlineLogs, date)),
+    },
+    top_rooms: {
+      labels: rooms.labels.map((room) => `Room ${room}`),
+      values: rooms.values,
+    },
+    payment_methods: {
+      labels: ["Cash", "Online"],
+      values: [
+        cashLogs.reduce((sum, log) => sum + log.amount, 0),
+        onlineLogs.reduce((sum, log) => sum + log.amount, 0),
+      ],
+    },
+    expense_categories: {
+      labels: categories.labels.map(
+        (label) => label.charAt(0).toUpperCase() + label.slice(1)
+      ),
+      values: categories.values,
+    },
+    top_services: top(sumBy(data.addon_logs || [], "item", "Other", "price"), 8),
+  };
 }
 
 // Update summary cards with data - FIXED NET REVENUE CALCULATION
-function updateSummaryCards(data) {
+function updateSummaryCards(summary) {
   const summaryContainer = document.getElementById("analytics-summary");
   if (!summaryContainer) return;
 
-  const cashTotal = data.cash_total || 0;
-  const onlineTotal = data.online_total || 0;
-  const totalIncome = cashTotal + onlineTotal;
+  const cashTotal = summary.cash_total || 0;
+  const onlineTotal = summary.online_total || 0;
+  const totalIncome = summary.total_income || 0;
 
-  // FIXED: Include both transaction and report expenses
-  const totalExpense = data.expense_total || 0; // This includes both daily and report expenses
+  // Includes both transaction and report expenses
+  const totalExpense = summary.expense_total || 0;
 
-  // FIXED: Net revenue = Total Income - Total Expenses
-  const netRevenue = totalIncome - totalExpense;
+  // Net revenue = Total Income - Total Expenses
+  const netRevenue = summary.net_revenue || 0;
 
-  const checkins = data.checkins || 0;
-  const renewals = data.renewals || 0;
+  const checkins = summary.checkins || 0;
+  const renewals = summary.renewals || 0;
 
   // Calculate occupancy rate (example calculation - modify as needed)
   // This is a placeholder - you should use actual data from your backend
@@ -126,16 +238,7 @@ function updateSummaryCards(data) {
       <div class="analytics-card-header">Total Expenses</div>
       <div class="analytics-card-value">₹${totalExpense}</div>
       <div class="analytics-card-footer">
-        <span>Categories: ${
-          (data.expense_logs || []).length > 0
-            ? Object.keys(
-                (data.expense_logs || []).reduce((acc, log) => {
-                  acc[log.category] = true;
-                  return acc;
-                }, {})
-              ).length
-            : 0
-        }</span>
+        <span>Categories: ${summary.expense_categories || 0}</span>
       </div>
     </div>
     
@@ -159,7 +262,7 @@ function updateSummaryCards(data) {
 }
 
 // Revenue & Expense Chart (Line Chart)
-function generateRevenueExpenseChart(data) {
+function generateRevenueExpenseChart(series) {
   const chartCanvas = document.getElementById("revenue-expense-chart");
   if (!chartCanvas) return;
 
@@ -168,39 +271,9 @@ function generateRevenueExpenseChart(data) {
     chartCanvas.chart.destroy();
   }
 
-  // Create datasets based on dates
-  const dates = [
-    ...new Set([
-      ...(data.cash_logs || []).map((log) => log.date),
-      ...(data.online_logs || []).map((log) => log.date),
-      ...(data.expense_logs || []).map((log) => log.date),
-    ]),
-  ].sort();
-
-  // Calculate daily totals
-  const revenueData = dates.map((date) => {
-    const cashTotal = (data.cash_logs || [])
-      .filter((log) => log.date === date)
-      .reduce((sum, log) => sum + log.amount, 0);
-
-    const onlineTotal = (data.online_logs || [])
-      .filter((log) => log.date === date)
-      .reduce((sum, log) => sum + log.amount, 0);
-
-    return cashTotal + onlineTotal;
-  });
-
-  const expenseData = dates.map((date) => {
-    return (data.expense_logs || [])
-      .filter((log) => log.date === date)
-      .reduce((sum, log) => sum + log.amount, 0);
-  });
-
-  // Format dates for display
-  const formattedDates = dates.map((date) => {
-    const [year, month, day] = date.split("-");
-    return `${day}/${month}`;
-  });
+  const formattedDates = series.labels;
+  const revenueData = series.revenue;
+  const expenseData = series.expenses;
 
   // Create chart
   const ctx = chartCanvas.getContext("2d");
@@ -263,7 +336,7 @@ function generateRevenueExpenseChart(data) {
 }
 
 // Top 10 Rooms Chart (Bar Chart)
-function generateTopRoomsChart(data) {
+function generateTopRoomsChart(series) {
   const chartCanvas = document.getElementById("top-rooms-chart");
   if (!chartCanvas) return;
 
@@ -272,25 +345,9 @@ function generateTopRoomsChart(data) {
     chartCanvas.chart.destroy();
   }
 
-  // Combine all room logs
-  const allRoomLogs = [...(data.cash_logs || []), ...(data.online_logs || [])];
-
-  // Calculate revenue per room
-  const roomRevenue = {};
-  allRoomLogs.forEach((log) => {
-    if (!roomRevenue[log.room]) {
-      roomRevenue[log.room] = 0;
-    }
-    roomRevenue[log.room] += log.amount;
-  });
-
-  // Sort rooms by revenue and get top 10
-  const topRooms = Object.entries(roomRevenue)
-    .sort((a, b) => b[1] - a[1])
-    .slice(0, 10);
-
-  const roomNumbers = topRooms.map((room) => `Room ${room[0]}`);
-  const roomValues = topRooms.map((room) => room[1]);
+  // Top 10 rooms by revenue, already sorted
+  const roomNumbers = series.labels;
+  const roomValues = series.values;
 
   // Create chart
   const ctx = chartCanvas.getContext("2d");
@@ -344,7 +401,7 @@ function generateTopRoomsChart(data) {
 }
 
 // Payment Methods Chart (Pie Chart)
-function generatePaymentMethodsChart(data) {
+function generatePaymentMethodsChart(series) {
   const chartCanvas = document.getElementById("payment-methods-chart");
   if (!chartCanvas) return;
 
@@ -353,15 +410,8 @@ function generatePaymentMethodsChart(data) {
     chartCanvas.chart.destroy();
   }
 
-  // Calculate totals by payment method
-  const cashTotal = (data.cash_logs || []).reduce(
-    (sum, log) => sum + log.amount,
-    0
-  );
-  const onlineTotal = (data.online_logs || []).reduce(
-    (sum, log) => sum + log.amount,
-    0
-  );
+  // Totals by payment method
+  const [cashTotal, onlineTotal] = series.values;
 
   // Create chart
   const ctx = chartCanvas.getContext("2d");
@@ -409,7 +459,7 @@ function generatePaymentMethodsChart(data) {
 }
 
 // Expense Categories Chart (Pie Chart)
-function generateExpenseCategoriesChart(data) {
+function generateExpenseCategoriesChart(series) {
   const chartCanvas = document.getElementById("expense-categories-chart");
   if (!chartCanvas) return;
 
@@ -418,25 +468,9 @@ function generateExpenseCategoriesChart(data) {
     chartCanvas.chart.destroy();
   }
 
-  // Group expenses by category
-  const expenseCategories = {};
-  (data.expense_logs || []).forEach((log) => {
-    const category = log.category || "Other";
-    if (!expenseCategories[category]) {
-      expenseCategories[category] = 0;
-    }
-    expenseCategories[category] += log.amount;
-  });
-
-  // Sort categories by amount
-  const sortedCategories = Object.entries(expenseCategories).sort(
-    (a, b) => b[1] - a[1]
-  );
-
-  const categoryLabels = sortedCategories.map(
-    (cat) => cat[0].charAt(0).toUpperCase() + cat[0].slice(1)
-  );
-  const categoryValues = sortedCategories.map((cat) => cat[1]);
+  // Categories sorted by amount
+  const categoryLabels = series.labels;
+  const categoryValues = series.values;
 
   // Generate colors
   const backgroundColors = [
@@ -508,7 +542,7 @@ function generateExpenseCategoriesChart(data) {
 }
 
 // Daily Revenue Breakdown (Bar Chart) - NEW CHART
-function generateDailyRevenueChart(data) {
+function generateDailyRevenueChart(series) {
   const chartCanvas = document.getElementById("daily-revenue-chart");
   if (!chartCanvas) return;
 
@@ -517,32 +551,10 @@ function generateDailyRevenueChart(data) {
     chartCanvas.chart.destroy();
   }
 
-  // Create datasets based on dates
-  const dates = [
-    ...new Set([
-      ...(data.cash_logs || []).map((log) => log.date),
-      ...(data.online_logs || []).map((log) => log.date),
-    ]),
-  ].sort();
-
-  // Calculate daily totals by payment method
-  const cashData = dates.map((date) => {
-    return (data.cash_logs || [])
-      .filter((log) => log.date === date)
-      .reduce((sum, log) => sum + log.amount, 0);
-  });
-
-  const onlineData = dates.map((date) => {
-    return (data.online_logs || [])
-      .filter((log) => log.date === date)
-      .reduce((sum, log) => sum + log.amount, 0);
-  });
-
-  // Format dates for display
-  const formattedDates = dates.map((date) => {
-    const [year, month, day] = date.split("-");
-    return `${day}/${month}`;
-  });
+  // Daily totals by payment method
+  const formattedDates = series.labels;
+  const cashData = series.cash;
+  const onlineData = series.online;
 
   // Create chart
   const ctx = chartCanvas.getContext("2d");
@@ -607,7 +619,7 @@ function generateDailyRevenueChart(data) {
 }
 
 // Top Services/Add-ons Chart (Horizontal Bar) - NEW CHART
-function generateTopServicesChart(data) {
+function generateTopServicesChart(series) {
   const chartCanvas = document.getElementById("top-services-chart");
   if (!chartCanvas) return;
 
@@ -616,23 +628,9 @@ function generateTopServicesChart(data) {
     chartCanvas.chart.destroy();
   }
 
-  // Group add-ons by type
-  const serviceRevenue = {};
-  (data.addon_logs || []).forEach((log) => {
-    const serviceName = log.item || "Other";
-    if (!serviceRevenue[serviceName]) {
-      serviceRevenue[serviceName] = 0;
-    }
-    serviceRevenue[serviceName] += log.price;
-  });
-
-  // Sort services by revenue and get top 8
-  const topServices = Object.entries(serviceRevenue)
-    .sort((a, b) => b[1] - a[1])
-    .slice(0, 8);
-
-  const serviceNames = topServices.map((service) => service[0]);
-  const serviceValues = topServices.map((service) => service[1]);
+  // Top 8 add-ons by revenue, already sorted
+  const serviceNames = series.labels;
+  const serviceValues = series.values;
 
   // Create chart
   const ctx = chartCanvas.getContext("2d");
@@ -883,7 +881,7 @@ async function generateEnhancedReport() {
 
       // Generate charts for analytics view
       initializeAnalyticsView(); // Reset charts first
-      generateAnalytics(data);
+      generateAnalytics(data, startDate, endDate);
 
       // Render detailed reports for reports view
       renderCompactReportData(data);
@@ -955,15 +953,35 @@ function updateReportSummary(data) {
     data.expense_total || 0
   }`;
 
-  // FIXED: Calculate net revenue properly (Income - Expenses)
-  const totalIncome = (data.cash_total || 0) + (data.online_total || 0);
-  const totalExpense = data.expense_total || 0;
-  const netRevenue = totalIncome - totalExpense;
-
-  document.getElementById("report-net-revenue").textContent = `₹${netRevenue}`;
+  // Net revenue as the server defines it (analytics.net_revenue)
+  document.getElementById("report-net-revenue").textContent = `₹${
+    data.total_revenue || 0
+  }`;
 }
 
 // Excel Export Function - FIXED: Removed duplicate formatDateTime function
+// Full-period export streamed by the server (/reports only carries the recent log tail)
+function downloadReportExport(format) {
+  const startDate = document.getElementById("start-date")?.value;
+  const endDate = document.getElementById("end-date")?.value;
+  if (!startDate || !endDate) {
+    showNotification("Please select both start and end dates", "error");
+    return;
+  }
+
+  const params = new URLSearchParams({
+    start_date: startDate,
+    end_date: endDate,
+    format: format || "csv",
+  });
+  const link = document.createElement("a");
+  link.href = `/reports/export?${params.toString()}`;
+  link.download = "";
+  document.body.appendChild(link);
+  link.click();
+  link.remove();
+}
+
 function exportToExcel() {
   if (!window.reportData) {
     showNotification("No report data available for export", "error");
@@ -1001,12 +1019,7 @@ function exportToExcel() {
       ["Total Expenses", data.expense_total || 0],
       [""],
       ["NET SUMMARY"],
-      [
-        "Net Revenue",
-        (data.cash_total || 0) +
-          (data.online_total || 0) -
-          (data.expense_total || 0),
-      ],
+      ["Net Revenue", data.total_revenue || 0],
       ["Total Refunds", data.refund_total || 0],
       ["Check-ins", data.checkins || 0],
       ["Renewals", data.renewals || 0],
@@ -1153,6 +1166,9 @@ function renderCompactReportData(data) {
       <button onclick="exportToExcel()" class="action-btn btn-success btn-sm">
         <i class="fas fa-file-excel"></i> Export to Excel
       </button>
+      <button onclick="downloadReportExport('csv')" class="action-btn btn-secondary btn-sm">
+        <i class="fas fa-file-csv"></i> Download CSV
+      </button>
     </div>
   `;
 
@@ -1268,7 +1284,7 @@ function renderCompactReportData(data) {
 
       html += `
         <div class="log-item ${
-          log.expense_type === "transaction"
+          (log.expense_type || "transaction") === "transaction"
             ? "transaction-expense"
             : "report-expense"
         }">
@@ -1346,8 +1362,9 @@ function renderCompactReportData(data) {
 
   // Grand total summary
   const totalIncome = cashTotal + onlineTotal;
-  const totalExpenses = expenseTotal;
-  const netRevenue = totalIncome - totalExpenses; // FIXED: Subtract expenses from income
+  // Only transaction expenses come out of net revenue (analytics.net_revenue)
+  const totalExpenses = data.transaction_expense_total || 0;
+  const netRevenue = data.total_revenue || 0;
 
   html += `
     <div class="logs-container grand-total-section">
@@ -1361,7 +1378,7 @@ function renderCompactReportData(data) {
         </div>
         <div class="log-item">
           <div class="log-details">
-            <div class="log-title">Total Expenses</div>
+            <div class="log-title">Transaction Expenses</div>
           </div>
           <div class="log-amount" style="color: var(--danger);">₹${totalExpenses}</div>
         </div>
@@ -1428,4 +1445,5 @@ document.addEventListener("DOMContentLoaded", function () {
   // Make toggleSection function global
   window.toggleSection = toggleSection;
   window.exportToExcel = exportToExcel;
+  window.downloadReportExport = downloadReportExport;
 });
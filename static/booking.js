@@ -486,7 +486,9 @@ function formatDateTime(dateStr) {
 
 // Show booking details modal
 function showBookingDetails(bookingId) {
-  const booking = bookings.find((b) => b.booking_id === bookingId);
+  const booking =
+    bookings.find((b) => b.booking_id === bookingId) ||
+    findCalendarBooking(bookingId);
   if (!booking) return;
 
   const detailsModal = document.getElementById("booking-details-modal");
@@ -547,7 +549,10 @@ function showBookingDetails(bookingId) {
     if (booking.photo_path) {
       const photoImg = document.getElementById("details-guest-photo");
       if (photoImg) {
-        photoImg.src = booking.photo_path;
+        photoImg.src =
+          typeof guestPhotoUrl === "function"
+            ? guestPhotoUrl(booking.photo_path, 640)
+            : booking.photo_path;
         photoContainer.style.display = "block";
       }
     } else {
@@ -783,7 +788,9 @@ function showNewBookingModal() {
 
 // Show cancel booking modal
 function showCancelBookingModal(bookingId) {
-  const booking = bookings.find((b) => b.booking_id === bookingId);
+  const booking =
+    bookings.find((b) => b.booking_id === bookingId) ||
+    findCalendarBooking(bookingId);
   if (!booking) return;
 
   const modal = document.getElementById("cancel-booking-modal");
@@ -915,7 +922,9 @@ function initializeCancelBookingForm() {
 
 // Show convert booking modal
 function showConvertBookingModal(bookingId) {
-  const booking = bookings.find((b) => b.booking_id === bookingId);
+  const booking =
+    bookings.find((b) => b.booking_id === bookingId) ||
+    findCalendarBooking(bookingId);
   if (!booking) return;
 
   const modal = document.getElementById("convert-booking-modal");
@@ -1073,7 +1082,9 @@ function initializeConvertBookingForm() {
 
 // Show add payment modal
 function showAddPaymentModal(bookingId) {
-  const booking = bookings.find((b) => b.booking_id === bookingId);
+  const booking =
+    bookings.find((b) => b.booking_id === bookingId) ||
+    findCalendarBooking(bookingId);
   if (!booking) return;
 
   const modal = document.getElementById("add-payment-modal");
@@ -1216,7 +1227,9 @@ function initializeAddPaymentForm() {
 
 // Show update booking modal
 function showUpdateBookingModal(bookingId) {
-  const booking = bookings.find((b) => b.booking_id === bookingId);
+  const booking =
+    bookings.find((b) => b.booking_id === bookingId) ||
+    findCalendarBooking(bookingId);
   if (!booking) return;
 
   const modal = document.getElementById("update-booking-modal");
@@ -1666,6 +1679,67 @@ function initBookingCamera() {
 // Calendar View for Bookings
 let currentCalendarDate = new Date();
 let currentCalendarView = "list"; // 'list' or 'calendar'
+// Calendar pages built by /booking_calendar, by YYYY-MM (null = fall back to the bookings list)
+let calendarMonths = {};
+const calendarRequests = {};
+
+function calendarMonthKey(date) {
+  return `${date.getFullYear()}-${String(date.getMonth() + 1).padStart(2, "0")}`;
+}
+
+async function fetchCalendarMonth(monthKey) {
+  try {
+    const response = await fetch(`/booking_calendar?month=${monthKey}`);
+    if (!response.ok) {
+      throw new Error(`Server responded with status: ${response.status}`);
+    }
+
+    const result = await response.json();
+    if (result.success) {
+      calendarMonths[monthKey] = result;
+      return;
+    }
+    console.error(result.message || "Error fetching booking calendar");
+  } catch (error) {
+    console.error("Error fetching booking calendar:", error);
+  }
+  calendarMonths[monthKey] = null;
+}
+
+// Load a month's page once; re-render if the user is still looking at it
+function ensureCalendarMonth(monthKey) {
+  if (monthKey in calendarMonths || calendarRequests[monthKey]) return;
+  calendarRequests[monthKey] = fetchCalendarMonth(monthKey).then(() => {
+    delete calendarRequests[monthKey];
+    if (calendarMonthKey(currentCalendarDate) === monthKey) {
+      renderCalendar();
+    }
+  });
+}
+
+// Bookings and occupied rooms for one day, from the server page when there is one
+function getDayCalendar(dateStr, calendarPage, monthBookings) {
+  if (calendarPage && calendarPage.days[dateStr]) {
+    const day = calendarPage.days[dateStr];
+    return {
+      bookings: day.bookings.map((id) => calendarPage.bookings[id]),
+      occupied: Object.values(day.rooms).filter((s) => s === "occupied").length,
+    };
+  }
+  return {
+    bookings: monthBookings.filter((booking) =>
+      isDateInBookingRange(dateStr, booking.check_in_date, booking.check_out_date)
+    ),
+    occupied: 0,
+  };
+}
+
+function findCalendarBooking(bookingId) {
+  for (const page of Object.values(calendarMonths)) {
+    if (page && page.bookings[bookingId]) return page.bookings[bookingId];
+  }
+  return null;
+}
 
 // Initialize calendar when DOM is loaded
 document.addEventListener("DOMContentLoaded", function () {
@@ -1810,8 +1884,12 @@ function renderCalendar() {
     0
   ).getDate();
 
-  // Filter bookings for the current month and adjacent days
-  const currentMonthBookings = getCurrentMonthBookings();
+  // Per-day bookings come from the server page for this month; until it has
+  // loaded (or if it failed) bucket the bookings list here
+  const monthKey = calendarMonthKey(currentCalendarDate);
+  ensureCalendarMonth(monthKey);
+  const calendarPage = calendarMonths[monthKey];
+  const currentMonthBookings = calendarPage ? [] : getCurrentMonthBookings();
 
   // Get today's date for highlighting
   const today = new Date();
@@ -1829,17 +1907,10 @@ function renderCalendar() {
     );
     const dateStr = formatDateForAPI(date);
 
-    // Get bookings for this day
-    const dayBookings = currentMonthBookings.filter((booking) =>
-      isDateInBookingRange(
-        dateStr,
-        booking.check_in_date,
-        booking.check_out_date
-      )
-    );
+    const dayCalendar = getDayCalendar(dateStr, calendarPage, currentMonthBookings);
 
     calendarDaysGrid.appendChild(
-      createDayElement(day, dayBookings, "different-month", dateStr)
+      createDayElement(day, dayCalendar, "different-month", dateStr)
     );
   }
 
@@ -1852,14 +1923,7 @@ function renderCalendar() {
     );
     const dateStr = formatDateForAPI(date);
 
-    // Get bookings for this day
-    const dayBookings = currentMonthBookings.filter((booking) =>
-      isDateInBookingRange(
-        dateStr,
-        booking.check_in_date,
-        booking.check_out_date
-      )
-    );
+    const dayCalendar = getDayCalendar(dateStr, calendarPage, currentMonthBookings);
 
     // Check if this is today
     const isToday =
@@ -1868,7 +1932,7 @@ function renderCalendar() {
       currentCalendarDate.getFullYear() === todayYear;
 
     calendarDaysGrid.appendChild(
-      createDayElement(day, dayBookings, isToday ? "today" : "", dateStr)
+      createDayElement(day, dayCalendar, isToday ? "today" : "", dateStr)
     );
   }
 
@@ -1888,17 +1952,10 @@ function renderCalendar() {
       );
       const dateStr = formatDateForAPI(date);
 
-      // Get bookings for this day
-      const dayBookings = currentMonthBookings.filter((booking) =>
-        isDateInBookingRange(
-          dateStr,
-          booking.check_in_date,
-          booking.check_out_date
-        )
-      );
+      const dayCalendar = getDayCalendar(dateStr, calendarPage, currentMonthBookings);
 
       calendarDaysGrid.appendChild(
-        createDayElement(day, dayBookings, "different-month", dateStr)
+        createDayElement(day, dayCalendar, "different-month", dateStr)
       );
     }
   }
@@ -1907,7 +1964,8 @@ function renderCalendar() {
   optimizeCalendarForScreenSize();
 }
 
-function createDayElement(dayNumber, bookings, extraClass, dateStr) {
+function createDayElement(dayNumber, dayCalendar, extraClass, dateStr) {
+  const bookings = dayCalendar.bookings;
   const dayElement = document.createElement("div");
   dayElement.className = `calendar-day ${extraClass || ""}`;
   dayElement.dataset.date = dateStr;
@@ -1972,6 +2030,14 @@ function createDayElement(dayNumber, bookings, extraClass, dateStr) {
     }
   }
 
+  // Rooms with a guest staying that night (from the rooms, not a booking)
+  if (dayCalendar.occupied > 0) {
+    const occupancy = document.createElement("div");
+    occupancy.className = "booking-count occupancy";
+    occupancy.textContent = `${dayCalendar.occupied} occupied`;
+    dayElement.appendChild(occupancy);
+  }
+
   // Add click event to show day details
   dayElement.addEventListener("click", function () {
     showDayDetails(dateStr, bookings);
@@ -2233,6 +2299,9 @@ const originalFetchBookings = fetchBookings;
 fetchBookings = async function () {
   await originalFetchBookings();
 
+  // Bookings may have changed; unchanged months come back as 304s
+  calendarMonths = {};
+
   // If we're in calendar view, refresh the calendar
   if (currentCalendarView === "calendar") {
     renderCalendar();
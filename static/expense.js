@@ -208,7 +208,8 @@ async function submitExpense(e) {
         expenseModal.classList.remove("show");
       }
 
-      // Refresh data
+      // Refresh data, reloading the expense ledger with it
+      recentExpensesLoadedAt = 0;
       await fetchData();
 
       // If this was a report expense and we're on the reports tab, regenerate the report
@@ -240,9 +241,55 @@ async function submitExpense(e) {
   }
 }
 
+// Recent transaction expenses from the /expenses ledger; logs.expenses only
+// carries the last few entries of the old log array
+let recentExpenses = [];
+let recentExpensesLoadedAt = 0;
+
+async function loadRecentExpenses(startDate) {
+  try {
+    const params = new URLSearchParams({
+      start_date: startDate,
+      expense_type: "transaction",
+      limit: "200",
+    });
+    const response = await fetch(`/expenses?${params}`);
+    if (!response.ok) {
+      throw new Error(`Server responded with status: ${response.status}`);
+    }
+    const data = await response.json();
+    if (data.success) {
+      recentExpenses = data.expenses || [];
+      return true;
+    }
+    console.error("Error loading expenses:", data.message);
+  } catch (error) {
+    console.error("Error loading expenses:", error);
+  }
+  return false;
+}
+
+// Reload the last three days of expenses at most every 30 seconds, then redraw
+function refreshRecentExpenses() {
+  if (Date.now() - recentExpensesLoadedAt < 30000) {
+    return;
+  }
+  recentExpensesLoadedAt = Date.now();
+  const start = new Date();
+  start.setDate(start.getDate() - 2);
+  loadRecentExpenses(start.toISOString().split("T")[0]).then((loaded) => {
+    if (!loaded) {
+      return;
+    }
+    if (typeof window.renderLogs === "function") window.renderLogs();
+    if (typeof window.updateStats === "function") window.updateStats();
+  });
+}
+
 // Integration with existing renderLogs function
 function updateRenderLogs(originalRenderLogs) {
   return function () {
+    refreshRecentExpenses();
     if (!transactionLog) {
       debugLog("Transaction log element not found");
       return;
@@ -276,9 +323,9 @@ function updateRenderLogs(originalRenderLogs) {
     );
 
     // Add expenses to the logs
-    const recentExpenseLogs = (logs.expenses || []).filter(
+    const recentExpenseLogs = recentExpenses.filter(
       (log) =>
-        recentDates.includes(log.date) && log.expense_type === "transaction" // Only include transaction expenses in daily logs
+        recentDates.includes(log.date) && (log.expense_type || "transaction") === "transaction" // Only include transaction expenses in daily logs
     );
 
     // Combine and sort by date and time (most recent first)
@@ -421,8 +468,8 @@ function updateStatsWithExpenses(originalUpdateStats) {
     const today = new Date().toISOString().split("T")[0];
 
     // Get today's expenses (transaction type only)
-    const todayExpenseLogs = (logs.expenses || []).filter(
-      (log) => log.date === today && log.expense_type === "transaction"
+    const todayExpenseLogs = recentExpenses.filter(
+      (log) => log.date === today && (log.expense_type || "transaction") === "transaction"
     );
 
     // Calculate expenses by payment method
@@ -529,7 +576,7 @@ function updateReportGeneration(originalGenerateReport) {
 
           // Check expense types
           const transactionExpenses = data.expense_logs.filter(
-            (log) => log.expense_type === "transaction"
+            (log) => (log.expense_type || "transaction") === "transaction"
           );
           const reportExpenses = data.expense_logs.filter(
             (log) => log.expense_type === "report"
@@ -727,13 +774,13 @@ function renderReportDataWithExpenses(data) {
 
       // Different styling for transaction vs report expenses
       const expenseTypeClass =
-        log.expense_type === "transaction"
+        (log.expense_type || "transaction") === "transaction"
           ? "transaction-expense"
           : "report-expense";
 
       // Add expense type indicator
       const expenseTypeLabel =
-        log.expense_type === "transaction" ? "Daily Expense" : "Report Expense";
+        (log.expense_type || "transaction") === "transaction" ? "Daily Expense" : "Report Expense";
 
       html += `
         <div class="log-item ${expenseTypeClass}">
@@ -90,6 +90,7 @@ async function loadRoomsData() {
     if (data.success) {
       rooms = data.rooms;
       dataLoadedState.rooms = true;
+      noteStaleData(data, "rooms");
 
       // Process rooms to ensure they have renewal data
       Object.entries(rooms).forEach(([roomNumber, roomInfo]) => {
@@ -119,6 +120,16 @@ async function loadRoomsData() {
   }
 }
 
+// Tell the desk when the server answered from its last snapshot
+function noteStaleData(data, label) {
+  if (data.stale && data.as_of) {
+    showNotification(
+      `Server is slow to reach the database - showing ${label} as of ${data.as_of}`,
+      "warning"
+    );
+  }
+}
+
 // Load only totals data
 async function loadTotalsData() {
   if (dataLoadedState.totals) {
@@ -168,6 +179,7 @@ async function loadLogsData() {
     if (data.success) {
       logs = data.logs;
       dataLoadedState.logs = true;
+      noteStaleData(data, "logs");
 
       // Make sure all log types exist
       const requiredLogTypes = [
@@ -202,7 +214,7 @@ async function loadSettlementsData() {
 
   try {
     console.log("Loading settlements data...");
-    const response = await fetch("/get_pending_settlements");
+    const response = await fetch("/get_pending_settlements?status=open");
 
     if (!response.ok) {
       throw new Error(`Server responded with status: ${response.status}`);
@@ -695,7 +707,6 @@ function updateStats() {
   let vacant = 0;
   let occupied = 0;
   let balance = 0;
-  let renewalsDue = 0;
 
   Object.values(rooms).forEach((room) => {
     if (room.status === "vacant") {
@@ -705,11 +716,6 @@ function updateStats() {
       if (room.balance > 0) {
         balance += room.balance;
       }
-
-      const renewalStatus = getRoomRenewalStatus(room);
-      if (renewalStatus.canRenew) {
-        renewalsDue++;
-      }
     }
   });
 
@@ -753,6 +759,27 @@ function updateStats() {
   if (todayOnlineElement) todayOnlineElement.textContent = "₹" + netOnlineTotal;
   if (todayRevenue) todayRevenue.textContent = "₹" + todayTotal;
 
+  refreshRenewalsDue();
+}
+
+// Renewals Due badge, from the server's renewal index instead of every room's deadline
+let renewalsDue = 0;
+
+async function refreshRenewalsDue() {
+  try {
+    // The badge counts overdue rooms only, so ask for just those
+    const response = await fetch("/renewals_due");
+    const data = await response.json();
+    if (data.success) {
+      renewalsDue = data.overdue_count;
+      updateRenewalsBadge();
+    }
+  } catch (error) {
+    console.error("Error loading renewals due:", error);
+  }
+}
+
+function updateRenewalsBadge() {
   const quickRenewBtn = document.getElementById("quick-renew-btn");
   if (quickRenewBtn && renewalsDue > 0) {
     quickRenewBtn.innerHTML = `
@@ -847,8 +874,12 @@ document.addEventListener("DOMContentLoaded", function () {
 
   // Initialize enhanced check-in form
   initEnhancedCheckinForm();
+  initGuestAutocomplete();
   window.showCheckinModal = showEnhancedCheckinModal;
 
+  // Rooms fall due as time passes, not only when data changes
+  setInterval(refreshRenewalsDue, 60000);
+
   // Setup checkout confirmation
   setTimeout(setupCheckoutConfirmation, 500);
 
@@ -1652,7 +1683,7 @@ function updateCheckoutModal(roomNumber) {
     if (roomInfo.guest.photo) {
       const guestPhoto = document.getElementById("checkout-guest-photo");
       if (guestPhoto) {
-        guestPhoto.src = roomInfo.guest.photo;
+        guestPhoto.src = guestPhotoUrl(roomInfo.guest.photo, 640);
       }
       photoContainer.style.display = "block";
     } else {
@@ -1679,6 +1710,108 @@ function showCheckoutModal(roomNumber) {
   checkoutModal.classList.add("show");
 }
 
+// Checkout-modal actions on a room go to /batch together: an action waits
+// briefly for others to join it, and a checkout takes everything still queued,
+// so "discount, payment, checkout" is written all at once or not at all
+const ROOM_BATCH_DELAY_MS = 250;
+const roomBatches = {};
+
+function submitRoomOperation(room, operation) {
+  let pending = roomBatches[room];
+  if (!pending) {
+    pending = roomBatches[room] = { operations: [], waiters: [], timer: null };
+  }
+  const result = new Promise((resolve, reject) =>
+    pending.waiters.push({ resolve, reject })
+  );
+  pending.operations.push(operation);
+  clearTimeout(pending.timer);
+  if (operation.op === "checkout") {
+    flushRoomBatch(room);
+  } else {
+    pending.timer = setTimeout(() => flushRoomBatch(room), ROOM_BATCH_DELAY_MS);
+  }
+  return result;
+}
+
+async function flushRoomBatch(room) {
+  const pending = roomBatches[room];
+  if (!pending) {
+    return;
+  }
+  delete roomBatches[room];
+  clearTimeout(pending.timer);
+  try {
+    const response = await fetch("/batch", {
+      method: "POST",
+      headers: { "Content-Type": "application/json" },
+      body: JSON.stringify({ room: room, operations: pending.operations }),
+    });
+    if (!response.ok) {
+      throw new Error(`Server responded with status: ${response.status}`);
+    }
+    const result = await response.json();
+    pending.waiters.forEach((waiter, index) => {
+      if (result.success) {
+        waiter.resolve({
+          success: true,
+          message: result.messages[index],
+          balance: result.balance,
+        });
+      } else if (
+        result.failed_operation === undefined ||
+        result.failed_operation === index
+      ) {
+        waiter.resolve({ success: false, message: result.message });
+      } else {
+        waiter.resolve({
+          success: false,
+          message: `Not applied: ${result.message}`,
+        });
+      }
+    });
+  } catch (error) {
+    pending.waiters.forEach((waiter) => waiter.reject(error));
+  }
+}
+
+// Serve guest photos through the resizing endpoint instead of full-size blobs
+function guestPhotoUrl(url, width) {
+  const marker = ["/guest_photos/", "/uploads/"].find(
+    (prefix) => url && url.includes(prefix)
+  );
+  if (!marker) {
+    return url;
+  }
+  const photoId = url.split(marker).pop();
+  return `/photo/${encodeURIComponent(photoId)}?w=${width}`;
+}
+
+// Switch to the Storage URL once the background upload lands; until then
+// pending_url serves the server's local copy
+async function watchPhotoUpload(filename, pendingUrl) {
+  for (let attempt = 0; attempt < 60; attempt++) {
+    await new Promise((resolve) => setTimeout(resolve, 2000));
+    if (uploadedPhotoUrl !== pendingUrl) {
+      return;
+    }
+    try {
+      const response = await fetch(
+        `/upload_status/${encodeURIComponent(filename)}`
+      );
+      const status = await response.json();
+      if (status.success && status.status === "done") {
+        if (uploadedPhotoUrl === pendingUrl) {
+          uploadedPhotoUrl = status.path;
+        }
+        return;
+      }
+    } catch (error) {
+      debugLog(`Upload status check failed: ${error.message}`);
+    }
+  }
+}
+
 async function uploadPhoto(file) {
   try {
     const formData = new FormData();
@@ -1695,7 +1828,8 @@ async function uploadPhoto(file) {
 
     const result = await response.json();
     if (result.success) {
-      uploadedPhotoUrl = result.path;
+      uploadedPhotoUrl = result.pending_url;
+      watchPhotoUpload(result.filename, result.pending_url);
     } else {
       showNotification(result.message || "Error uploading photo", "error");
     }
@@ -1956,24 +2090,14 @@ async function addService() {
     const serviceWithQuantity =
       quantity > 1 ? `${service} × ${quantity}` : service;
 
-    const response = await fetch("/add_on", {
-      method: "POST",
-      headers: { "Content-Type": "application/json" },
-      body: JSON.stringify({
-        room: roomNumber,
-        item: serviceWithQuantity,
-        price: totalPrice,
-        unit_price: price,
-        quantity: quantity,
-        payment_method: servicePaymentMethod,
-      }),
+    const result = await submitRoomOperation(roomNumber, {
+      op: "add_on",
+      item: serviceWithQuantity,
+      price: totalPrice,
+      unit_price: price,
+      quantity: quantity,
+      payment_method: servicePaymentMethod,
     });
-
-    if (!response.ok) {
-      throw new Error(`Server responded with status: ${response.status}`);
-    }
-
-    const result = await response.json();
     if (result.success) {
       invalidateAllCache();
       await loadDataForTab("rooms");
@@ -2522,27 +2646,12 @@ async function processRefund() {
       `Processing refund of ₹${refundAmount} via ${refundMethod} for room ${roomNumber}`
     );
 
-    const response = await fetch("/checkout", {
-      method: "POST",
-      headers: { "Content-Type": "application/json" },
-      body: JSON.stringify({
-        room: roomNumber,
-        name: guestName,
-        payment_mode: refundMethod,
-        amount: refundAmount,
-        is_refund: true,
-        process_refund: true,
-        time: new Date().toTimeString().split(" ")[0].slice(0, 5),
-        date: new Date().toISOString().split("T")[0],
-      }),
+    const result = await submitRoomOperation(roomNumber, {
+      op: "refund",
+      amount: refundAmount,
+      payment_mode: refundMethod,
     });
 
-    if (!response.ok) {
-      throw new Error(`Server responded with status: ${response.status}`);
-    }
-
-    const result = await response.json();
-
     if (result.success) {
       debugLog(`Refund processed successfully: ${JSON.stringify(result)}`);
 
@@ -2620,22 +2729,11 @@ async function addPayment(mode) {
       );
     }
 
-    const response = await fetch("/checkout", {
-      method: "POST",
-      headers: { "Content-Type": "application/json" },
-      body: JSON.stringify({
-        room: roomNumber,
-        payment_mode: mode,
-        amount: amount,
-        is_refund: false,
-      }),
+    const result = await submitRoomOperation(roomNumber, {
+      op: "payment",
+      amount: amount,
+      payment_mode: mode,
     });
-
-    if (!response.ok) {
-      throw new Error(`Server responded with status: ${response.status}`);
-    }
-
-    const result = await response.json();
     if (result.success) {
       invalidateAllCache();
       await loadDataForTab("rooms");
@@ -2772,6 +2870,86 @@ const roomPricing = {
 };
 
 // Initialize enhanced check-in form functionality
+// Returning-guest suggestions on the check-in form, from /guests/search
+function initGuestAutocomplete() {
+  const nameInput = document.getElementById("guest-name");
+  const mobileInput = document.getElementById("guest-mobile");
+  if (!nameInput || !mobileInput) return;
+
+  let suggestions = [];
+  let searchTimer = null;
+
+  function attachList(input, id) {
+    const list = document.createElement("datalist");
+    list.id = id;
+    input.setAttribute("list", id);
+    input.setAttribute("autocomplete", "off");
+    input.after(list);
+    return list;
+  }
+  const nameList = attachList(nameInput, "guest-name-suggestions");
+  const mobileList = attachList(mobileInput, "guest-mobile-suggestions");
+
+  function pendingLabel(guest) {
+    return guest.pending_amount > 0 ? ` (₹${guest.pending_amount} pending)` : "";
+  }
+
+  async function searchGuests(query) {
+    try {
+      const response = await fetch(`/guests/search?q=${encodeURIComponent(query)}`);
+      const result = await response.json();
+      if (!result.success) return;
+
+      suggestions = result.guests;
+      nameList.innerHTML = "";
+      mobileList.innerHTML = "";
+      suggestions.forEach((guest) => {
+        const nameOption = document.createElement("option");
+        nameOption.value = guest.name || "";
+        nameOption.label = `${guest.mobile}${pendingLabel(guest)}`;
+        nameList.appendChild(nameOption);
+
+        const mobileOption = document.createElement("option");
+        mobileOption.value = guest.key;
+        mobileOption.label = `${guest.name || ""}${pendingLabel(guest)}`;
+        mobileList.appendChild(mobileOption);
+      });
+    } catch (error) {
+      console.error("Error searching guests:", error);
+    }
+  }
+
+  // Picking a suggestion fills the other field and flags unpaid settlements
+  function applySuggestion(guest) {
+    if (guest.name) nameInput.value = guest.name;
+    mobileInput.value = guest.key;
+    if (guest.pending_amount > 0) {
+      showNotification(
+        `${guest.name || guest.key} has ₹${guest.pending_amount} pending from ${guest.pending_settlements} earlier stay(s)`,
+        "warning",
+        8000
+      );
+    }
+  }
+
+  [nameInput, mobileInput].forEach((input) => {
+    input.addEventListener("input", function () {
+      const value = this.value.trim();
+      const match = suggestions.find((guest) =>
+        input === mobileInput ? guest.key === value : guest.name === value
+      );
+      if (match) {
+        applySuggestion(match);
+        return;
+      }
+
+      clearTimeout(searchTimer);
+      if (value.length < 2) return;
+      searchTimer = setTimeout(() => searchGuests(value), 150);
+    });
+  });
+}
+
 function initEnhancedCheckinForm() {
   const roomDropdown = document.getElementById("checkin-room-dropdown");
   const guestCountInput = document.getElementById("guest-count");
@@ -2998,16 +3176,8 @@ function updateStatsToggleBadge() {
     return;
   }
 
-  let renewalsDue = 0;
-
-  Object.values(rooms).forEach((room) => {
-    if (room.status === "occupied") {
-      const renewalStatus = getRoomRenewalStatus(room);
-      if (renewalStatus.canRenew) {
-        renewalsDue++;
-      }
-    }
-  });
+  // The Renewals Due count comes from /renewals_due, see refreshRenewalsDue
+  updateRenewalsBadge();
 }
 
 function displayDailyStatistics() {
@@ -3318,21 +3488,11 @@ async function applyDiscount() {
     submitBtn.innerHTML =
       '<span class="loader" style="width: 20px; height: 20px;"></span> Processing...';
 
-    const response = await fetch("/apply_discount", {
-      method: "POST",
-      headers: { "Content-Type": "application/json" },
-      body: JSON.stringify({
-        room: roomNumber,
-        amount: discountAmount,
-        reason: reason,
-      }),
+    const result = await submitRoomOperation(roomNumber, {
+      op: "discount",
+      amount: discountAmount,
+      reason: reason,
     });
-
-    if (!response.ok) {
-      throw new Error(`Server responded with status: ${response.status}`);
-    }
-
-    const result = await response.json();
     if (result.success) {
       document.getElementById("discount-modal").classList.remove("show");
 
@@ -3535,20 +3695,9 @@ function setupCheckoutConfirmation() {
       try {
         console.log("Sending checkout request to server");
 
-        const response = await fetch("/checkout", {
-          method: "POST",
-          headers: { "Content-Type": "application/json" },
-          body: JSON.stringify({
-            room: roomNumber,
-            final_checkout: true,
-          }),
+        const result = await submitRoomOperation(roomNumber, {
+          op: "checkout",
         });
-
-        if (!response.ok) {
-          throw new Error(`Server responded with status: ${response.status}`);
-        }
-
-        const result = await response.json();
         if (result.success) {
           console.log("Checkout successful");
 
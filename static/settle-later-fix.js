@@ -97,23 +97,13 @@
 
         try {
           console.log("Sending checkout request to server");
-          const response = await fetch("/checkout", {
-            method: "POST",
-            headers: { "Content-Type": "application/json" },
-            body: JSON.stringify({
-              room: roomNumber,
-              final_checkout: true,
-              refund_method: refundMethod,
-              settle_later: settleLaterEnabled,
-              settlement_notes: settlementNotes,
-            }),
+          // Goes out with any payment or discount still queued for the room
+          const result = await submitRoomOperation(roomNumber, {
+            op: "checkout",
+            refund_method: refundMethod,
+            settle_later: settleLaterEnabled,
+            settlement_notes: settlementNotes,
           });
-
-          if (!response.ok) {
-            throw new Error(`Server responded with status: ${response.status}`);
-          }
-
-          const result = await response.json();
           if (result.success) {
             console.log("Checkout successful");
 
@@ -1,5 +1,7 @@
 // Global variables
 let pendingSettlements = [];
+// Whether pendingSettlements holds every settlement or only the open ones
+let settlementsLoadedAll = false;
 let currentSettlementFilter = "pending";
 let activeSettlementId = null;
 let settlementPaymentMethod = "cash";
@@ -63,23 +65,13 @@ function initSettleLater() {
 
       try {
         console.log("Sending checkout request to server");
-        const response = await fetch("/checkout", {
-          method: "POST",
-          headers: { "Content-Type": "application/json" },
-          body: JSON.stringify({
-            room: roomNumber,
-            final_checkout: true,
-            refund_method: refundMethod,
-            settle_later: settleLaterEnabled,
-            settlement_notes: settlementNotes,
-          }),
+        // Goes out with any payment or discount still queued for the room
+        const result = await submitRoomOperation(roomNumber, {
+          op: "checkout",
+          refund_method: refundMethod,
+          settle_later: settleLaterEnabled,
+          settlement_notes: settlementNotes,
         });
-
-        if (!response.ok) {
-          throw new Error(`Server responded with status: ${response.status}`);
-        }
-
-        const result = await response.json();
         if (result.success) {
           console.log("Checkout successful");
           // Close both modals
@@ -144,7 +136,12 @@ function initSettleLater() {
 
         // Update filter and refresh display
         currentSettlementFilter = this.dataset.filter;
-        renderPendingSettlements();
+        if (currentSettlementFilter === "pending" || settlementsLoadedAll) {
+          renderPendingSettlements();
+        } else {
+          // Paid and cancelled settlements are only loaded when asked for
+          fetchPendingSettlements().then(renderPendingSettlements);
+        }
       });
     });
   }
@@ -356,10 +353,16 @@ function enhanceCheckoutConfirmation() {
   }
 }
 
-// Fetch pending settlements from the server
+// Fetch pending settlements from the server: only the open ones (served from
+// the settlements mirror) unless a filter needs paid or cancelled ones too
 async function fetchPendingSettlements() {
+  const loadAll = currentSettlementFilter !== "pending";
   try {
-    const response = await fetch("/get_pending_settlements");
+    const response = await fetch(
+      loadAll
+        ? "/get_pending_settlements"
+        : "/get_pending_settlements?status=open"
+    );
     if (!response.ok) {
       throw new Error(`Server responded with status: ${response.status}`);
     }
@@ -367,6 +370,7 @@ async function fetchPendingSettlements() {
     const result = await response.json();
     if (result.success) {
       pendingSettlements = result.settlements || [];
+      settlementsLoadedAll = loadAll;
       return true;
     } else {
       console.error("Failed to fetch pending settlements:", result.message);
@@ -486,7 +490,10 @@ function showCollectSettlementModal(settlementId) {
   // Display guest photo if available
   if (photoContainerEl && photoEl) {
     if (settlement.photo) {
-      photoEl.src = settlement.photo;
+      photoEl.src =
+        typeof guestPhotoUrl === "function"
+          ? guestPhotoUrl(settlement.photo, 640)
+          : settlement.photo;
       photoContainerEl.style.display = "block";
     } else {
       photoContainerEl.style.display = "none";
@@ -262,7 +262,7 @@ class TransactionLogManager {
     const expensesLogs = logs.expenses || [];
     const recentExpenseLogs = expensesLogs.filter(
       (log) =>
-        recentDates.includes(log.date) && log.expense_type === "transaction"
+        recentDates.includes(log.date) && (log.expense_type || "transaction") === "transaction"
     );
 
     // Combine and sort by date and time (most recent first)
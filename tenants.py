@@ -0,0 +1,94 @@
+"""Per-property isolation for running several lodges from one deployment.
+
+A tenant is one property. The tenant a request belongs to is held in a
+context variable for the length of the request, and everything that holds
+data - Firestore collections, read caches, mirrors, executors, dataset
+versions - is a PerTenant: one instance per tenant, made on first use, with
+attribute access going to the current tenant's instance. Code written
+against a single global object keeps working, and a busy property can only
+fill its own cache or queue on its own executor.
+
+New threads start with an empty context, so work handed to a thread goes
+through spawn() to keep the tenant it was started for.
+"""
+import contextvars
+import re
+import threading
+
+DEFAULT_TENANT = "default"
+TENANT_ID = re.compile(r"^[a-z0-9][a-z0-9_-]{0,39}$")
+
+_current = contextvars.ContextVar("tenant", default=DEFAULT_TENANT)
+
+
+def current_tenant():
+    return _current.get()
+
+
+def activate(tenant):
+    """Make tenant current; returns the token for deactivate()"""
+    return _current.set(tenant)
+
+
+def deactivate(token):
+    _current.reset(token)
+
+
+def valid_tenant(tenant):
+    return bool(tenant) and TENANT_ID.match(tenant) is not None
+
+
+def spawn(target, *args, name=None):
+    """Start a daemon thread running target(*args) for the current tenant"""
+    tenant = current_tenant()
+
+    def run():
+        activate(tenant)
+        target(*args)
+
+    thread = threading.Thread(target=run, name=name, daemon=True)
+    thread.start()
+    return thread
+
+
+class PerTenant:
+    """factory(tenant) for each tenant on first use; attributes resolve against the current tenant's"""
+    def __init__(self, factory, name):
+        self._factory = factory
+        self._name = name
+        self._instances = {}
+        self._lock = threading.Lock()
+
+    def get(self, tenant=None):
+        tenant = tenant or current_tenant()
+        instance = self._instances.get(tenant)
+        if instance is None:
+            with self._lock:
+                instance = self._instances.get(tenant)
+                if instance is None:
+                    instance = self._instances[tenant] = self._factory(tenant)
+        return instance
+
+    def items(self):
+        """(tenant, instance) for every tenant that has used this so far"""
+        with self._lock:
+            return list(self._instances.items())
+
+    def __getattr__(self, name):
+        return getattr(self.get(), name)
+
+    # Dict-shaped state (dataset versions, init flags) reads and writes the current tenant's
+    def __getitem__(self, key):
+        return self.get()[key]
+
+    def __setitem__(self, key, value):
+        self.get()[key] = value
+
+    def __len__(self):
+        return len(self.get())
+
+    def __bool__(self):
+        return True
+
+    def __repr__(self):
+        return f"PerTenant({self._name})"
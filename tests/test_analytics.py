@@ -0,0 +1,75 @@
+"""chart_series: summary totals, daily points and grouped charts over a date range."""
+from datetime import date
+
+import pytest
+
+pytest.importorskip("numpy")
+
+import analytics  # noqa: E402
+
+
+def logs():
+    return {
+        "cash": [
+            {"date": "2026-10-01", "amount": 500, "room": "101"},
+            {"date": "2026-10-03", "amount": 250.5, "room": "102"},
+            {"date": "2026-09-30", "amount": 999, "room": "101"},
+        ],
+        "online": [
+            {"date": "2026-10-01", "amount": 1000, "room": "102"},
+            {"date": "2026-10-04", "amount": 100},
+        ],
+        "add_ons": [{"date": "2026-10-02", "price": 80, "item": "tea"}, {"date": "2026-10-02", "price": 20}],
+        "expenses": [
+            {"date": "2026-10-02", "amount": 60, "category": "food", "expense_type": "transaction"},
+            {"date": "2026-10-02", "amount": 40, "category": "repairs", "expense_type": "report"},
+            {"date": "2026-10-03", "amount": 15},
+        ],
+        "renewals": [{"date": "2026-10-03", "amount": 700}, {"date": "2026-10-05", "amount": 700}],
+        "refunds": [{"date": "2026-10-04", "amount": 50}],
+    }
+
+
+@pytest.fixture
+def series():
+    return analytics.chart_series(analytics.build_columns(logs()), date(2026, 10, 1), date(2026, 10, 4), checkins=3)
+
+
+def test_summary(series):
+    assert series["summary"] == {
+        "cash_total": 750.5,
+        "online_total": 1100,
+        "total_income": 1850.5,
+        "expense_total": 115,
+        # The untyped expense counts as a transaction, as in /reports and reconciliation
+        "transaction_expense_total": 75,
+        "report_expense_total": 40,
+        "refund_total": 50,
+        "net_revenue": 1725.5,
+        "expense_categories": 3,
+        "checkins": 3,
+        "renewals": 1,
+    }
+
+
+def test_daily_points_only_on_days_with_entries(series):
+    assert series["daily_revenue"] == {"labels": ["01/10", "03/10", "04/10"],
+                                       "cash": [500, 250.5, 0], "online": [1000, 0, 100]}
+    assert series["revenue_expense"] == {"labels": ["01/10", "02/10", "03/10", "04/10"],
+                                         "revenue": [1500, 0, 250.5, 100], "expenses": [0, 100, 15, 0]}
+
+
+def test_grouped_charts(series):
+    assert series["top_rooms"] == {"labels": ["Room 102", "Room 101", "Room Unknown"],
+                                   "values": [1250.5, 500, 100]}
+    assert series["payment_methods"]["values"] == [750.5, 1100]
+    assert series["expense_categories"] == {"labels": ["Food", "Repairs", "Other"], "values": [60, 40, 15]}
+    assert series["top_services"] == {"labels": ["tea", "Other"], "values": [80, 20]}
+
+
+def test_empty_range():
+    series = analytics.chart_series(analytics.build_columns({}), date(2026, 10, 1), date(2026, 10, 31))
+
+    assert series["summary"]["net_revenue"] == 0
+    assert series["daily_revenue"] == {"labels": [], "cash": [], "online": []}
+    assert series["top_rooms"] == {"labels": [], "values": []}
@@ -0,0 +1,227 @@
+"""MemoCache under thread contention: single-flight, invalidation and stale refresh."""
+import threading
+import time
+
+import pytest
+
+from cache import MemoCache
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class Source:
+    """A loader returning the current version, optionally held at a gate"""
+
+    def __init__(self):
+        self.version = 0
+        self.calls = 0
+        self.lock = threading.Lock()
+        self.gate = None
+        self.started = threading.Event()
+
+    def load(self):
+        with self.lock:
+            self.calls += 1
+            version = self.version
+        self.started.set()
+        if self.gate is not None:
+            self.gate.wait(5)
+        return version
+
+
+def run_threads(count, target):
+    results = [None] * count
+    barrier = threading.Barrier(count)
+
+    def worker(i):
+        barrier.wait()
+        results[i] = target()
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(10)
+    return results
+
+
+def test_concurrent_misses_share_one_load():
+    cache = MemoCache()
+    source = Source()
+    source.gate = threading.Event()
+    threading.Timer(0.1, source.gate.set).start()
+
+    results = run_threads(32, lambda: cache.get("key", source.load, ttl=60))
+
+    assert results == [0] * 32
+    assert source.calls == 1
+
+
+def test_read_after_invalidate_does_not_join_older_load():
+    cache = MemoCache()
+    source = Source()
+    source.gate = threading.Event()
+    before = []
+    reader = threading.Thread(target=lambda: before.append(cache.get("key", source.load, ttl=60)))
+    reader.start()
+    assert source.started.wait(5)
+
+    # A write lands while the first load is still reading the old version
+    source.version = 1
+    cache.invalidate("key")
+    source.gate.set()
+
+    assert cache.get("key", source.load, ttl=60) == 1
+    reader.join(5)
+    assert before == [0]
+    assert source.calls == 2
+    # The detached load must not overwrite the newer value
+    assert cache.get("key", source.load, ttl=60) == 1
+
+
+def test_invalidate_function_detaches_flights():
+    cache = MemoCache()
+    source = Source()
+    source.gate = threading.Event()
+    loader = cache.memoize(ttl=60)(lambda: source.load())
+    reader = threading.Thread(target=loader)
+    reader.start()
+    assert source.started.wait(5)
+
+    source.version = 1
+    loader.invalidate_all()
+    source.gate.set()
+
+    assert loader() == 1
+    reader.join(5)
+    assert loader() == 1
+
+
+def test_stale_refresh_is_replaced_after_invalidate():
+    clock = Clock()
+    cache = MemoCache(clock=clock)
+    source = Source()
+    assert cache.get("key", source.load, ttl=10, stale_ttl=60) == 0
+
+    # Past the TTL: the stale value is served and a refresh starts in the background
+    clock.now = 20
+    source.gate = threading.Event()
+    source.started.clear()
+    assert cache.get("key", source.load, ttl=10, stale_ttl=60) == 0
+    assert source.started.wait(5)
+
+    source.version = 1
+    cache.invalidate("key")
+    source.gate.set()
+
+    assert cache.get("key", source.load, ttl=10, stale_ttl=60) == 1
+    time.sleep(0.05)
+    assert cache.get("key", source.load, ttl=10, stale_ttl=60) == 1
+
+
+def test_failed_reload_falls_back_to_last_value():
+    clock = Clock()
+    cache = MemoCache(clock=clock)
+    assert cache.get("key", lambda: "good", ttl=10) == "good"
+    clock.now = 20
+
+    def fail():
+        raise RuntimeError("backend down")
+
+    results = run_threads(8, lambda: cache.get("key", fail, ttl=10))
+    assert results == ["good"] * 8
+
+    cache.invalidate("key")
+    with pytest.raises(RuntimeError):
+        cache.get("key", fail, ttl=10)
+
+
+def test_readers_never_see_a_version_older_than_their_start():
+    cache = MemoCache()
+    source = Source()
+    stop = threading.Event()
+    stale_reads = []
+    # A write counts as done once it is invalidated, as with the routes
+    written = threading.Lock()
+
+    def slow_load():
+        version = source.load()
+        time.sleep(0.001)
+        return version
+
+    def writer():
+        while not stop.is_set():
+            with written:
+                with source.lock:
+                    source.version += 1
+                cache.invalidate("key")
+            time.sleep(0.0005)
+
+    def reader():
+        while not stop.is_set():
+            with written:
+                floor = source.version
+            value = cache.get("key", slow_load, ttl=60)
+            if value < floor:
+                stale_reads.append((floor, value))
+
+    threads = [threading.Thread(target=writer)] + [threading.Thread(target=reader) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.5)
+    stop.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert stale_reads == []
+
+
+def test_prune_keeps_detached_load_from_being_cached():
+    cache = MemoCache()
+    source = Source()
+    source.gate = threading.Event()
+    reader = threading.Thread(target=lambda: cache.get("key", source.load, ttl=60))
+    reader.start()
+    assert source.started.wait(5)
+
+    source.version = 1
+    cache.invalidate("key")
+    cache.prune()
+    source.gate.set()
+    reader.join(5)
+
+    assert cache.freshness("key") is None
+    source.gate = None
+    assert cache.get("key", source.load, ttl=60) == 1
+
+
+def test_freshness_marks_only_fallbacks():
+    clock = Clock()
+    cache = MemoCache(clock=clock)
+    cache.get("key", lambda: "v1", ttl=10, stale_ttl=60)
+    assert cache.freshness("key")[1] is True
+
+    # Past the TTL but inside the stale window: an ordinary background refresh
+    clock.now = 20
+    refreshed = threading.Event()
+
+    def fail():
+        refreshed.set()
+        raise RuntimeError("backend down")
+
+    assert cache.get("key", fail, ttl=10, stale_ttl=60) == "v1"
+    assert refreshed.wait(5)
+    time.sleep(0.05)
+    # The refresh failed, so v1 is now served as a fallback
+    assert cache.freshness("key")[1] is False
+
+    assert cache.get("key", lambda: "v2", ttl=10, stale_ttl=60) == "v1"
+    time.sleep(0.05)
+    assert cache.freshness("key")[1] is True
+    assert cache.get("key", lambda: "v3", ttl=10, stale_ttl=60) == "v2"
@@ -0,0 +1,194 @@
+"""WriteCoalescer error routing: per-member retries, journal settle vs release."""
+from coalescer import WriteCoalescer, _Group
+
+
+class Reference:
+    def __init__(self, path):
+        self.path = path
+
+
+class NotFound(Exception):
+    pass
+
+
+class DeadlineExceeded(Exception):
+    pass
+
+
+class Result:
+    def __init__(self, update_time):
+        self.update_time = update_time
+
+
+class Firestore:
+    """new_batch() for the coalescer; a commit fails if any write hits a path in fail"""
+
+    def __init__(self):
+        self.fail = {}
+        self.commits = []
+
+    def new_batch(self):
+        firestore = self
+        writes = []
+
+        class Batch:
+            def set(self, reference, data, merge=False):
+                writes.append(reference.path)
+
+            def update(self, reference, data):
+                writes.append(reference.path)
+
+            def delete(self, reference):
+                writes.append(reference.path)
+
+            def commit(self):
+                for path in writes:
+                    if path in firestore.fail:
+                        raise firestore.fail[path]
+                firestore.commits.append(list(writes))
+                return [Result(len(firestore.commits))]
+
+        return Batch()
+
+
+class Journal:
+    """The coalescer hooks of journal.Journal, recording what they were called with"""
+
+    def __init__(self, defer=False):
+        self.deferred = defer
+        self.next_id = 0
+        self.settled = []
+        self.released = []
+
+    def record(self, members):
+        for member in members:
+            self.next_id += 1
+            member.entry = self.next_id
+        return True
+
+    def defer(self):
+        return self.deferred
+
+    def markers(self, members):
+        return [(Reference(f"journal_markers/{member.entry}"), {}) for member in members]
+
+    def settle(self, members, error=None):
+        self.settled.append(([member.entry for member in members], error))
+
+    def release(self, members, error=None):
+        self.released.append(([member.entry for member in members], error))
+
+
+def group_of(coalescer, *paths):
+    members = []
+    for path in paths:
+        member = coalescer.batch()
+        member.update(Reference(path), {"status": "occupied"})
+        members.append(member)
+    group = _Group(members[0])
+    group.members.extend(members[1:])
+    return group, members
+
+
+def test_isolatable_error_retries_each_member():
+    firestore = Firestore()
+    firestore.fail["rooms/2"] = NotFound("rooms/2")
+    coalescer = WriteCoalescer(firestore.new_batch, lambda amount: amount)
+    group, (first, second, third) = group_of(coalescer, "rooms/1", "rooms/2", "rooms/3")
+
+    coalescer._flush(group)
+
+    assert firestore.commits == [["rooms/1"], ["rooms/3"]]
+    assert first.error is None and third.error is None
+    assert isinstance(second.error, NotFound)
+    assert coalescer.stats["isolated_retries"] == 1
+
+
+def test_other_errors_fail_the_whole_group():
+    firestore = Firestore()
+    firestore.fail["rooms/2"] = DeadlineExceeded("timeout")
+    coalescer = WriteCoalescer(firestore.new_batch, lambda amount: amount)
+    group, members = group_of(coalescer, "rooms/1", "rooms/2")
+
+    coalescer._flush(group)
+
+    # Possibly applied, so no member is retried on its own
+    assert firestore.commits == []
+    assert all(isinstance(member.error, DeadlineExceeded) for member in members)
+    assert coalescer.stats["isolated_retries"] == 0
+
+
+def test_journaled_success_settles():
+    firestore = Firestore()
+    journal = Journal()
+    coalescer = WriteCoalescer(firestore.new_batch, lambda amount: amount, journal=journal)
+    group, members = group_of(coalescer, "rooms/1", "rooms/2")
+
+    coalescer._flush(group)
+
+    assert firestore.commits == [["rooms/1", "journal_markers/1", "rooms/2", "journal_markers/2"]]
+    assert journal.settled == [([1, 2], None)]
+    assert journal.released == []
+    assert [member.commit_time for member in members] == [1, 1]
+
+
+def test_journaled_timeout_is_released_to_the_replayer():
+    firestore = Firestore()
+    firestore.fail["rooms/1"] = DeadlineExceeded("timeout")
+    journal = Journal()
+    coalescer = WriteCoalescer(firestore.new_batch, lambda amount: amount, journal=journal)
+    group, members = group_of(coalescer, "rooms/1", "rooms/2")
+
+    coalescer._flush(group)
+
+    assert journal.settled == []
+    assert [(ids, type(error)) for ids, error in journal.released] == [([1, 2], DeadlineExceeded)]
+    # On disk, so the callers are acknowledged
+    assert all(member.error is None for member in members)
+
+
+def test_journaled_rejection_settles_only_the_bad_member():
+    firestore = Firestore()
+    firestore.fail["rooms/2"] = NotFound("rooms/2")
+    journal = Journal()
+    coalescer = WriteCoalescer(firestore.new_batch, lambda amount: amount, journal=journal)
+    group, (first, second) = group_of(coalescer, "rooms/1", "rooms/2")
+
+    coalescer._flush(group)
+
+    assert journal.released == []
+    applied, (rejected, error) = journal.settled
+    assert applied == ([1], None)
+    assert rejected == [2] and isinstance(error, NotFound)
+    assert first.error is None
+    assert isinstance(second.error, NotFound)
+
+
+def test_deferred_group_is_not_written():
+    firestore = Firestore()
+    journal = Journal(defer=True)
+    coalescer = WriteCoalescer(firestore.new_batch, lambda amount: amount, journal=journal)
+    group, members = group_of(coalescer, "rooms/1")
+
+    coalescer._flush(group)
+
+    assert firestore.commits == []
+    assert journal.released == [([1], None)]
+    assert members[0].error is None
+    assert coalescer.stats["groups"] == 1
+
+
+def test_increments_merge_across_members():
+    firestore = Firestore()
+    increments = []
+    coalescer = WriteCoalescer(firestore.new_batch, lambda amount: increments.append(amount) or amount)
+    totals = Reference("totals/current_totals")
+    group, (first, second) = group_of(coalescer, "rooms/1", "rooms/2")
+    first.increment(totals, "cash", 100)
+    second.increment(totals, "cash", 50)
+    second.increment(totals, "balance", 0)
+
+    coalescer._flush(group)
+
+    assert firestore.commits == [["rooms/1", "rooms/2", "totals/current_totals"]]
+    assert increments == [150]
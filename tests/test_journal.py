@@ -0,0 +1,156 @@
+"""Journal replay: guards, conflicts, markers and the order entries are applied in."""
+import os
+
+import pytest
+
+from journal import MARKER_COLLECTION, Codec, Journal, JournalFile, _lock_file
+
+
+class Snapshot:
+    def __init__(self, data):
+        self.exists = data is not None
+        self._data = data
+
+    def to_dict(self):
+        return dict(self._data) if self._data is not None else None
+
+
+class Store:
+    """Documents by path, with transactions that apply their writes only if the function returns"""
+
+    def __init__(self, documents=None):
+        self.documents = dict(documents or {})
+        self.transactions = 0
+
+    def document(self, path):
+        store = self
+
+        class Reference:
+            def __init__(self):
+                self.path = path
+
+            def get(self, transaction=None):
+                return Snapshot(store.documents.get(path))
+
+        return Reference()
+
+    def transaction(self):
+        return []
+
+    def transactional(self, func):
+        def run(writes):
+            self.transactions += 1
+            result = func(Transaction(writes))
+            for kind, path, data in writes:
+                if kind == "delete":
+                    self.documents.pop(path, None)
+                elif kind == "update":
+                    self.documents[path] = {**self.documents[path], **data}
+                else:
+                    self.documents[path] = data
+            return result
+        return run
+
+
+class Transaction:
+    def __init__(self, writes):
+        self.writes = writes
+
+    def set(self, reference, data, merge=False):
+        self.writes.append(("set", reference.path, data))
+
+    def update(self, reference, data):
+        self.writes.append(("update", reference.path, data))
+
+    def delete(self, reference):
+        self.writes.append(("delete", reference.path, None))
+
+
+@pytest.fixture
+def store():
+    return Store({"rooms/1": {"status": "vacant", "guest": {"name": ""}},
+                  "rooms/2": {"status": "occupied", "guest": {"name": "Asha"}}})
+
+
+@pytest.fixture
+def journal(tmp_path, store):
+    journal = Journal(str(tmp_path), Codec(None), store.document, store.transaction, store.transactional)
+    # This process's file, without start()'s background replayer, so replay() runs here
+    path = os.path.join(str(tmp_path), f"journal-{os.getpid()}.db")
+    journal._own = JournalFile(path, _lock_file(path))
+    journal._pid = os.getpid()
+    yield journal
+    journal._own.close()
+
+
+def checkin(room, name):
+    return [["update", f"rooms/{room}", {"status": "occupied", "guest": {"name": name}}, False]]
+
+
+def test_guarded_entry_applies_with_its_marker(journal, store):
+    [entry] = journal._own.append([(checkin(1, "Ravi"), [["rooms/1", {"status": "vacant"}]])])
+
+    journal.replay()
+
+    assert store.documents["rooms/1"]["guest"] == {"name": "Ravi"}
+    assert f"{MARKER_COLLECTION}/{journal._own.id}-{entry}" in store.documents
+    assert journal.stats["replayed"] == 1
+    assert journal._own.pending == {}
+
+
+def test_failed_guard_sets_the_entry_aside(journal, store):
+    [entry] = journal._own.append([(checkin(2, "Ravi"), [["rooms/2", {"status": "vacant"}]])])
+
+    journal.replay()
+
+    # Nothing written, not even the marker, and the newer guest is kept
+    assert store.documents["rooms/2"]["guest"] == {"name": "Asha"}
+    assert not any(path.startswith(MARKER_COLLECTION) for path in store.documents)
+    assert journal.stats["conflicts"] == 1
+    [conflict] = journal.conflicts()
+    assert conflict["entry"] == f"{journal._own.id}-{entry}"
+    assert conflict["state"] == "conflict"
+    assert conflict["error"] == "rooms/2 status is 'occupied', expected 'vacant'"
+    assert conflict["documents"] == ["rooms/2"]
+
+
+def test_dotted_guard_fields(journal, store):
+    journal._own.append([(checkin(2, "Ravi"), [["rooms/2", {"guest.name": "Meena"}]])])
+
+    journal.replay()
+
+    assert journal.conflicts()[0]["error"] == "rooms/2 guest.name is 'Asha', expected 'Meena'"
+
+
+def test_conflict_does_not_hold_up_later_entries(journal, store):
+    journal._own.append([(checkin(2, "Ravi"), [["rooms/2", {"status": "vacant"}]]),
+                         (checkin(1, "Meena"), [["rooms/1", {"status": "vacant"}]])])
+
+    journal.replay()
+
+    assert store.documents["rooms/1"]["guest"] == {"name": "Meena"}
+    assert journal.stats["conflicts"] == 1 and journal.stats["replayed"] == 1
+
+
+def test_landed_entry_is_not_applied_twice(journal, store):
+    [entry] = journal._own.append([(checkin(1, "Ravi"), [["rooms/1", {"status": "vacant"}]])])
+    store.documents[f"{MARKER_COLLECTION}/{journal._own.id}-{entry}"] = {"entry": entry}
+    store.documents["rooms/1"] = {"status": "vacant", "guest": {"name": ""}, "note": "after"}
+
+    journal.replay()
+
+    assert store.documents["rooms/1"]["note"] == "after"
+    assert store.documents["rooms/1"]["guest"] == {"name": ""}
+    assert journal.stats["duplicates"] == 1 and journal.stats["conflicts"] == 0
+
+
+def test_retried_conflict_checks_its_guards_again(journal, store):
+    journal._own.append([(checkin(2, "Ravi"), [["rooms/2", {"status": "vacant"}]])])
+    journal.replay()
+    store.documents["rooms/2"] = {"status": "vacant", "guest": {"name": ""}}
+
+    assert journal.resolve(journal.conflicts()[0]["entry"], "retry")
+    journal.replay()
+
+    assert store.documents["rooms/2"]["guest"] == {"name": "Ravi"}
+    assert journal.conflicts() == []
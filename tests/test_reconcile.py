@@ -0,0 +1,91 @@
+"""Ledger sums from a checkpoint, and when a checkpoint stops holding."""
+import reconcile
+
+
+def entry(amount, day="2026-10-01", **fields):
+    return {"date": day, "time": "10:00", "amount": amount, **fields}
+
+
+def ledger():
+    return {
+        "cash": [entry(500, room="1"), entry(300, room="2")],
+        "online": [entry(1200, room="3")],
+        "refunds": [entry(100)],
+        "booking_payments": [],
+        "expenses": [entry(40, expense_type="transaction"), entry(25, expense_type="report"), entry(10)],
+    }
+
+
+def test_full_pass():
+    sums, positions, scanned = reconcile.ledger_sums(ledger())
+
+    assert sums == {"cash": 800, "online": 1200, "refunds": 100, "advance_bookings": 0,
+                    "expenses": 50}
+    assert scanned == 7
+    assert positions["cash"][0] == 2
+    assert positions["booking_payments"] == [0, None]
+
+
+def test_untyped_expenses_count_as_the_default_type():
+    logs = {"expenses": [entry(10), entry(5, expense_type="")]}
+
+    assert reconcile.DEFAULT_EXPENSE_TYPE == "transaction"
+    assert reconcile.ledger_sums(logs)[0]["expenses"] == 15
+
+
+def test_checkpoint_sums_only_new_entries():
+    logs = ledger()
+    sums, positions, _ = reconcile.ledger_sums(logs)
+    checkpoint = {"sums": sums, "positions": positions}
+    logs["cash"].append(entry(200, day="2026-09-30"))
+    logs["expenses"].append(entry(15, expense_type="report"))
+
+    assert reconcile.checkpoint_holds(checkpoint, logs)
+    later, _, scanned = reconcile.ledger_sums(logs, checkpoint)
+
+    # Backdated entries still count: position, not date, decides what is new
+    assert later["cash"] == 1000
+    assert later["expenses"] == 50
+    assert scanned == 2
+    assert later == reconcile.ledger_sums(logs)[0]
+
+
+def test_checkpoint_breaks_when_a_log_shrinks():
+    logs = ledger()
+    checkpoint = dict(zip(("sums", "positions"), reconcile.ledger_sums(logs)[:2]))
+    logs["cash"].pop()
+
+    assert not reconcile.checkpoint_holds(checkpoint, logs)
+
+
+def test_checkpoint_breaks_when_a_covered_entry_changes():
+    logs = ledger()
+    checkpoint = dict(zip(("sums", "positions"), reconcile.ledger_sums(logs)[:2]))
+    logs["online"][-1] = entry(1300, room="3")
+
+    assert not reconcile.checkpoint_holds(checkpoint, logs)
+
+
+def test_checkpoint_without_a_log_holds_once_it_appears():
+    logs = ledger()
+    del logs["refunds"]
+    checkpoint = dict(zip(("sums", "positions"), reconcile.ledger_sums(logs)[:2]))
+    logs["refunds"] = [entry(60)]
+
+    assert reconcile.checkpoint_holds(checkpoint, logs)
+    assert reconcile.ledger_sums(logs, checkpoint)[0]["refunds"] == 60
+
+
+def test_drift_report_and_outstanding_balance():
+    rooms = {"1": {"status": "occupied", "balance": 300}, "2": {"status": "occupied", "balance": -50},
+             "3": {"status": "vacant", "balance": 90}}
+    expected = dict(reconcile.ledger_sums(ledger())[0], balance=reconcile.outstanding_balance(rooms))
+    totals = {"cash": 800, "online": 1150, "refunds": 100, "advance_bookings": 0, "expenses": 50,
+              "balance": 300.004}
+
+    report = reconcile.drift_report(totals, expected, previous_drift={"online": -20})
+
+    assert expected["balance"] == 300
+    assert report["online"] == {"recorded": 1150, "expected": 1200, "drift": -50, "since_checkpoint": -30}
+    assert report["balance"]["note"] == reconcile.BALANCE_DRIFT_NOTE
+    assert set(reconcile.drifted(report)) == {"online"}